@@ -0,0 +1,51 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.programs import generate_program
+from esc.cache import ModuleCache
+from esc.parser import Parser
+
+STDLIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stdlib')
+
+
+def parse_time(lib_dir: str, input_str: str, cache) -> float:
+    start = time.perf_counter()
+    Parser(stdlib_dir=lib_dir, cache=cache).parse(input_str)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Module cache benchmark (cold and warm runs)')
+    parser.add_argument('-b', '--blocks', type=int, default=500, help='Size of the generated imported module')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        # Standard library plus a large generated library module, imported by a small script
+        lib_dir = os.path.join(work_dir, 'lib')
+        shutil.copytree(STDLIB_DIR, lib_dir)
+        with open(os.path.join(lib_dir, 'biglib.es'), 'w') as f:
+            f.write(generate_program(args.blocks))
+        input_str = 'import "stdlib"\nimport "biglib"\nprint("" + PI)\n'
+        cache = ModuleCache(os.path.join(work_dir, 'cache'))
+
+        results = {'no cache': [], 'cold': [], 'warm': []}
+        for _ in range(args.repeat):
+            results['no cache'].append(parse_time(lib_dir, input_str, None))
+            cache.clear()
+            results['cold'].append(parse_time(lib_dir, input_str, cache))
+            results['warm'].append(parse_time(lib_dir, input_str, cache))
+        for name, timings in results.items():
+            print('{n:>8}: {t:.3f} s'.format(n=name, t=min(timings)))
+        print('** warm speedup: {s:.1f}x'.format(s=min(results['no cache']) / min(results['warm'])))
+        print('** cache: {s}'.format(s=cache.stats()))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import struct
+import time
+import tracemalloc
+
+from benchmarks.programs import generate_program
+from esc.codegen import CodeGenerator, OP, SINGLE_BYTE_OPS
+from esc.parser import Parser
+
+
+def legacy_emit(out: list, op: OP, arg1=None, arg2=None) -> None:
+    # Emitter before the code buffer: hex string round trip per operand into a list of ints
+    bytes_out = [op.value]
+    for arg in (arg1, arg2):
+        if arg is None:
+            continue
+        if isinstance(arg, str):
+            bytes_out.extend(arg.encode())
+        else:
+            b = list(bytearray.fromhex(hex(struct.unpack('<Q', struct.pack('<d', arg))[0]).lstrip('0x')))
+            while len(b) < 8:
+                b.append(0x00)
+            bytes_out.extend(b)
+    if op not in SINGLE_BYTE_OPS and op is not OP.PUSHS:
+        while len(bytes_out) < 9:
+            bytes_out.append(0x00)
+    out.extend(bytes_out)
+
+
+def operations(n: int) -> list:
+    # Mix of operations of a typical program: values, variable access, arithmetic, strings and jumps
+    ops = []
+    for i in range(n // 6):
+        ops.append((OP.PUSH, i * 0.5, None))
+        ops.append((OP.POPG, i % 100, None))
+        ops.append((OP.ADD, None, None))
+        ops.append((OP.PUSHL, 100 + i % 99, None))
+        ops.append((OP.PUSHS, 5, 'value'))
+        ops.append((OP.JZ, i * 9, None))
+    return ops
+
+
+def time_emit(ops: list, repeat: int) -> (float, float, bytes):
+    best_new = best_legacy = None
+    code = legacy = None
+    for _ in range(repeat):
+        c = CodeGenerator()
+        emit = c._emit_operation
+        start = time.perf_counter()
+        for op, arg1, arg2 in ops:
+            emit(op, arg1, arg2)
+        elapsed = time.perf_counter() - start
+        best_new = elapsed if best_new is None else min(best_new, elapsed)
+        code = c.bytes_out
+
+        legacy = []
+        start = time.perf_counter()
+        for op, arg1, arg2 in ops:
+            legacy_emit(legacy, op, arg1, arg2)
+        elapsed = time.perf_counter() - start
+        best_legacy = elapsed if best_legacy is None else min(best_legacy, elapsed)
+
+    if bytes(code) != bytes(legacy):
+        raise AssertionError('Byte code of the emitter differs from the legacy emitter')
+    return best_new, best_legacy, code
+
+
+def code_memory(code: bytes) -> (int, int):
+    # Memory of the emitted code as bytearray and as list of ints
+    result = []
+    for factory in (bytearray, list):
+        tracemalloc.start()
+        copy = factory(code)
+        result.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        del copy
+    return result[0], result[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Byte code emitter benchmark')
+    parser.add_argument('-b', '--blocks', type=int, default=1000)
+    parser.add_argument('-n', '--operations', type=int, default=600000)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    ops = operations(args.operations)
+    new, legacy, code = time_emit(ops, args.repeat)
+    print('** {n} operations, {b} bytes'.format(n=len(ops), b=len(code)))
+    print('   emitter: {t:.3f} s ({r:.0f} ops/s, {m:.1f} MiB/s)'.format(
+        t=new, r=len(ops) / new, m=len(code) / new / 2 ** 20))
+    print('   legacy emitter: {t:.3f} s ({r:.0f} ops/s, {m:.1f} MiB/s)'.format(
+        t=legacy, r=len(ops) / legacy, m=len(code) / legacy / 2 ** 20))
+    print('** emit speedup: {s:.1f}x'.format(s=legacy / new))
+
+    as_bytes, as_list = code_memory(code)
+    print('   code memory: bytearray {a:.1f} KiB, list {l:.1f} KiB'.format(a=as_bytes / 1024, l=as_list / 1024))
+
+    statements = Parser().parse(generate_program(args.blocks))
+    best = None
+    for _ in range(args.repeat):
+        c = CodeGenerator()
+        start = time.perf_counter()
+        for statement in statements:
+            c.generate(statement)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('** code generation of {s} statements: {t:.3f} s ({b} bytes, {r:.0f} bytes/s)'.format(
+        s=len(statements), t=best, b=len(c.bytes_out), r=len(c.bytes_out) / best))
+
+
+if __name__ == '__main__':
+    main()
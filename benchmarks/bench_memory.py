@@ -0,0 +1,79 @@
+import argparse
+import tracemalloc
+
+from benchmarks.programs import generate_program
+from esc.parser import Node, Parser
+from esc.scanner import Token
+
+
+class _Plain(object):
+    # Object with a per instance __dict__, like the AST nodes before they were slotted
+    pass
+
+
+def slot_names(cls) -> [str]:
+    return [name for c in cls.__mro__ for name in c.__dict__.get('__slots__', ())]
+
+
+def tree_objects(statements: list) -> list:
+    # All nodes and tokens of the AST (iterative, expressions can be deeply nested)
+    objects = []
+    stack = list(statements)
+    seen = set()
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, (Node, Token)) and id(obj) not in seen:
+            seen.add(id(obj))
+            objects.append(obj)
+            stack.extend(getattr(obj, name) for name in slot_names(type(obj)))
+    return objects
+
+
+def measure_parse(input_str: str) -> (list, int, int):
+    # Peak memory while parsing and memory retained by the AST
+    tracemalloc.start()
+    statements = Parser().parse(input_str)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statements, retained, peak
+
+
+def measure_objects(objects: list, slotted: bool) -> int:
+    # Memory of the node and token objects alone (attribute values are shared, not copied)
+    tracemalloc.start()
+    copies = []
+    for obj in objects:
+        copy = type(obj).__new__(type(obj)) if slotted else _Plain()
+        for name in slot_names(type(obj)):
+            setattr(copy, name, getattr(obj, name))
+        copies.append(copy)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del copies
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AST memory benchmark')
+    parser.add_argument('-b', '--blocks', type=int, default=1000)
+    args = parser.parse_args()
+
+    input_str = generate_program(args.blocks)
+    statements, retained, peak = measure_parse(input_str)
+    objects = tree_objects(statements)
+    print('** {c} chars, {n} nodes and tokens'.format(c=len(input_str), n=len(objects)))
+    print('   parse: peak {p:.1f} KiB, AST retained {r:.1f} KiB'.format(p=peak / 1024, r=retained / 1024))
+
+    slotted = measure_objects(objects, slotted=True)
+    plain = measure_objects(objects, slotted=False)
+    print('   objects slotted: {s:.1f} KiB ({b:.0f} bytes per object)'.format(
+        s=slotted / 1024, b=slotted / len(objects)))
+    print('   objects with __dict__: {s:.1f} KiB ({b:.0f} bytes per object)'.format(
+        s=plain / 1024, b=plain / len(objects)))
+    print('** reduction: {r:.1f} KiB ({p:.0f}%)'.format(r=(plain - slotted) / 1024, p=100 * (plain - slotted) / plain))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import mmap
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.programs import generate_program
+from esc.scanner import SCANNERS, IncrementalScanner
+
+
+def scan_all(scanner_name: str, input_str: str) -> list:
+    scanner = SCANNERS[scanner_name]()
+    scanner.scan_str(input_str)
+    return list(scanner.tokens())
+
+
+def count_tokens(scanner) -> int:
+    n = 0
+    for _ in scanner.tokens():
+        n += 1
+    return n
+
+
+def stream_peak_memory(input_str: str) -> None:
+    # Peak traced memory while tokenizing a file (tokens are counted, not kept)
+    fd, path = tempfile.mkstemp(suffix='.es')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(input_str)
+
+        def from_str():
+            with open(path) as file:
+                scanner = SCANNERS['table']()
+                scanner.scan_str(file.read())
+                return count_tokens(scanner)
+
+        def from_file():
+            with open(path) as file:
+                scanner = SCANNERS['table']()
+                scanner.scan_stream(file)
+                return count_tokens(scanner)
+
+        def from_mmap():
+            with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                scanner = SCANNERS['table']()
+                scanner.scan_stream(mm)
+                return count_tokens(scanner)
+
+        for name, fn in [('str', from_str), ('file', from_file), ('mmap', from_mmap)]:
+            tracemalloc.start()
+            n = fn()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('{n:>8}: peak {p:.1f} KiB ({k} tokens)'.format(n=name, p=peak / 1024, k=n))
+    finally:
+        os.remove(path)
+
+
+def edit_latency(input_str: str, edits: int) -> None:
+    # Single character edits in the middle of the source, compared to a full rescan
+    inc = IncrementalScanner()
+    start = time.perf_counter()
+    inc.scan_str(input_str)
+    print('** incremental initial scan: {t:.3f} s'.format(t=time.perf_counter() - start))
+
+    offset = len(input_str) // 2
+    start = time.perf_counter()
+    for i in range(edits):
+        inc.edit(offset + i, 0, 'x')
+    edit_time = (time.perf_counter() - start) / edits
+
+    start = time.perf_counter()
+    count_tokens_of(inc.text)
+    full_time = time.perf_counter() - start
+    print('** edit: {e:.3f} ms, full rescan: {f:.3f} ms'.format(e=edit_time * 1000, f=full_time * 1000))
+
+
+def count_tokens_of(input_str: str) -> int:
+    scanner = SCANNERS['table']()
+    scanner.scan_str(input_str)
+    return count_tokens(scanner)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scanner engine benchmark')
+    parser.add_argument('-b', '--blocks', type=int, default=2000)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-s', '--stream', action='store_true', help='Compare peak memory of str and streaming input')
+    parser.add_argument('-e', '--edits', type=int, default=0, help='Measure latency of n incremental edits')
+    args = parser.parse_args()
+
+    input_str = generate_program(args.blocks)
+    print('** {c} chars, {l} lines'.format(c=len(input_str), l=input_str.count('\n')))
+
+    streams = {}
+    timings = {}
+    for name in SCANNERS:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            streams[name] = scan_all(name, input_str)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+        print('{n:>8}: {t:.3f} s ({k} tokens, {r:.0f} tokens/s)'.format(
+            n=name, t=best, k=len(streams[name]), r=len(streams[name]) / best))
+
+    reference = [(t.ttype, t.value, t.meta_cn) for t in streams['classic']]
+    for name, stream in streams.items():
+        if [(t.ttype, t.value, t.meta_cn) for t in stream] != reference:
+            raise AssertionError('Token stream of {n} differs from classic scanner'.format(n=name))
+    print('** table speedup: {s:.1f}x'.format(s=timings['classic'] / timings['table']))
+
+    if args.stream:
+        stream_peak_memory(input_str)
+
+    if args.edits:
+        edit_latency(input_str, args.edits)
+
+
+if __name__ == '__main__':
+    main()
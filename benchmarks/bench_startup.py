@@ -0,0 +1,71 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Installed CLIs run from byte code, allow writing it in the warm up run
+ENV = {k: v for k, v in os.environ.items() if k != 'PYTHONDONTWRITEBYTECODE'}
+
+
+def run_time(cmd: [str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=ROOT_DIR, env=ENV, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_times(cmd: [str]) -> [(int, str)]:
+    # Cumulative import time (us) of the top level imports reported by -X importtime
+    result = subprocess.run(cmd[:1] + ['-X', 'importtime'] + cmd[1:], cwd=ROOT_DIR, env=ENV, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            times.append((int(cumulative), name.strip()))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLI startup benchmark of parse only (-p) runs')
+    parser.add_argument('-r', '--repeat', type=int, default=10)
+    parser.add_argument('-b', '--budget', type=float, default=50.0,
+                        help='Budget in ms for a parse only run on top of the bare interpreter startup')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.es')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write('import "stdlib"\nlet a = abs(-3) + PI\nprint("" + a)\n')
+        cli = [sys.executable, os.path.join(ROOT_DIR, 'main.py'), '-p',
+               '-i', path, '-l', os.path.join(ROOT_DIR, 'stdlib')]
+        bare = [sys.executable, '-c', 'pass']
+
+        # First run writes the config cache and the byte code
+        run_time(cli)
+        bare_time = min(run_time(bare) for _ in range(args.repeat))
+        cli_time = min(run_time(cli) for _ in range(args.repeat))
+
+        times = sorted(import_times(cli), reverse=True)
+        print('** bare interpreter: {b:.1f} ms, parse only run: {c:.1f} ms'.format(b=bare_time * 1000,
+                                                                                 c=cli_time * 1000))
+        print('** imports of a parse only run: {t:.1f} ms'.format(t=sum(t for t, _ in times) / 1000))
+        for t, name in times[:8]:
+            print('{t:>10.1f} ms  {n}'.format(t=t / 1000, n=name))
+
+        overhead = (cli_time - bare_time) * 1000
+        print('** startup overhead {o:.1f} ms, budget {b:.1f} ms'.format(o=overhead, b=args.budget))
+        if overhead > args.budget:
+            print('** OVER BUDGET')
+            sys.exit(1)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
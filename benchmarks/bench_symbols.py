@@ -0,0 +1,61 @@
+import argparse
+import contextlib
+import io
+import time
+
+from esc.codegen import CodeGenerator
+from esc.parser import Parser
+
+
+def generate_nested(symbols: int, depth: int, lookups: int) -> str:
+    """
+    Program with many globals and deeply nested blocks, each block declares locals and reads globals and locals
+    :param symbols: Number of globals
+    :param depth: Nesting depth of if blocks
+    :param lookups: Number of reads per block
+    :return: Program source
+    """
+    lines = ['let g{i} = {i}'.format(i=i) for i in range(symbols)]
+    for d in range(depth):
+        lines.append('if(g{i} >= 0) then'.format(i=(d * 7) % symbols))
+        lines.append('let l{d} = g{i}'.format(d=d, i=symbols - 1 - d % symbols))
+        for k in range(lookups):
+            lines.append('l{d} = l{d} + g{i} + l{j}'.format(d=d, i=(d * 31 + k * 17) % symbols, j=k % (d + 1)))
+    lines.extend('endif' for _ in range(depth))
+    return '\n'.join(lines) + '\n'
+
+
+def compile_time(statements: list, repeat: int) -> (float, int):
+    best = None
+    for _ in range(repeat):
+        c = CodeGenerator()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for statement in statements:
+                c.generate(statement)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(c.bytes_out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Symbol table benchmark on deeply nested, symbol heavy programs')
+    parser.add_argument('-s', '--symbols', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('-d', '--depth', type=int, nargs='+', default=[10, 100, 400])
+    parser.add_argument('-l', '--lookups', type=int, default=20)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{s:>8} {d:>6} {n:>10} {t:>10} {r:>14}'.format(s='globals', d='depth', n='lookups', t='time', r='lookups/s'))
+    for symbols in args.symbols:
+        for depth in args.depth:
+            statements = Parser().parse(generate_nested(symbols, depth, args.lookups))
+            # Declarations, the condition and three reads per lookup line
+            lookups = symbols + depth * (2 + 4 * args.lookups)
+            elapsed, _ = compile_time(statements, args.repeat)
+            print('{s:>8} {d:>6} {n:>10} {t:>8.3f} s {r:>14.0f}'.format(
+                s=symbols, d=depth, n=lookups, t=elapsed, r=lookups / elapsed))
+
+
+if __name__ == '__main__':
+    main()
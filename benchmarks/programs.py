@@ -0,0 +1,33 @@
+# Synthetic evoscript sources for the benchmarks
+
+BLOCK = '''
+# Block {n}
+let a{n} = [1, 2, 3, {n}]
+let s{n} = "block {n}"
+let i{n} = 0
+func f{n}(x, y)
+    if(x < y and y <> {n}) then
+        return x * 2 + y mod 3
+    elseif(x >= 0x1F) then
+        return -x
+    else
+        return x - y / 4.5
+    endif
+endfunc
+repeat
+    a{n}[i{n}] = f{n}(i{n}, {n}) + a{n}[i{n}]
+    i{n} = i{n} + 1
+until i{n} = len(a{n})
+for i{n} = 0 to 3 step 1
+    print(s{n} + ": " + a{n}[i{n}])
+next
+'''
+
+
+def generate_program(blocks: int) -> str:
+    """
+    Generate a valid evoscript program made of the given number of independent blocks
+    :param blocks: Number of blocks
+    :return: Program source
+    """
+    return ''.join(BLOCK.format(n=n) for n in range(blocks))
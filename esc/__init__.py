@@ -0,0 +1,2 @@
+# Compiler version, part of the module cache key
+C_VERSION = '0.1a'
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import pickle
+import sys
+
+from esc import C_VERSION
+from esc.sourcemap import SourceMap
+
+# Bump when the layout of the cached data or the AST node classes change
+CACHE_FORMAT = 3
+
+
+def dump_module(module) -> bytes:
+    """
+    Serialize the parse result of a module (import names, statements and source map offsets)
+    :param module: esc.parser.Module
+    :return: Pickled data
+    """
+    limit = sys.getrecursionlimit()
+    try:
+        # Deeply nested expressions need a deeper recursion for pickling
+        sys.setrecursionlimit(max(limit, 10000))
+        return pickle.dumps((module.import_names, module.statements, module.source_map.offsets()),
+                            protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def load_module(module, data: bytes) -> None:
+    """
+    Fill a module with a parse result of dump_module
+    :param module: esc.parser.Module with its source file
+    :param data: Pickled data
+    """
+    import_names, statements, offsets = pickle.loads(data)
+    module.import_names = import_names
+    module.statements = statements
+    module.source_map = SourceMap.of_offsets(module.source, offsets)
+
+
+class ModuleCache:
+    """
+    On-disk cache of parsed modules (statements, import names and source map of the cleaned file)
+    Entries are keyed by the hash of the file content, the compiler version and the cache format
+    """
+
+    SUFFIX = '.ast'
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir: str = cache_dir
+        self.hits: int = 0
+        self.misses: int = 0
+        self.stores: int = 0
+
+    def key(self, text: str) -> str:
+        h = hashlib.sha256('{v}\0{f}\0'.format(v=C_VERSION, f=CACHE_FORMAT).encode('utf-8'))
+        h.update(text.encode('utf-8', 'surrogatepass'))
+        return h.hexdigest()
+
+    def _path(self, text: str) -> str:
+        return os.path.join(self.cache_dir, self.key(text) + self.SUFFIX)
+
+    def load(self, module) -> bool:
+        """
+        Fill a module from the cache
+        :param module: esc.parser.Module with its source file
+        :return: True on cache hit
+        """
+        try:
+            with open(self._path(module.source.text), 'rb') as f:
+                load_module(module, f.read())
+        except Exception:
+            # Missing, unreadable or truncated entries, the latter are overwritten by store()
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, module) -> None:
+        """
+        Write a parsed module to the cache
+        :param module: esc.parser.Module
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(module.source.text)
+        tmp_path = '{p}.{pid}.tmp'.format(p=path, pid=os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(dump_module(module))
+        os.replace(tmp_path, path)
+        self.stores += 1
+
+    def _entries(self) -> [str]:
+        try:
+            return [os.path.join(self.cache_dir, e) for e in os.listdir(self.cache_dir) if e.endswith(self.SUFFIX)]
+        except FileNotFoundError:
+            return []
+
+    def stats(self) -> dict:
+        """
+        Cache statistics of this process (hits, misses, stores) and of the cache directory (entries, bytes)
+        :return: Statistics dict
+        """
+        entries = self._entries()
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'entries': len(entries),
+                'bytes': sum(os.path.getsize(e) for e in entries)}
+
+    def clear(self) -> int:
+        """
+        Remove all cache entries
+        :return: Number of removed entries
+        """
+        entries = self._entries()
+        for e in entries:
+            os.remove(e)
+        return len(entries)
+
@@ -1,87 +1,33 @@
-import enum
+import contextlib
+import io
 import struct
 from typing import Union
-from esc.parser import Node, Parser, AssignmentNode, TermNode, OpType, ValueNode, ValueType, IfNode, ExpressionNode, \
+from esc.parser import Node, AssignmentNode, TermNode, OpType, ValueNode, ValueType, IfNode, ExpressionNode, \
     CallNode, LoopNode, ExitNode, ConditionPos, ArrayNode, ProcSubNode, ProcSubReturnNode, ProcFuncNode, ExternApiNode, \
     ImportNode, UnaryNode
-from abc import ABC
-
-E_MAX_LOCALS = 99
-
-
-class OP(enum.Enum):
-    NOP = 0
-    PUSHG = 0x10
-    POPG = 0x11
-    PUSHL = 0x12
-    POPL = 0x13
-    PUSH = 0x14
-    PUSHS = 0x15
-    DATA = 0x16
-    PUSHA = 0x17
-    PUSHAS = 0x18
-
-    EQ = 0x20
-    LT = 0x21
-    GT = 0x22
-    LTEQ = 0x23
-    GTEQ = 0x24
-    NOTEQ = 0x25
-
-    ADD = 0x30
-    NEG = 0x31
-    SUB = 0x32
-    MUL = 0x33
-    DIV = 0x34
-    AND = 0x35
-    OR = 0x36
-    NOT = 0x37
-    CONCAT = 0x38
-    MOD = 0x39
-
-    JZ = 0x40
-    JMP = 0x41
-    JFS = 0x42
-    JMPFUN = 0x43
-    CALL = 0x44
-
-    PRINT = 0x50
-    ARGTYPE = 0x51
-    LEN = 0x52
-    ARRAY = 0x53
-
-    @classmethod
-    def get_OP(cls, b_id):
-        for a in OP:
-            if a.value == b_id:
-                return a
-
-    @classmethod
-    def has(cls, value):
-        return OP.get_OP(value) is not None
-
-
-class Symbol(ABC):
-    def __init__(self, name: str):
-        self.name = name
-
-    def __repr__(self):
-        return '[SYMBOL {name}]'.format(name=self.name)
-
-
-class VariableSymbol(Symbol):
-    def __init__(self, name: str, value, const: bool = False):
-        super().__init__(name)
-        self.value = value
-        self.is_const = const
-
-
-class ProcedureSymbol(Symbol):
-    def __init__(self, name: str, args: int, addr: int):
-        super().__init__(name)
-        self.args = args
-        self.addr = addr
-        self.is_const = True
+from esc.inliner import Inliner
+from esc.ir import Code, ControlFlowGraph, Instruction, Label, PassManager
+from esc.opcodes import OP, SINGLE_BYTE_OPS, EXTENSION_OPS
+from esc.optimizer import DEFAULT_OPT_LEVEL, Optimizer, constant
+from esc.peephole import Peephole
+from esc.slots import SlotAllocator, frame_sizes
+from esc.symbols import Symbol, VariableSymbol, ProcedureSymbol, SymbolTable
+
+# Byte code encoding
+#   [1 Byte OP]                                 operations in SINGLE_BYTE_OPS without arguments
+#   [1 Byte OP][8 Byte arg1]                    all other operations, a missing arg1 is encoded as 0.0
+#   [1 Byte OP][8 Byte length][length Bytes]    PUSHS (arg1 = length, arg2 = UTF-8 string)
+# Numeric arguments (values, addresses, symbol indices, counts) are IEEE 754 doubles in big endian byte order
+OPERAND = struct.Struct('>d')
+OPERATION = struct.Struct('>Bd')
+
+
+# Compare with a global, by comparison
+COMPARE_GLOBAL_OPS = {OpType.EQUALS: OP.EQG, OpType.NOTEQUALS: OP.NOTEQG, OpType.LT: OP.LTG, OpType.GT: OP.GTG,
+                      OpType.LTEQ: OP.LTEQG, OpType.GTEQ: OP.GTEQG}
+# Jump if the comparison is false, by comparison
+BRANCH_IF_NOT_OPS = {OpType.EQUALS: OP.JNOTEQ, OpType.NOTEQUALS: OP.JEQ, OpType.LT: OP.JGTEQ, OpType.GT: OP.JLTEQ,
+                     OpType.LTEQ: OP.JGT, OpType.GTEQ: OP.JLT}
 
 
 class NodeVisitor:
@@ -95,16 +41,42 @@ class NodeVisitor:
 
 
 class CodeGenerator(NodeVisitor):
-    def __init__(self):
-        self.symbols = {0: []}
-        # Prefill global symbols with builtin variables
-        self.parser = Parser()
-        self.bytes_out = []
-        self.scope = 0
+    # Initial size of the code buffer, it doubles whenever an operation does not fit
+    CODE_BUFFER_SIZE = 4096
+
+    def __init__(self, opt_level: int = DEFAULT_OPT_LEVEL, tree_shaking: bool = True, peephole: bool = True,
+                 superinstructions: bool = False, slot_reuse: bool = True, tail_calls: bool = True,
+                 inline: bool = True):
+        # Constructor options, removed_procedures generates the program again with them
+        self.options = {'opt_level': opt_level, 'tree_shaking': tree_shaking, 'peephole': peephole,
+                        'superinstructions': superinstructions, 'slot_reuse': slot_reuse, 'tail_calls': tail_calls,
+                        'inline': inline}
+        # Optimization level of the AST passes run on each statement (see esc.optimizer.PASSES), 0 disables them
+        self.opt_level = opt_level
+        self.optimizer = Optimizer(opt_level, tree_shaking=tree_shaking) if opt_level > 0 else None
+        # Statements given to generate_program, and the first and last label of each generated procedure by name
+        self.program = []
+        self._procedure_labels = {}
+        # Passes run over the intermediate code of a whole program (see generate_program)
+        self.passes = PassManager()
+        self.inliner = self.passes.add(Inliner(self._procedure_labels)) if inline and opt_level > 1 else None
+        self.slots = self.passes.add(SlotAllocator(self._procedure_labels)) if slot_reuse and opt_level > 0 else None
+        self.peephole = self.passes.add(Peephole(level=opt_level)) if peephole and opt_level > 0 else None
+        # Target capability, the target VM implements EXTENSION_OPS
+        self.superinstructions = superinstructions
+        # Calls of a procedure to itself in tail position jump back to its entry (see _find_tail_calls)
+        self.tail_calls = tail_calls and opt_level > 0
+        self._tail_calls = set()
+        self.symbols = SymbolTable()
+        # Intermediate code, encoded into the code buffer when the byte code is needed (see encode)
+        self.code: Code = []
+        self._encoded = True
+        self._addresses = {}
+        # Code buffer, only the first _pc bytes are emitted code
+        self._code = bytearray(self.CODE_BUFFER_SIZE)
+        self._pc = 0
         self.concat_mode = 0
         self.loop_patches = []
-        self.proc_scope = 100
-        self.external_symbols = []
         self.stats = {
             'max_scope': 0,
             'max_arrays': 0,
@@ -112,14 +84,110 @@ class CodeGenerator(NodeVisitor):
             'max_strlen': 0
         }
 
+    def generate_program(self, statements: [Node]):
+        """
+        Generate the code of a whole program, unused procedures are removed first (see esc.optimizer.TreeShaker)
+        and the passes run over the intermediate code of the program
+        :param statements: Top level statements
+        """
+        self.program = statements
+        if self.optimizer is not None:
+            statements = self.optimizer.optimize_program(statements)
+        for statement in statements:
+            self.generate(statement)
+        self.optimize_code()
+
+    def optimize_code(self):
+        """
+        Run the passes (inlining, local slot allocation and the peephole optimizer) over the intermediate code
+        """
+        self.code = self.passes.run(self.code)
+        self._encoded = False
+
     def generate(self, root: Node):
+        if self.optimizer is not None:
+            root = self.optimizer.optimize(root)
         return self.visit(root)
 
+    def removed_procedures(self) -> ({str: int}, int):
+        """
+        Procedures removed from the program by tree shaking
+        The program is generated again without tree shaking to measure them. Sizes of nested procedures are part of
+        the size of their enclosing procedure as well. Inlining would copy removed procedures into the removed
+        procedures calling them and decide differently on the larger program, so it is measured without inlining
+        :return: Size in bytes by procedure name, and the number of bytes saved in total
+        """
+        shaker = self.optimizer.tree_shaker if self.optimizer is not None else None
+        if shaker is None or not shaker.removed:
+            return {}, 0
+        full = CodeGenerator(**dict(self.options, tree_shaking=False, inline=False))
+        # Program with tree shaking to compare with, generated again if it was inlined
+        shaken = CodeGenerator(**dict(self.options, inline=False)) if self.inliner is not None else self
+        with contextlib.redirect_stdout(io.StringIO()):
+            full.generate_program(self.program)
+            if shaken is not self:
+                shaken.generate_program(self.program)
+        removed = {name: full.procedures[name] for name in shaker.removed}
+        return removed, len(full.bytes_out) - len(shaken.bytes_out)
+
+    @property
+    def procedures(self) -> {str: int}:
+        """
+        Size in bytes of each generated procedure by name
+        """
+        self._sync()
+        return {name: self._addresses[end] - self._addresses[start]
+                for name, (start, end) in self._procedure_labels.items()}
+
+    @property
+    def frames(self) -> {str: int}:
+        """
+        Number of local slots of each generated procedure by name, the code outside of procedures (top level blocks)
+        under None
+        """
+        return frame_sizes(self.code, self._procedure_labels)
+
+    @property
+    def bytes_out(self) -> bytearray:
+        """
+        Copy of the emitted byte code
+        """
+        self._sync()
+        return self._code[:self._pc]
+
+    def _sync(self):
+        # Encode the intermediate code if it changed since it was encoded last
+        if not self._encoded:
+            self.encode()
+
+    def encode(self):
+        """
+        Final stage, lay out the basic blocks of the intermediate code and encode them into the code buffer
+        Labels are resolved to addresses, forward jumps are backpatched once their label is placed. Jumps to labels
+        that are never placed keep the placeholder address 0xFFFFFFFF
+        """
+        self._pc = 0
+        addresses = {}
+        patches = {}
+        for block in ControlFlowGraph(self.code).blocks:
+            for label in block.labels:
+                addresses[label] = self._pc
+                for head in patches.pop(label, ()):
+                    self._backpatch(head, self._pc)
+            for ins in block.instructions:
+                if ins.target is None:
+                    self._emit_operation(ins.op, arg1=ins.arg1, arg2=ins.arg2)
+                elif ins.target in addresses:
+                    self._emit_operation(ins.op, arg1=addresses[ins.target])
+                else:
+                    patches.setdefault(ins.target, []).append(self._pc)
+                    self._emit_operation(ins.op, arg1=0xFFFFFFFF)
+        self._addresses = addresses
+        self._encoded = True
+
     def finalize(self, rle: bool = False, poutsize=None):
         # merge multiple CONCAT ops
-        out_stream = []
-        for b in self.bytes_out:
-            out_stream.append(str(b))
+        out_stream = [str(b) for b in self.bytes_out]
 
         tmp_len = len(out_stream)
         if rle:
@@ -158,142 +226,66 @@ class CodeGenerator(NodeVisitor):
             out_stream += "{c},{b},".format(c=b_cnt, b=last_b)
         return out_stream.rstrip(',')
 
-    def _format_arg(self, bc, op: OP = None):
-        if op is not None and op.value in [OP.JMP.value, OP.JZ.value]:
-            a1 = self.bytes_out[bc + 1]
-            a2 = self.bytes_out[bc + 2]
-            a3 = self.bytes_out[bc + 3]
-            a4 = self.bytes_out[bc + 4]
-            a5 = self.bytes_out[bc + 5]
-            a6 = self.bytes_out[bc + 6]
-            a7 = self.bytes_out[bc + 7]
-            a8 = self.bytes_out[bc + 8]
-            bts = hex((
-                    ((a1 & 0xFF) << 56) |
-                    ((a2 & 0xFF) << 48) |
-                    ((a3 & 0xFF) << 40) |
-                    ((a4 & 0xFF) << 32) |
-                    ((a5 & 0xFF) << 24) |
-                    ((a6 & 0xFF) << 16) |
-                    ((a7 & 0xFF) << 8) |
-                    (a8 & 0xFF)))[2:]
-
-            if bts == '0' or len(bts) < 2:
-                return 0.0
-            b = bytearray.fromhex(bts)
-            r = struct.unpack('>d', b)[0]
-            return r
-        else:
-            a1 = self.bytes_out[bc + 1]
-            a2 = self.bytes_out[bc + 2]
-            a3 = self.bytes_out[bc + 3]
-            a4 = self.bytes_out[bc + 4]
-            bts = hex((
-                    ((a1 & 0xFF) << 24) |
-                    ((a2 & 0xFF) << 16) |
-                    ((a3 & 0xFF) << 8) |
-                    (a4 & 0xFF)))[2:]
-
-            if bts == '0' or len(bts) < 2:
-                return 0.0
-            b = bytearray.fromhex(bts)
-            while len(b) < 8:
-                b.append(0)
-            r = struct.unpack('>d', b)[0]
-            return r
+    def _format_arg(self, bc):
+        return OPERAND.unpack_from(self._code, bc + 1)[0]
+
+    def instructions(self) -> [(int, OP, Union[float, str, None])]:
+        """
+        Decode the emitted byte code
+        :return: (address, operation, argument) of each operation, the argument of PUSHS is the string and
+            single byte operations have none
+        """
+        self._sync()
+        out = []
+        bc = 0
+        while bc < self._pc:
+            op = OP(self._code[bc])
+            if op is OP.PUSHS:
+                strlen = int(self._format_arg(bc))
+                out.append((bc, op, self._code[bc + 9:bc + 9 + strlen].decode()))
+                bc += strlen + 9
+            elif op in SINGLE_BYTE_OPS:
+                out.append((bc, op, None))
+                bc += 1
+            else:
+                out.append((bc, op, self._format_arg(bc)))
+                bc += 9
+        return out
 
     def format(self):
-        lc: int = 0
-        bc: int = 0
-
-        while bc < len(self.bytes_out):
-            b = self.bytes_out[bc]
-            if OP.has(b):
-                if b in [OP.PUSHS.value]:
-                    # String len
-                    strlen = int(self._format_arg(bc))
-                    ostr: str = ''
-                    brem: int = 0
-                    while brem < strlen:
-                        ostr += chr(self.bytes_out[bc + 9 + brem])
-                        brem += 1
-
-                    print("{lc} @ {adr}\t\t{op}\t\"{str}\"".format(lc=lc, adr=bc, op=OP.get_OP(b), str=ostr))
-                    bc += strlen + 9
-                else:
-                    if b in [OP.NOP.value, OP.PUSHAS.value, OP.EQ.value, OP.LT.value, OP.GT.value,
-                             OP.LTEQ.value, OP.GTEQ.value, OP.NOTEQ.value, OP.ADD.value, OP.NEG.value,
-                             OP.SUB.value, OP.MUL.value, OP.DIV.value, OP.AND.value, OP.OR.value,
-                             OP.NOT.value, OP.MOD.value, OP.PRINT.value, OP.ARGTYPE.value, OP.LEN.value, OP.ARRAY.value]:
-                        brem = 1
-                        arg1 = 0
-                    else:
-                        arg1 = self._format_arg(bc, op=OP.get_OP(b))
-                        brem = 9
-                    # arg2 = self._format_arg(bc + 9)
-                    print("{lc} @ {adr}\t\t{op}\t\t{a1}".format(lc=lc, adr=bc, op=OP.get_OP(b), a1=arg1))
-
-                    while brem > 0:
-                        brem -= 1
-                        bc += 1
-
-                lc += 1
-
-    def _symbol_exists(self, symbol: str, stype, scope: int = 0):
-        try:
-            sym = next(filter(lambda s: s.name == symbol, self.symbols.get(scope)),
-                       None)  # ... == symbol and type(s) is stype ...
-            sym_index = self.symbols.get(scope).index(sym)
-            return sym_index is not None
-        except:
-            if symbol in self.external_symbols:
-                return True
-            if scope != 0:
-                return self._symbol_exists(symbol, stype, scope=0)
+        for lc, (adr, op, arg) in enumerate(self.instructions()):
+            if op is OP.PUSHS:
+                print("{lc} @ {adr}\t\t{op}\t\"{str}\"".format(lc=lc, adr=adr, op=op, str=arg))
             else:
-                return False
-
-    def _find_symbol(self, symbol: str, stype, scope: int = 0):
-        # if symbol not found in current scope: change scope to 0 and try again
-        try:
-            sym = next(filter(lambda s: s.name == symbol, self.symbols.get(scope)),
-                       None)  # ... == symbol and type(s) is stype ...
-            sym_index = self.symbols.get(scope).index(sym)
-            return sym, sym_index, scope
-        except:
-            if symbol in self.external_symbols:
+                print("{lc} @ {adr}\t\t{op}\t\t{a1}".format(lc=lc, adr=adr, op=op, a1=0 if arg is None else arg))
+
+    def _symbol_exists(self, symbol: str, global_only: bool = False) -> bool:
+        return self.symbols.exists(symbol, global_only=global_only)
+
+    def _find_symbol(self, symbol: str, global_only: bool = False):
+        """
+        Look up a symbol in the current scope chain, then in the global scope
+        :param symbol: Symbol name
+        :param global_only: Search the global scope only
+        :return: (symbol, slot, is_global) or None for external symbols
+        """
+        entry = self.symbols.resolve(symbol, global_only=global_only)
+        if entry is None:
+            if symbol in self.symbols.external:
                 return None
-            if scope != 0:
-                return self._find_symbol(symbol, stype, scope=0)
-            else:
-                self._fail('Symbol {s} not found'.format(s=symbol))
+            self._fail('Symbol {s} not found'.format(s=symbol))
+        return entry[0], entry[1], entry[2] is self.symbols.globals
 
-    def _insert_symbol(self, symbol: Symbol, scope: int = 0):
-        try:
-            self.symbols.get(scope).append(symbol)
-            self.stats['max_symbols'] += 1
-        except AttributeError:
-            self.symbols[scope] = []
-            self.symbols.get(scope).append(symbol)
-            self.stats['max_symbols'] += 1
+    def _insert_symbol(self, symbol: Symbol, global_scope: bool = False, store: bool = True):
+        self.symbols.declare(symbol, scope=self.symbols.globals if global_scope else None, store=store)
+        self.stats['max_symbols'] += 1
 
     def _open_scope(self):
-        if self.scope > 0:
-            try:
-                for symbol in self.symbols.get(self.scope):
-                    self._insert_symbol(symbol, scope=self.scope + 1)
-            except TypeError:
-                pass
-        self.scope += 1
+        self.symbols.open_scope()
         self.stats['max_scope'] += 1
 
     def _close_scope(self):
-        self.scope = max(0, self.scope - 1)
-
-    def _open_proc_scope(self):
-        r = self.proc_scope
-        self.proc_scope += (E_MAX_LOCALS + 1)
-        return r
+        self.symbols.close_scope()
 
     def visit_NoneType(self, node: None, parent: Node = None):
         self._fail(msg="Unexpected compile error")
@@ -302,6 +294,15 @@ class CodeGenerator(NodeVisitor):
         # LET IDENTIFIER = <expr>
         # PUSH <expr> (number|string)
         # PUSHG|PUSHL [index]
+        if self.opt_level > 0 and node.is_const and not node.modify and self.symbols.current is self.symbols.globals \
+                and constant(node.right) is not None:
+            # Const global with a literal value, reads push the value itself and the global needs no slot
+            self._insert_symbol(symbol=VariableSymbol(name=node.left.value, value=node.right.value, const=True),
+                                store=False)
+            return
+        if self.superinstructions and node.modify and self._emit_increment(node):
+            return
+
         value = self.visit(node.right, node)
 
         try:
@@ -318,22 +319,43 @@ class CodeGenerator(NodeVisitor):
 
         # Insert into symbol table
         if node.modify:
-            if not self._symbol_exists(node.left.value, stype=VariableSymbol, scope=self.scope):
+            if not self._symbol_exists(node.left.value):
                 self._fail("Symbol {s} not found".format(s=node.left.value))
         else:
-            self._insert_symbol(symbol=VariableSymbol(name=node.left.value, value=value, const=node.is_const),
-                                scope=self.scope)
+            self._insert_symbol(symbol=VariableSymbol(name=node.left.value, value=value, const=node.is_const))
 
-        var, varid, varscope = self._find_symbol(node.left.value, stype=VariableSymbol, scope=self.scope)
+        var, varid, is_global = self._find_symbol(node.left.value)
 
         if node.modify and var.is_const:
             self._fail("Cannot modify constant {s}".format(s=node.left.value))
 
         # PUSHL / PUSHG
-        if varscope == 0:
-            self._emit_operation(OP.PUSHG, arg1=varid)
+        if is_global:
+            self._emit(OP.PUSHG, arg1=varid)
         else:
-            self._emit_operation(OP.PUSHL, arg1=varid)
+            self._emit(OP.PUSHL, arg1=varid)
+
+    def _emit_increment(self, node: AssignmentNode) -> bool:
+        # x = x + 1 (or x = 1 + x) of a number variable as INCG / INCL
+        if node.left.value_type != ValueType.IDENTIFIER or type(node.right) is not TermNode \
+                or node.right.op != OpType.ADD:
+            return False
+        name = node.left.value
+        var, step = node.right.left, node.right.right
+        if type(var) is not ValueNode or var.value_type != ValueType.IDENTIFIER or var.value != name:
+            var, step = step, var
+        if type(var) is not ValueNode or var.value_type != ValueType.IDENTIFIER or var.value != name \
+                or constant(step) is None or step.value_type != ValueType.NUMBER or step.value != 1:
+            return False
+        entry = self._find_symbol(name)
+        if entry is None or not isinstance(getattr(entry[0], 'value', None), (int, float)):
+            # External or not a number (strings are concatenated)
+            return False
+        var, varid, is_global = entry
+        if var.is_const:
+            self._fail("Cannot modify constant {s}".format(s=name))
+        self._emit(OP.INCG if is_global else OP.INCL, arg1=varid)
+        return True
 
     def visit_TermNode(self, node: TermNode, parent: Node = None):
         if node.op == OpType.ADD:
@@ -342,38 +364,38 @@ class CodeGenerator(NodeVisitor):
             if (isinstance(res1, float) or isinstance(res1, int)) and (
                     isinstance(res2, float) or isinstance(res2, int)):
                 # Number addition
-                self._emit_operation(OP.ADD)
+                self._emit(OP.ADD)
                 return res1 + res2
             else:
                 # Mixed string addition (concatenate)
-                self._emit_operation(OP.CONCAT, arg1=self.concat_mode)
+                self._emit(OP.CONCAT, arg1=self.concat_mode)
         elif node.op == OpType.SUB:
             res1 = self.visit(node.left, node)
             res2 = self.visit(node.right, node)
             if (isinstance(res1, float) or isinstance(res1, int)) and (
                     isinstance(res2, float) or isinstance(res2, int)):
-                self._emit_operation(OP.SUB)
+                self._emit(OP.SUB)
                 return res1 - res2
         elif node.op == OpType.MUL:
             res1 = self.visit(node.left, node)
             res2 = self.visit(node.right, node)
             if (isinstance(res1, float) or isinstance(res1, int)) and (
                     isinstance(res2, float) or isinstance(res2, int)):
-                self._emit_operation(OP.MUL)
+                self._emit(OP.MUL)
                 return res1 * res2
         elif node.op == OpType.DIV:
             res1 = self.visit(node.left, node)
             res2 = self.visit(node.right, node)
             if (isinstance(res1, float) or isinstance(res1, int)) and (
                     isinstance(res2, float) or isinstance(res2, int)):
-                self._emit_operation(OP.DIV)
+                self._emit(OP.DIV)
                 return res1 / res2
         elif node.op == OpType.MOD:
             res1 = self.visit(node.left, node)
             res2 = self.visit(node.right, node)
             if (isinstance(res1, float) or isinstance(res1, int)) and (
                     isinstance(res2, float) or isinstance(res2, int)):
-                self._emit_operation(OP.MOD)
+                self._emit(OP.MOD)
                 return res1 % res2
 
     def visit_ValueNode(self, node: ValueNode, parent: Node = None):
@@ -385,15 +407,17 @@ class CodeGenerator(NodeVisitor):
         # if a + 2 = 3
         if node.value_type == ValueType.IDENTIFIER:
             try:
-                tmp_symbol, tmp_index, tmp_scope = self._find_symbol(node.value, stype=VariableSymbol, scope=self.scope)
+                tmp_symbol, tmp_index, is_global = self._find_symbol(node.value)
 
-                if tmp_scope == 0:
-                    self._emit_operation(OP.POPG, arg1=tmp_index)
+                if tmp_index is None:
+                    self._emit_literal(tmp_symbol.value)
+                elif is_global:
+                    self._emit(OP.POPG, arg1=tmp_index)
                 else:
-                    self._emit_operation(OP.POPL, arg1=tmp_index)
+                    self._emit(OP.POPL, arg1=tmp_index)
                 try:
                     if isinstance(parent, ValueNode) and parent.value_type == ValueType.ARRAYELEMENT:
-                        self._emit_operation(OP.PUSHAS)
+                        self._emit(OP.PUSHAS)
                 except AttributeError:
                     pass
 
@@ -409,18 +433,30 @@ class CodeGenerator(NodeVisitor):
             # Initialize with constant
             try:
                 if isinstance(parent, ValueNode) and parent.value_type == ValueType.ARRAYELEMENT:
-                    self._emit_operation(OP.PUSHA, arg1=node.value)
+                    self._emit(OP.PUSHA, arg1=node.value)
                 else:
-                    self._emit_operation(OP.PUSH, arg1=node.value)
+                    self._emit(OP.PUSH, arg1=node.value)
             except AttributeError:
-                self._emit_operation(OP.PUSH, arg1=node.value)
+                self._emit(OP.PUSH, arg1=node.value)
 
         elif node.value_type == ValueType.STRING:
             # PUSHS string
-            self._emit_operation(OP.PUSHS, arg1=len(node.value), arg2=node.value)
-            if self.stats['max_strlen'] < len(node.value):
-                self.stats['max_strlen'] = len(node.value)
+            self._emit_literal(node.value)
         elif node.value_type == ValueType.ARRAYELEMENT:
+            entry = self.symbols.resolve(node.identifier) if parent else None
+            if entry is not None and entry[1] is None and not (
+                    isinstance(parent, AssignmentNode) and parent.modify and node == parent.left):
+                # Element of a const without slot (see visit_AssignmentNode), the value is stored into a global of
+                # its own in front of each element read, the index has to be followed by the load
+                name = '.' + node.identifier
+                if not self._symbol_exists(name, global_only=True):
+                    self._insert_symbol(VariableSymbol(name=name, value=entry[0].value, const=True), global_scope=True)
+                slot = self._find_symbol(name, global_only=True)[1]
+                self._emit_literal(entry[0].value)
+                self._emit(OP.PUSHG, arg1=slot)
+                self.visit(node.index, parent=node)
+                self._emit(OP.POPG, arg1=slot)
+                return node.index.value
             self.visit(node.index, parent=node)
             if parent:
                 op = 'pop'
@@ -429,190 +465,212 @@ class CodeGenerator(NodeVisitor):
                         op = 'push'
 
                 try:
-                    tmp_symbol, tmp_index, tmp_scope = self._find_symbol(node.identifier, stype=VariableSymbol,
-                                                                         scope=self.scope)
-                    if tmp_scope == 0:
+                    tmp_symbol, tmp_index, is_global = self._find_symbol(node.identifier)
+                    if tmp_index is None:
+                        if op == 'push':
+                            self._fail("Cannot modify constant {s}".format(s=node.identifier))
+                        self._emit_literal(tmp_symbol.value)
+                    elif is_global:
                         if op == 'pop':
-                            self._emit_operation(OP.POPG, arg1=tmp_index)
+                            self._emit(OP.POPG, arg1=tmp_index)
                         else:
-                            self._emit_operation(OP.PUSHG, arg1=tmp_index)
+                            self._emit(OP.PUSHG, arg1=tmp_index)
                     else:
                         if op == 'pop':
-                            self._emit_operation(OP.POPL, arg1=tmp_index)
+                            self._emit(OP.POPL, arg1=tmp_index)
                         else:
-                            self._emit_operation(OP.PUSHL, arg1=tmp_index)
+                            self._emit(OP.PUSHL, arg1=tmp_index)
                 except AttributeError:
                     self._fail('Unknown symbol {id}'.format(id=node.value))
             return node.index.value
         return node.value
 
+    def _emit_literal(self, value):
+        # PUSH number / PUSHS string
+        if isinstance(value, str):
+            self._emit(OP.PUSHS, arg1=len(value), arg2=value)
+            if self.stats['max_strlen'] < len(value):
+                self.stats['max_strlen'] = len(value)
+        else:
+            self._emit(OP.PUSH, arg1=value)
+
     def visit_UnaryNode(self, node: UnaryNode, parent: Node = None):
         print("visit unary")
         self.visit_ValueNode(node)
         if node.sign == '-':
-            self._emit_operation(OP.NEG)
+            self._emit(OP.NEG)
         elif node.sign == '!':
-            self._emit_operation(OP.NOT)
+            self._emit(OP.NOT)
         return 0
 
+    def _emit(self, op: OP, arg1=None, arg2=None, target: Label = None) -> Instruction:
+        """
+        Append an operation to the intermediate code
+        :param op: Operation
+        :param arg1: Numeric argument, replaced by the address of target if a target is given
+        :param arg2: String (PUSHS) or numeric argument of a single byte operation
+        :param target: Label of a jump target (or return address)
+        :return: Instruction
+        """
+        self._check_operation(op, arg1, arg2)
+        instruction = Instruction(op, arg1, arg2, target)
+        self.code.append(instruction)
+        self._encoded = False
+        return instruction
+
+    def _place(self, label: Label) -> Label:
+        # Place a label in front of the next operation
+        self.code.append(label)
+        self._encoded = False
+        return label
+
     def _backpatch(self, head_addr, patch_addr):
-        f = float(patch_addr)
-        s = bytearray(struct.pack('>d', f))
-        if len(s) > 8:
-            self._fail("Illegal number")
-        try:
-            self.bytes_out[head_addr + 1] = s[0]
-            self.bytes_out[head_addr + 2] = s[1]
-            self.bytes_out[head_addr + 3] = s[2]
-            self.bytes_out[head_addr + 4] = s[3]
-            self.bytes_out[head_addr + 5] = s[4]
-            self.bytes_out[head_addr + 6] = s[5]
-            self.bytes_out[head_addr + 7] = s[6]
-            self.bytes_out[head_addr + 8] = s[7]
-        except IndexError:
-            pass
+        # Overwrite arg1 of the (JMP / JZ) operation at head_addr
+        if head_addr + 9 <= self._pc:
+            OPERAND.pack_into(self._code, head_addr + 1, patch_addr)
+
+    def _emit_jz(self, condition: Node, target: Label = None) -> Instruction:
+        """
+        Evaluate a condition and jump if it is false, comparisons are fused with the jump if the target supports it
+        :param condition: Condition
+        :param target: Jump target, if not given it has to be set on the returned jump
+        :return: Jump
+        """
+        if self.superinstructions and type(condition) is ExpressionNode and condition.op in BRANCH_IF_NOT_OPS:
+            self.visit(condition.left, parent=condition)
+            self.visit(condition.right, parent=condition)
+            return self._emit(BRANCH_IF_NOT_OPS[condition.op], arg1=0xFFFFFFFF, target=target)
+        self.visit(condition)
+        return self._emit(OP.JZ, arg1=0xFFFFFFFF, target=target)
 
     def visit_IfNode(self, node: IfNode, parent: Node = None):
         patches = []
         jz_last = None
 
-        self.visit(node.left)
-
-        patches.append(len(self.bytes_out))
-        self._emit_operation(OP.JZ, arg1=0xFFFFFFFF)
+        patches.append(self._emit_jz(node.left))
         # If body
         self._open_scope()
         for statement in node.right:
             self.visit(statement)
 
         if node.elseifnodes:
-            # 1. Patch root IF node to address of first elseif node
-            bytecnt_before_elif = len(self.bytes_out) + 9
+            # 1. Patch root IF node to the first elseif node (behind the JMP to the end)
             patch_head = patches.pop()
-            self._backpatch(patch_head, bytecnt_before_elif)
-
-            patches.append(len(self.bytes_out))
-            self._emit_operation(OP.JMP, arg1=0xFFFFFFFF)
+            patches.append(self._emit(OP.JMP, arg1=0xFFFFFFFF))
+            patch_head.target = self._place(Label())
 
             for cnt, elifnode in enumerate(node.elseifnodes):
                 # Evalulate if(<expr>)
-                self.visit(elifnode.left)
-                patches.append(len(self.bytes_out))
+                patches.append(self._emit_jz(elifnode.left))
 
                 if node.elsenode and cnt >= len(node.elseifnodes) - 1:
-                    jz_last = len(self.bytes_out)
+                    jz_last = patches[-1]
 
-                self._emit_operation(OP.JZ, arg1=0xFFFFFFFF)
                 for statement in elifnode.right:
                     self.visit(statement)
 
-                bytecnt_after_elif = len(self.bytes_out) + 9
                 patch_head = patches.pop()
-                self._backpatch(patch_head, bytecnt_after_elif)
-
-                patches.append(len(self.bytes_out))
-                self._emit_operation(OP.JMP, arg1=0xFFFFFFFF)
+                patches.append(self._emit(OP.JMP, arg1=0xFFFFFFFF))
+                patch_head.target = self._place(Label())
 
             if node.elsenode:
                 # Patch previous IF / ELSEIF with ELSE + 1
-                self._backpatch(jz_last, len(self.bytes_out) + 9)
-                patches.append(len(self.bytes_out))
-                self._emit_operation(OP.JMP, arg1=0xFFFFFFFF)
+                patches.append(self._emit(OP.JMP, arg1=0xFFFFFFFF))
+                jz_last.target = self._place(Label())
                 for statement in node.elsenode:
                     self.visit(statement)
-                endif = len(self.bytes_out)
                 patch_head = patches.pop()
-                self._backpatch(patch_head, endif)
+                patch_head.target = self._place(Label())
 
         else:
             if node.elsenode:
-                bytecnt_after_else = len(self.bytes_out) + 9
                 patch_head = patches.pop()
-                self._backpatch(patch_head, bytecnt_after_else)
-
-                patches.append(len(self.bytes_out))
-                self._emit_operation(OP.JMP, arg1=0xFFFFFFFF)
+                patches.append(self._emit(OP.JMP, arg1=0xFFFFFFFF))
+                patch_head.target = self._place(Label())
                 for statement in node.elsenode:
                     self.visit(statement)
-                endif = len(self.bytes_out)
                 patch_head = patches.pop()
-                self._backpatch(patch_head, endif)
+                patch_head.target = self._place(Label())
 
-        bytecnt_after_all = len(self.bytes_out)
-        for p in range(len(patches)):
-            patch_head = patches.pop()
-            self._backpatch(patch_head, bytecnt_after_all)
+        if patches:
+            after_all = self._place(Label())
+            for patch_head in patches:
+                patch_head.target = after_all
 
         self._close_scope()
 
     def visit_LoopNode(self, node: LoopNode, parent: Node = None):
-        patches = []
-
         if node.condition_pos == ConditionPos.TOP:
             self.visit(node.left[0])
 
-            loop_head = len(self.bytes_out)
-            patches.append(loop_head)
-
-            self.visit(node.left[1])
+            self._open_scope()
+            # Temporaries of loop invariant expressions
+            for statement in node.preheader:
+                self.visit(statement)
 
-            patches.append(len(self.bytes_out))
-            self._emit_operation(OP.JZ, arg1=0xFFFFFFFF)
+            loop_head = self._place(Label())
+            patch_head = self._emit_jz(node.left[1])
 
             # Loop body
-            self._open_scope()
             for statement in node.right:
                 self.visit(statement)
 
-            self._emit_operation(OP.JMP, loop_head)
+            self._emit(OP.JMP, target=loop_head)
 
-            patch_head = patches.pop()
-            bytecnt_after_all = len(self.bytes_out)
-            self._backpatch(patch_head, bytecnt_after_all)
+            after_all = self._place(Label())
+            patch_head.target = after_all
         else:
             self._open_scope()
+            for statement in node.preheader:
+                self.visit(statement)
 
-            loop_head = len(self.bytes_out)
+            loop_head = self._place(Label())
 
             for statement in node.right:
                 self.visit(statement)
 
             if node.left:
                 # Conditional loop..until / for..next
-                self.visit(node.left)
-                self._emit_operation(OP.JZ, arg1=loop_head)
+                self._emit_jz(node.left, target=loop_head)
             else:
                 # Unconditional jump (loop..forever)
-                self._emit_operation(OP.JMP, arg1=loop_head)
+                self._emit(OP.JMP, target=loop_head)
 
-            bytecnt_after_all = len(self.bytes_out)
+            after_all = self._place(Label())
 
-        # Backpatch exits (breaks)
+        # Patch exits (breaks)
         while self.loop_patches:
-            self._backpatch(self.loop_patches.pop(), bytecnt_after_all)
+            self.loop_patches.pop().target = after_all
 
         self._close_scope()
 
     def visit_ExpressionNode(self, node: ExpressionNode, parent: Node = None):
         self.visit(node.left, parent=node)
+        if self.superinstructions and node.op in COMPARE_GLOBAL_OPS and type(node.right) is ValueNode \
+                and node.right.value_type == ValueType.IDENTIFIER:
+            entry = self._find_symbol(node.right.value)
+            if entry is not None and entry[1] is not None and entry[2]:
+                # Compare with a global instead of POPG, <compare>
+                self._emit(COMPARE_GLOBAL_OPS[node.op], arg1=entry[1])
+                return
         self.visit(node.right, parent=node)
 
         if node.op == OpType.AND:
-            self._emit_operation(OP.AND)
+            self._emit(OP.AND)
         elif node.op == OpType.EQUALS:
-            self._emit_operation(OP.EQ)
+            self._emit(OP.EQ)
         elif node.op == OpType.NOTEQUALS:
-            self._emit_operation(OP.NOTEQ)
+            self._emit(OP.NOTEQ)
         elif node.op == OpType.OR:
-            self._emit_operation(OP.OR)
+            self._emit(OP.OR)
         elif node.op == OpType.LT:
-            self._emit_operation(OP.LT)
+            self._emit(OP.LT)
         elif node.op == OpType.LTEQ:
-            self._emit_operation(OP.LTEQ)
+            self._emit(OP.LTEQ)
         elif node.op == OpType.GT:
-            self._emit_operation(OP.GT)
+            self._emit(OP.GT)
         elif node.op == OpType.GTEQ:
-            self._emit_operation(OP.GTEQ)
+            self._emit(OP.GTEQ)
 
     def visit_CallNode(self, node: CallNode, parent: Node = None):
         n = node.type.value.lower()
@@ -621,26 +679,26 @@ class CodeGenerator(NodeVisitor):
             # PUSH STRING <param> | BUILD STRING <param> onto STACK
             self.visit(node.args[0], parent=node)
             # CALL __print
-            self._emit_operation(OP.PRINT)
+            self._emit(OP.PRINT)
             return 1
         elif n == 'argtype':
             # CALL __argtype
             self.visit(node.args[0], parent=node)
-            self._emit_operation(OP.ARGTYPE)
+            self._emit(OP.ARGTYPE)
             return 1
         elif n == 'len':
             # CALL __len
             self.visit(node.args[0], parent=node)
-            self._emit_operation(OP.LEN)
+            self._emit(OP.LEN)
             return 1
         elif n == 'array':
             # CALL __array
             self.visit(node.args[0], parent=node)
-            self._emit_operation(OP.ARRAY)
+            self._emit(OP.ARRAY)
             return 1
         else:
             try:
-                proc = self._find_symbol(node.type.value, stype=ProcedureSymbol, scope=0)[0]
+                proc = self._find_symbol(node.type.value, global_only=True)[0]
 
                 if proc.args != len(node.args):
                     self._fail('Insufficient amount of arguments for procedure {p} - required {n}, given {g}'.format(
@@ -649,86 +707,135 @@ class CodeGenerator(NodeVisitor):
                 for arg in range(proc.args):
                     try:
                         self.visit(node.args[arg], parent=node)
-                        # self._emit_operation(OP.PUSHL, arg)
+                        # self._emit(OP.PUSHL, arg)
                     except IndexError:
                         self._fail(
                             'Insufficient amount of arguments for procedure {p} - required {n}, given {g}'.format(
                                 p=proc.name, n=proc.args, g=len(node.args)))
 
-                # Push own return address onto stack
-                self._emit_operation(OP.PUSH, len(self.bytes_out) + 18)  # 18 = 9 (this operation) + 9 (next jmp) bytes!
+                if id(node) in self._tail_calls:
+                    # Tail call, the prologue binds the arguments again and the procedure starts over in the same
+                    # frame with the return address of the current call
+                    self._emit(OP.JMP, target=proc.addr)
+                    return 1
+
+                # Push own return address (behind the JMPFUN) onto stack
+                return_label = Label()
+                self._emit(OP.PUSH, target=return_label)
 
                 # JMP to address of sub
-                self._emit_operation(OP.JMPFUN, arg1=proc.addr)
+                self._emit(OP.JMPFUN, target=proc.addr)
+                self._place(return_label)
             except TypeError:
                 # External defined function / subroutine
                 for a, arg in enumerate(node.args):
                     self.visit(arg)
-                self._emit_operation(OP.PUSHS, arg1=len(node.type.value), arg2=node.type.value)
+                self._emit(OP.PUSHS, arg1=len(node.type.value), arg2=node.type.value)
                 # Call needs information on number of arguments (arg1)
-                self._emit_operation(OP.CALL, arg1=len(node.args))
+                self._emit(OP.CALL, arg1=len(node.args))
 
             return 1  # required for ADD operation
 
     def visit_ExitNode(self, node: ExitNode, parent: Node = None):
-        self.loop_patches.append(len(self.bytes_out))
-        self._emit_operation(OP.JMP, arg1=0xFFFFFFFF)
-        # Backpatched later (at forever / loop end) to address of loop end
+        self.loop_patches.append(self._emit(OP.JMP, arg1=0xFFFFFFFF))
+        # Target set later (at forever / loop end) to the loop end
 
     def visit_ArrayNode(self, node: ArrayNode, parent: Node = None):
         for v in node.values:
             self.visit(v)
-        self._emit_operation(OP.DATA, arg1=len(node.values))
+        self._emit(OP.DATA, arg1=len(node.values))
         self.stats['max_arrays'] += 1
 
     def visit_ProcSubNode(self, node: Union[ProcSubNode, ProcFuncNode], parent: Node = None):
         # node.left = identifier
         # node.right = statements body
         # node.args = argument name(s)
-        if not self._symbol_exists(node.left.value, stype=ProcedureSymbol, scope=0):
-            proc_head = len(self.bytes_out)
+        if not self._symbol_exists(node.left.value, global_only=True):
+            proc_head = self._place(Label(node.left.value))
             # self.visit(node.right) -> will generate executable byte code wherever the procedure was declared!
             # Guard the procedure block with a JMP statement at the beginning and patch it to the end of the sub
-            self._emit_operation(OP.JMP, arg1=0xFFFFFF)
+            guard = self._emit(OP.JMP, arg1=0xFFFFFF)
 
             self._insert_symbol(
-                symbol=ProcedureSymbol(name=node.left.value, args=len(node.args), addr=len(self.bytes_out)),
-                scope=0)
+                symbol=ProcedureSymbol(name=node.left.value, args=len(node.args), addr=self._place(Label())),
+                global_scope=True)
 
-            prev_scope = self.scope
-            proc_scope = self._open_proc_scope()
-            self.scope = proc_scope
+            prev_scope = self.symbols.open_frame()
+            tail_calls = self._tail_calls
+            self._tail_calls = self._find_tail_calls(node) if self.tail_calls else set()
             # Pop required values from stack (depending of number of arguments specified!)
             for a, arg in enumerate(node.args):
                 # If we call the sub later, we push(l) the given arguments into the new (local) scope!
                 # i.e.  my_sub(1, 2, 3) will PUSHL 1 [0], PUSHL 2 [1] and PUSHL 3 [2]
                 # Then the procudure will POPL these args again to be used within the sub
-                self._insert_symbol(VariableSymbol(name=arg.value, value=a), scope=proc_scope)
-                self._emit_operation(OP.PUSHL, arg1=len(node.args) - a - 1)
+                self._insert_symbol(VariableSymbol(name=arg.value, value=a))
+                self._emit(OP.PUSHL, arg1=len(node.args) - a - 1)
 
             for statement in node.right:
                 self.visit(statement)
 
             # OP code JFS (jump from stack), takes a value from the stack and uses it as jump address
-            self._emit_operation(OP.JFS)
-            self._backpatch(proc_head, len(self.bytes_out))
-            self.scope = prev_scope
+            self._emit(OP.JFS)
+            guard.target = self._place(Label())
+            self.symbols.close_frame(prev_scope)
+            self._tail_calls = tail_calls
+            self._procedure_labels[node.left.value] = (proc_head, guard.target)
+
+    @staticmethod
+    def _find_tail_calls(node: Union[ProcSubNode, ProcFuncNode]) -> {int}:
+        """
+        Calls of a procedure to itself in tail position
+        In a func these are returned calls (return f(...)), in a sub calls at the end of the body (also at the end
+        of the branches of an if at the end) or followed by a return without value. Procedures defined in the body
+        are not searched
+        :param node: Procedure
+        :return: Ids of the call nodes
+        """
+        name = node.left.value
+        func = type(node) is ProcFuncNode
+        calls = set()
+        # Statement lists, and whether the procedure returns behind them
+        pending = [(node.right, True)]
+        while pending:
+            statements, tail = pending.pop()
+            for i, statement in enumerate(statements):
+                cls = type(statement)
+                last = tail and i == len(statements) - 1
+                if cls is ProcSubReturnNode:
+                    call = statement.ret_arg
+                    if func and type(call) is CallNode and call.type.value == name:
+                        calls.add(id(call))
+                elif cls is CallNode:
+                    if not func and statement.type.value == name and (last or (
+                            i + 1 < len(statements) and type(statements[i + 1]) is ProcSubReturnNode
+                            and statements[i + 1].ret_arg is None)):
+                        calls.add(id(statement))
+                elif cls is IfNode:
+                    pending.append((statement.right, last))
+                    pending.extend((elifnode.right, last) for elifnode in statement.elseifnodes or ())
+                    if statement.elsenode:
+                        pending.append((statement.elsenode, last))
+                elif cls is LoopNode:
+                    pending.append((statement.right, False))
+        return calls
 
     def visit_ProcSubReturnNode(self, node: ProcSubReturnNode, parent: Node = None):
         if node.ret_arg is not None:
             self.visit(node.ret_arg, parent=node)
-            self._emit_operation(OP.JFS, arg1=1)
+            if id(node.ret_arg) in self._tail_calls:
+                # Jumped back to the entry, the returned value is the one of the last call
+                return
+            self._emit(OP.JFS, arg1=1)
         else:
             # no return value
-            self._emit_operation(OP.JFS)
+            self._emit(OP.JFS)
 
     def visit_ProcFuncNode(self, node: ProcFuncNode, parent: Node = None):
         self.visit_ProcSubNode(node, parent)
 
     def visit_ExternApiNode(self, node: ExternApiNode, parent: Node = None):
         # Add identifier to list of external identifiers
-        if node.identifier not in self.external_symbols:
-            self.external_symbols.append(node.identifier)
+        self.symbols.external.add(node.identifier)
 
     def visit_ImportNode(self, node: ImportNode, parent: Node = None):
         pass
@@ -736,40 +843,58 @@ class CodeGenerator(NodeVisitor):
     def _fail(self, msg: str = ''):
         raise Exception('COMPILER ERROR,{msg}'.format(msg=msg))
 
-    def _emit_operation(self, op: OP, arg1=None, arg2=None):
-        # [1 Byte OP][4 Byte arg1][4 Byte arg2]
-        bytes_out: list = []
+    def _reserve(self, size: int):
+        # Grow the code buffer (doubling) until size more bytes fit
+        if self._pc + size > len(self._code):
+            capacity = len(self._code)
+            while self._pc + size > capacity:
+                capacity *= 2
+            self._code.extend(bytes(capacity - len(self._code)))
+
+    def _check_operation(self, op: OP, arg1=None, arg2=None):
         if op.value > 256:
             self._fail('OP code must not exceed 256')
-
-        bytes_out.append(op.value)
-
-        if arg1 is not None:
-            if arg1 <= 0xFFFFFFFF:
-                b = list(bytearray.fromhex(hex(struct.unpack('<Q', struct.pack('<d', arg1))[0]).lstrip('0x')))
-                while len(b) < 8:
-                    b.append(0x00)
-                bytes_out.extend(b)
-            else:
-                self._fail('Argument 1 is too large')
-
+        if arg1 is not None and arg1 > 0xFFFFFFFF:
+            self._fail('Argument 1 is too large')
         if arg2 is not None:
-            if isinstance(arg2, str):
-                bytes_out.extend(arg2.encode())
-            else:
-                if arg2 <= 0xFFFFFFFF:
-                    b = list(bytearray.fromhex(hex(struct.unpack('<Q', struct.pack('<d', arg2))[0]).lstrip('0x')))
-                    while len(b) < 8:
-                        b.append(0x00)
-                    bytes_out.extend(b)
-                else:
-                    self._fail('Argument 2 is too large')
-
-        if op not in [OP.NOP, OP.PUSHAS, OP.EQ, OP.LT, OP.GT, OP.LTEQ, OP.GTEQ, OP.NOTEQ, OP.ADD, OP.NEG, OP.SUB,
-                      OP.MUL, OP.DIV, OP.AND, OP.OR, OP.NOT, OP.MOD, OP.PRINT, OP.ARGTYPE, OP.LEN, OP.PUSHS, OP.ARRAY]:
-            while len(bytes_out) < 9:
-                bytes_out.append(0x00)
-            if len(bytes_out) != 9:
+            if not isinstance(arg2, str) and arg2 > 0xFFFFFFFF:
+                self._fail('Argument 2 is too large')
+            if op is not OP.PUSHS and op not in SINGLE_BYTE_OPS:
                 self._fail('OP and / or arguments are invalid')
 
-        self.bytes_out.extend(bytes_out)
+    def _emit_operation(self, op: OP, arg1=None, arg2=None):
+        """
+        Append an operation to the code buffer, see the byte code encoding at the top of this module
+        :param op: Operation
+        :param arg1: Numeric argument
+        :param arg2: String (PUSHS) or numeric argument of a single byte operation
+        """
+        self._check_operation(op, arg1, arg2)
+        code = op.value
+        if arg2 is None:
+            pc = self._pc
+            if arg1 is not None or op not in SINGLE_BYTE_OPS:
+                # Common case, one fixed size operation
+                if pc + 9 > len(self._code):
+                    self._reserve(9)
+                OPERATION.pack_into(self._code, pc, code, arg1 or 0)
+                self._pc = pc + 9
+            else:
+                if pc + 1 > len(self._code):
+                    self._reserve(1)
+                self._code[pc] = code
+                self._pc = pc + 1
+            return
+
+        data = arg2.encode() if isinstance(arg2, str) else OPERAND.pack(arg2)
+
+        size = 1 + (8 if arg1 is not None else 0) + len(data)
+        self._reserve(size)
+        pc = self._pc
+        self._code[pc] = code
+        pc += 1
+        if arg1 is not None:
+            OPERAND.pack_into(self._code, pc, arg1)
+            pc += 8
+        self._code[pc:pc + len(data)] = data
+        self._pc = pc + len(data)
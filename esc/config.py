@@ -0,0 +1,43 @@
+import marshal
+import os
+
+_CONFIGS: {str: dict} = {}
+
+
+def _cache_path(path: str) -> str:
+    return os.path.join(os.path.dirname(path), '.{f}.cache'.format(f=os.path.basename(path)))
+
+
+def load_config(path: str = 'config.yml') -> dict:
+    """
+    Parsed config file, each file is read only once per process
+    The parsed config is cached next to the file in marshal format, YAML is only loaded if the file changed
+    :param path: Path to the config file
+    :return: Config dict
+    """
+    key = os.path.abspath(path)
+    if key in _CONFIGS:
+        return _CONFIGS[key]
+
+    stat = os.stat(key)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    try:
+        with open(_cache_path(key), 'rb') as f:
+            cached_stamp, config = marshal.load(f)
+        if tuple(cached_stamp) == stamp:
+            _CONFIGS[key] = config
+            return config
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    import yaml
+    with open(key) as file:
+        config = yaml.load(file, Loader=yaml.FullLoader)
+    try:
+        with open(_cache_path(key), 'wb') as f:
+            marshal.dump((stamp, config), f)
+    except (OSError, ValueError):
+        # Read only directory or values marshal can't represent, the config is parsed again next time
+        pass
+    _CONFIGS[key] = config
+    return config
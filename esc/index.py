@@ -0,0 +1,159 @@
+import os
+from typing import Optional
+
+INDEX_FORMAT = 1
+
+
+class DirectoryIndex:
+    """
+    File names of a directory tree in os.walk order, with the mtimes of all walked directories
+    Adding or removing a file changes the mtime of its directory, so the mtimes tell whether the index is stale
+    """
+
+    def __init__(self, root: str):
+        self.root: str = root
+        self.files: [(str, str)] = []
+        self.mtimes: {str: int} = {}
+        self._by_name: Optional[dict] = None
+        self._by_stem: Optional[dict] = None
+
+    def build(self) -> None:
+        self.files = []
+        self.mtimes = {}
+        for (dirpath, dirnames, filenames) in os.walk(self.root):
+            try:
+                self.mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+            self.files.extend((dirpath, filename) for filename in filenames)
+        self._by_name = None
+        self._by_stem = None
+
+    def is_stale(self) -> bool:
+        if not self.mtimes:
+            # Missing root at build time
+            return os.path.isdir(self.root)
+        for dirpath, mtime in self.mtimes.items():
+            try:
+                if os.stat(dirpath).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def find(self, name: str, stem: bool = False) -> Optional[str]:
+        """
+        Path of the first file (in os.walk order) with the given name
+        :param name: File name
+        :param stem: Compare names without extension
+        :return: Path or None
+        """
+        if self._by_name is None:
+            self._by_name = {}
+            self._by_stem = {}
+            for dirpath, filename in self.files:
+                path = os.sep.join([dirpath, filename])
+                self._by_name.setdefault(filename, path)
+                self._by_stem.setdefault(os.path.splitext(filename)[0], path)
+        return (self._by_stem if stem else self._by_name).get(name)
+
+    def to_dict(self) -> dict:
+        return {'mtimes': self.mtimes, 'files': self.files}
+
+    @classmethod
+    def from_dict(cls, root: str, d: dict) -> 'DirectoryIndex':
+        index = cls(root)
+        index.mtimes = d['mtimes']
+        index.files = [tuple(f) for f in d['files']]
+        return index
+
+
+class FileIndex:
+    """
+    Index from file name to path over directory trees, each tree is walked once
+    With an index file the index is persisted and reused by later processes as long as no directory mtime changed
+    """
+
+    def __init__(self, index_file: str = ''):
+        self.index_file: str = index_file
+        self._dirs: {str: DirectoryIndex} = {}
+        self._persisted: Optional[dict] = None
+        self._dirty: bool = False
+
+    def find(self, dirs: [str], name: str, stem: bool = False) -> Optional[str]:
+        """
+        Path of the first file with the given name, searching dirs in order
+        :param dirs: Directory trees to search
+        :param name: File name
+        :param stem: Compare names without extension
+        :return: Path or None
+        """
+        path = None
+        for root in dirs:
+            index = self._directory(root)
+            path = index.find(name, stem=stem)
+            if path is None and index.is_stale():
+                index.build()
+                self._dirty = True
+                path = index.find(name, stem=stem)
+            if path is not None:
+                break
+        if self._dirty:
+            self.save()
+        return path
+
+    def _directory(self, root: str) -> DirectoryIndex:
+        index = self._dirs.get(root)
+        if index is None:
+            if self._persisted is None:
+                self._persisted = self._load()
+            if root in self._persisted:
+                index = DirectoryIndex.from_dict(root, self._persisted[root])
+            if index is None or index.is_stale():
+                index = DirectoryIndex(root)
+                index.build()
+                self._dirty = True
+            self._dirs[root] = index
+        return index
+
+    def _load(self) -> dict:
+        if not self.index_file:
+            return {}
+        import json
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+            if data.get('format') != INDEX_FORMAT:
+                return {}
+            return data['dirs']
+        except (OSError, ValueError, KeyError, AttributeError):
+            return {}
+
+    def save(self) -> None:
+        """
+        Write the index file (if any), the persisted trees not used by this process are kept
+        """
+        self._dirty = False
+        if not self.index_file:
+            return
+        import json
+        dirs = dict(self._persisted or {})
+        dirs.update({root: index.to_dict() for root, index in self._dirs.items()})
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'format': INDEX_FORMAT, 'dirs': dirs}, f)
+        os.replace(tmp_file, self.index_file)
+
+
+_FILE_INDICES: {str: FileIndex} = {}
+
+
+def file_index(index_file: str = '') -> FileIndex:
+    """
+    Process wide file index, shared by the CLI and the parser
+    :param index_file: Path of the persisted index, empty to keep the index in memory only
+    :return: FileIndex
+    """
+    if index_file not in _FILE_INDICES:
+        _FILE_INDICES[index_file] = FileIndex(index_file)
+    return _FILE_INDICES[index_file]
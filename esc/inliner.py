@@ -0,0 +1,184 @@
+from typing import Optional
+
+from esc.ir import Code, Instruction, Label, Pass, code_size
+from esc.opcodes import OP
+from esc.slots import frame_owners, frame_sizes
+
+# Bytes of the call sequence (PUSH of the return address, JMPFUN) and of the final return (JFS) of a procedure
+CALL_SIZE = 18
+RETURN_SIZE = 9
+# Bytes of the guard jump in front of a procedure
+GUARD_SIZE = 9
+
+# Procedures up to this size in bytes (prologue and returns included) are inlined at every call
+SMALL_PROCEDURE = 64
+# Growth of the code by inlining at most, relative to the size of the program
+GROWTH_BUDGET = 0.1
+
+LOCAL_OPS = frozenset([OP.POPL, OP.PUSHL, OP.INCL])
+
+
+class Procedure:
+    """
+    Generated code of a procedure, the body reaches from behind the entry label to the last label
+    """
+    __slots__ = ('name', 'head', 'entry', 'end', 'start', 'stop', 'labels', 'size', 'frame', 'calls', 'inlinable')
+
+    def __init__(self, name: str, head: int, end: int, code: Code, frame: int):
+        self.name = name
+        self.head = head
+        self.end = end
+        self.entry: Optional[Label] = None
+        self.start = self.stop = head + 3
+        # Labels placed in the body, copies get new ones
+        self.labels: {Label} = set()
+        self.size = 0
+        # Local slots of the procedure
+        self.frame = frame
+        # Positions of the calls of the procedure
+        self.calls: [int] = []
+        self.inlinable = False
+        # Head label, guard jump, entry label, body ending with JFS, last label
+        if head + 3 < end and code[head + 1].op is OP.JMP and type(code[head + 2]) is Label and \
+                code[end - 1].op is OP.JFS:
+            self.entry = code[head + 2]
+            self.stop = end
+            body = code[self.start:end]
+            self.labels = set(element for element in body if type(element) is Label)
+            self.size = code_size(body)
+            # Recursive procedures are kept
+            self.inlinable = all(type(element) is Label or element.target is not self.entry for element in body)
+
+    def growth(self, size: int) -> int:
+        """
+        Bytes the program grows by if the procedure is inlined at all its calls and its definition is removed
+        :param size: Size of the procedure with the procedures it calls inlined
+        """
+        return len(self.calls) * (size - RETURN_SIZE - CALL_SIZE) - (size + GUARD_SIZE)
+
+
+class Inliner(Pass):
+    """
+    Replaces calls of procedures with a copy of their code
+    The code of a procedure binds its arguments to its locals (the prologue) and returns with JFS. A copy at a call
+    binds the arguments to unused locals of the calling frame and jumps behind the call instead of returning, so
+    it behaves like the call. Procedures called once are always inlined, that removes the call sequence and the
+    definition. Small procedures are inlined at all calls as long as the growth of the program stays within the
+    budget. Recursive procedures and procedures with procedures defined inside of them are kept. Procedures are
+    decided in the order they are defined, so the procedures a procedure calls are inlined into it first
+    """
+    name = 'inline'
+
+    def __init__(self, procedures: {str: (Label, Label)}, small: int = SMALL_PROCEDURE,
+                 budget: float = GROWTH_BUDGET):
+        # First and last label of each procedure by name, filled by the code generator. Procedures inlined at all
+        # calls are removed from the code and from procedures
+        self.procedures = procedures
+        self.small = small
+        self.budget = budget
+        # Number of inlined calls by procedure name
+        self.inlined: {str: int} = {}
+        self._code: Code = []
+        self._sites: {int: Procedure} = {}
+        self._removed: {int: int} = {}
+
+    def run(self, code: Code) -> Code:
+        self.inlined = {}
+        owners = frame_owners(code, self.procedures)
+        if owners is None:
+            return code
+        procs = self._scan(code)
+        budget = int(code_size(code) * self.budget)
+        # Size of each procedure with the procedures it calls inlined
+        sizes: {str: int} = {}
+        inlined: [Procedure] = []
+        for proc in procs:
+            size = proc.size
+            for callee in inlined:
+                size += sum(sizes[callee.name] - RETURN_SIZE - CALL_SIZE
+                            for call in callee.calls if proc.start <= call < proc.stop)
+            sizes[proc.name] = size
+            if not proc.inlinable or not proc.calls:
+                continue
+            growth = proc.growth(size)
+            if len(proc.calls) == 1 or (size <= self.small and growth <= budget):
+                budget -= max(growth, 0)
+                inlined.append(proc)
+        if not inlined:
+            return code
+
+        self._code = code
+        self._sites = {call: proc for proc in inlined for call in proc.calls}
+        self._removed = {proc.head: proc.end for proc in inlined}
+        counters = {owner: [size] for owner, size in frame_sizes(code, self.procedures).items()}
+        new = []
+        i = 0
+        while i < len(code):
+            i = self._copy(new, i, counters[owners[i]])
+        for proc in inlined:
+            self.inlined[proc.name] = len(proc.calls)
+            del self.procedures[proc.name]
+        self._code = []
+        return new
+
+    def _scan(self, code: Code) -> [Procedure]:
+        # Procedures in the order they are defined, with their calls
+        positions = {element: i for i, element in enumerate(code) if type(element) is Label}
+        sizes = frame_sizes(code, self.procedures)
+        procs = [Procedure(name, positions[head], positions[end], code, sizes[name])
+                 for name, (head, end) in self.procedures.items()]
+        procs.sort(key=lambda p: p.head)
+        by_entry = {proc.entry: proc for proc in procs if proc.entry is not None}
+        for proc in procs:
+            # Procedures defined inside
+            if any(proc.head < other.head < proc.end for other in procs):
+                proc.inlinable = False
+        for i, element in enumerate(code):
+            if element.op is OP.JMPFUN and element.target in by_entry:
+                proc = by_entry[element.target]
+                if 0 < i < len(code) - 1 and code[i - 1].op is OP.PUSH and code[i - 1].target is code[i + 1]:
+                    proc.calls.append(i - 1)
+                else:
+                    proc.inlinable = False
+        return procs
+
+    def _copy(self, out: Code, i: int, frame: [int], base: int = 0, labels: {Label: Label} = None,
+              return_label: Label = None) -> int:
+        """
+        Copy the element at i, inlined calls are expanded and definitions of inlined procedures skipped
+        :param out: Code to append to
+        :param i: Position in the code
+        :param frame: Number of local slots of the frame the code runs in, grows with the inlined calls
+        :param base: First local slot of the copied procedure in the frame
+        :param labels: New labels of the copied procedure, None if the element is not part of a copy
+        :param return_label: Label the returns of the copied procedure jump to
+        :return: Position of the next element
+        """
+        code = self._code
+        if i in self._removed:
+            return self._removed[i]
+        callee = self._sites.get(i)
+        if callee is not None:
+            # PUSH return label, JMPFUN, return label: the copy continues at the return label (the final JFS is left
+            # out)
+            target = code[i + 2] if labels is None else labels[code[i + 2]]
+            callee_labels = {label: Label(label.name) for label in callee.labels}
+            callee_base = frame[0]
+            frame[0] += callee.frame
+            j = callee.start
+            while j < callee.stop - 1:
+                j = self._copy(out, j, frame, callee_base, callee_labels, target)
+            return i + 2
+
+        element = code[i]
+        if labels is None:
+            out.append(element)
+        elif type(element) is Label:
+            out.append(labels[element])
+        elif element.op is OP.JFS:
+            out.append(Instruction(OP.JMP, target=return_label))
+        elif element.op in LOCAL_OPS:
+            out.append(Instruction(element.op, base + int(element.arg1)))
+        else:
+            out.append(Instruction(element.op, element.arg1, element.arg2, labels.get(element.target, element.target)))
+        return i + 1
@@ -0,0 +1,168 @@
+from typing import Optional, Union
+
+from esc.opcodes import OP, JUMPS, SINGLE_BYTE_OPS
+
+
+class Label:
+    """
+    Symbolic code address, placed in the code in front of the instruction it stands for
+    """
+    __slots__ = ('name',)
+    # Labels are no operations, passes matching operations skip them
+    op = None
+
+    def __init__(self, name: str = ''):
+        self.name = name
+
+    def __repr__(self):
+        return '[LABEL {n}]'.format(n=self.name or hex(id(self)))
+
+
+class Instruction:
+    """
+    Operation of the intermediate code
+    Jumps (and the return address a procedure call pushes) have a target label instead of an address, addresses are
+    resolved when the code is encoded
+    """
+    __slots__ = ('op', 'arg1', 'arg2', 'target')
+
+    def __init__(self, op: OP, arg1=None, arg2=None, target: Label = None):
+        self.op: OP = op
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.target: Optional[Label] = target
+
+    def __repr__(self):
+        return '[{op} {arg}]'.format(op=self.op, arg=self.target if self.target is not None else self.arg1)
+
+
+# Linear intermediate code, labels stand between the instructions
+Code = [Union[Instruction, Label]]
+
+
+class BasicBlock:
+    """
+    Instructions entered at the start only and left at the end only
+    A block starts with its labels (if any) and ends with a jump, a return or in front of the next label
+    """
+    __slots__ = ('index', 'labels', 'instructions', 'successors', 'predecessors')
+
+    def __init__(self, index: int):
+        self.index: int = index
+        self.labels: [Label] = []
+        self.instructions: [Instruction] = []
+        self.successors: [BasicBlock] = []
+        self.predecessors: [BasicBlock] = []
+
+    def __repr__(self):
+        return '[BLOCK {i}: {n} instructions, successors {s}]'.format(
+            i=self.index, n=len(self.instructions), s=[b.index for b in self.successors])
+
+
+class ControlFlowGraph:
+    """
+    Basic blocks of linear code in layout order and the edges between them
+    Conditional jumps continue with the target and the next block. A procedure call (JMPFUN) continues with the
+    procedure entry and, once the procedure returned, with the next block. Returns (JFS) have no successors
+    """
+
+    def __init__(self, code: Code):
+        self.blocks: [BasicBlock] = []
+        self.block_of: {Label: BasicBlock} = {}
+        block = None
+        for element in code:
+            if type(element) is Label:
+                if block is None or block.instructions:
+                    block = self._add_block()
+                block.labels.append(element)
+                self.block_of[element] = block
+            else:
+                if block is None:
+                    block = self._add_block()
+                block.instructions.append(element)
+                if element.op in JUMPS or element.op is OP.JFS:
+                    block = None
+
+        for i, block in enumerate(self.blocks):
+            last = block.instructions[-1] if block.instructions else None
+            if last is not None and last.op in JUMPS and last.target in self.block_of:
+                self._add_edge(block, self.block_of[last.target])
+            if (last is None or last.op not in (OP.JMP, OP.JFS)) and i + 1 < len(self.blocks):
+                self._add_edge(block, self.blocks[i + 1])
+
+    def _add_block(self) -> BasicBlock:
+        block = BasicBlock(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    @staticmethod
+    def _add_edge(source: BasicBlock, dest: BasicBlock) -> None:
+        if dest not in source.successors:
+            source.successors.append(dest)
+            dest.predecessors.append(source)
+
+    def code(self) -> Code:
+        """
+        Linear code of all blocks in layout order
+        """
+        code = []
+        for block in self.blocks:
+            code.extend(block.labels)
+            code.extend(block.instructions)
+        return code
+
+
+class Pass:
+    """
+    Transformation of the intermediate code of a program
+    """
+    name = ''
+
+    def run(self, code: Code) -> Code:
+        raise NotImplementedError
+
+
+class PassManager:
+    """
+    Runs passes over the intermediate code of a program, in the order they were added
+    """
+
+    def __init__(self, passes: [Pass] = None):
+        self.passes: [Pass] = list(passes or [])
+        # Number of instructions before and after each pass, by pass name
+        self.stats: {str: (int, int)} = {}
+
+    def add(self, p: Pass) -> Pass:
+        self.passes.append(p)
+        return p
+
+    def run(self, code: Code) -> Code:
+        """
+        Run all passes
+        :param code: Intermediate code
+        :return: Transformed code (the given list is not modified)
+        """
+        for p in self.passes:
+            before = instruction_count(code)
+            code = p.run(code)
+            self.stats[p.name] = (before, instruction_count(code))
+        return code
+
+
+def instruction_count(code: Code) -> int:
+    return sum(1 for element in code if type(element) is not Label)
+
+
+def instruction_size(ins: Instruction) -> int:
+    """
+    Size of the encoded instruction in bytes (see the byte code encoding in esc.codegen)
+    """
+    if ins.op is OP.PUSHS:
+        return 9 + len(ins.arg2.encode())
+    if ins.op in SINGLE_BYTE_OPS and ins.arg1 is None and ins.target is None:
+        return 1
+    return 9
+
+
+def code_size(code: Code) -> int:
+    return sum(instruction_size(element) for element in code if type(element) is not Label)
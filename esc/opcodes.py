@@ -0,0 +1,85 @@
+import enum
+
+
+class OP(enum.Enum):
+    NOP = 0
+    PUSHG = 0x10
+    POPG = 0x11
+    PUSHL = 0x12
+    POPL = 0x13
+    PUSH = 0x14
+    PUSHS = 0x15
+    DATA = 0x16
+    PUSHA = 0x17
+    PUSHAS = 0x18
+
+    EQ = 0x20
+    LT = 0x21
+    GT = 0x22
+    LTEQ = 0x23
+    GTEQ = 0x24
+    NOTEQ = 0x25
+    EQG = 0x26
+    NOTEQG = 0x27
+    LTG = 0x28
+    GTG = 0x29
+    LTEQG = 0x2A
+    GTEQG = 0x2B
+
+    ADD = 0x30
+    NEG = 0x31
+    SUB = 0x32
+    MUL = 0x33
+    DIV = 0x34
+    AND = 0x35
+    OR = 0x36
+    NOT = 0x37
+    CONCAT = 0x38
+    MOD = 0x39
+    INCG = 0x3A
+    INCL = 0x3B
+
+    JZ = 0x40
+    JMP = 0x41
+    JFS = 0x42
+    JMPFUN = 0x43
+    CALL = 0x44
+    JEQ = 0x45
+    JNOTEQ = 0x46
+    JLT = 0x47
+    JGT = 0x48
+    JLTEQ = 0x49
+    JGTEQ = 0x4A
+
+    PRINT = 0x50
+    ARGTYPE = 0x51
+    LEN = 0x52
+    ARRAY = 0x53
+
+    @classmethod
+    def get_OP(cls, b_id):
+        for a in OP:
+            if a.value == b_id:
+                return a
+
+    @classmethod
+    def has(cls, value):
+        return OP.get_OP(value) is not None
+
+
+SINGLE_BYTE_OPS = frozenset([OP.NOP, OP.PUSHAS, OP.EQ, OP.LT, OP.GT, OP.LTEQ, OP.GTEQ, OP.NOTEQ, OP.ADD, OP.NEG,
+                             OP.SUB, OP.MUL, OP.DIV, OP.AND, OP.OR, OP.NOT, OP.MOD, OP.PRINT, OP.ARGTYPE, OP.LEN,
+                             OP.ARRAY])
+
+
+# Superinstructions, only emitted for targets supporting them (see esc.codegen.CodeGenerator.superinstructions)
+#   EQG ... GTEQG [index]   compare the top of the stack with a global (a <op> g[index]), replaces POPG, <compare>
+#   INCG / INCL [index]     increment a global / local by 1, replaces POPG, PUSH 1, ADD, PUSHG
+#   JEQ ... JGTEQ [addr]    compare the two top values and jump if true, replaces <compare>, JZ
+EXTENSION_OPS = frozenset([OP.EQG, OP.NOTEQG, OP.LTG, OP.GTG, OP.LTEQG, OP.GTEQG, OP.INCG, OP.INCL, OP.JEQ,
+                           OP.JNOTEQ, OP.JLT, OP.JGT, OP.JLTEQ, OP.JGTEQ])
+
+# Jumps that may continue with the next operation
+BRANCHES = frozenset([OP.JZ, OP.JEQ, OP.JNOTEQ, OP.JLT, OP.JGT, OP.JLTEQ, OP.JGTEQ])
+# Operations whose argument is a code address
+JUMPS = BRANCHES | {OP.JMP, OP.JMPFUN}
@@ -0,0 +1,582 @@
+import math
+from typing import Optional, Union
+
+from esc.parser import Node, TermNode, ExpressionNode, ValueNode, ValueType, OpType, AssignmentNode, ProcSubNode, \
+    ProcFuncNode, UnaryNode, CallNode, LoopNode, IfNode, ExitNode, ProcSubReturnNode, ConditionPos, ExternApiNode, \
+    ImportNode
+from esc.scanner import Token, TokenType
+
+# Optimization level of the code generator if none is given, 0 disables all passes
+DEFAULT_OPT_LEVEL = 1
+
+# Largest number the code generator accepts as operand (see CodeGenerator._emit_operation)
+MAX_OPERAND = 0xFFFFFFFF
+
+_SLOT_NAMES: {type: (str,)} = {}
+_NODE_TYPES: {type: bool} = {}
+
+
+def slot_names(cls) -> (str,):
+    names = _SLOT_NAMES.get(cls)
+    if names is None:
+        names = tuple(name for c in reversed(cls.__mro__) for name in c.__dict__.get('__slots__', ()))
+        _SLOT_NAMES[cls] = names
+    return names
+
+
+def replace(node: Node, **changes) -> Node:
+    """
+    Shallow copy of a node with some attributes replaced
+    :param node: Node
+    :param changes: Attribute values of the copy
+    :return: New node
+    """
+    cls = type(node)
+    copy = cls.__new__(cls)
+    for name in slot_names(cls):
+        if name in changes:
+            setattr(copy, name, changes[name])
+        elif hasattr(node, name):
+            setattr(copy, name, getattr(node, name))
+    return copy
+
+
+def _is_node(value) -> bool:
+    # isinstance checks against the abstract Node class are slow, the result is cached per type
+    cls = type(value)
+    is_node = _NODE_TYPES.get(cls)
+    if is_node is None:
+        is_node = _NODE_TYPES[cls] = issubclass(cls, Node)
+    return is_node
+
+
+class Transformer:
+    """
+    Copy on write AST rewriter, the tree given to transform is never modified
+    The tree is walked bottom up without recursion. A node is copied if one of its children changed, then the
+    transform_<node class> method (if any) gets the node and returns it or a replacement. Returning None removes a
+    node from the statement list it is in
+    """
+
+    def transform(self, root: Node) -> Node:
+        # Replaced nodes by id of the original node
+        replaced: {int: Node} = {}
+        hooks = {}
+        stack = [(root, None)]
+        while stack:
+            node, children = stack.pop()
+            if children is None:
+                children = _children(node)
+                stack.append((node, children))
+                stack.extend((child, None) for child in children)
+                continue
+
+            new = node
+            for child in children:
+                if id(child) in replaced:
+                    new = _rebuild(node, replaced)
+                    break
+            cls = type(new)
+            hook = hooks.get(cls, False)
+            if hook is False:
+                hook = hooks[cls] = getattr(self, 'transform_' + cls.__name__, None)
+            if hook is not None:
+                new = hook(new)
+            if new is not node:
+                replaced[id(node)] = new
+        return replaced.get(id(root), root)
+
+
+def _children(node: Node) -> [Node]:
+    children = []
+    for name in slot_names(type(node)):
+        value = getattr(node, name, None)
+        if _is_node(value):
+            children.append(value)
+        elif type(value) is list:
+            values = [value]
+            while values:
+                value = values.pop()
+                if _is_node(value):
+                    children.append(value)
+                elif type(value) is list:
+                    values.extend(value)
+    return children
+
+
+def _rebuild(node: Node, replaced: {int: Node}) -> Node:
+    changes = {}
+    for name in slot_names(type(node)):
+        value = getattr(node, name, None)
+        new = _replaced(value, replaced)
+        if new is not value:
+            changes[name] = new
+    return replace(node, **changes)
+
+
+def _replaced(value, replaced: {int: Node}):
+    # value with all replaced nodes exchanged, lists are copied only if an element changed or was removed
+    if type(value) is list:
+        new = [r for r in (_replaced(v, replaced) for v in value) if r is not None]
+        if len(new) != len(value):
+            return new
+        for a, b in zip(new, value):
+            if a is not b:
+                return new
+        return value
+    return replaced.get(id(value), value)
+
+
+def constant(node: Node) -> Optional[ValueNode]:
+    """
+    Node if it is a number or string literal
+    """
+    if type(node) is ValueNode and node.value_type in (ValueType.NUMBER, ValueType.STRING):
+        return node
+    return None
+
+
+def _number(value: float) -> Optional[ValueNode]:
+    # Results the code generator could not emit (or the VM would compute differently) are not folded
+    if not math.isfinite(value) or value > MAX_OPERAND:
+        return None
+    node = ValueNode(ValueType.NUMBER)
+    node.value = value
+    return node
+
+
+def _string(value: str) -> ValueNode:
+    node = ValueNode(ValueType.STRING)
+    node.value = value
+    return node
+
+
+class ConstantFolder(Transformer):
+    """
+    Folds arithmetic, comparisons and logical operators on number literals and the concatenation of string literals
+    Numbers are folded with double arithmetic like on the VM, comparisons and logical operators result in 1 or 0.
+    Division by zero, modulo of non integers or negative numbers and results out of the operand range are left to
+    the VM
+    """
+
+    def transform_TermNode(self, node: TermNode) -> Node:
+        left, right = constant(node.left), constant(node.right)
+        if left is None or right is None:
+            return node
+        if left.value_type == ValueType.STRING or right.value_type == ValueType.STRING:
+            if node.op == OpType.ADD and left.value_type == right.value_type:
+                return _string(left.value + right.value)
+            return node
+
+        a, b = float(left.value), float(right.value)
+        folded = None
+        if node.op == OpType.ADD:
+            folded = _number(a + b)
+        elif node.op == OpType.SUB:
+            folded = _number(a - b)
+        elif node.op == OpType.MUL:
+            folded = _number(a * b)
+        elif node.op == OpType.DIV:
+            if b != 0:
+                folded = _number(a / b)
+        elif node.op == OpType.MOD:
+            if a >= 0 and b > 0 and a.is_integer() and b.is_integer():
+                folded = _number(a % b)
+        return folded or node
+
+    def transform_ExpressionNode(self, node: ExpressionNode) -> Node:
+        left, right = constant(node.left), constant(node.right)
+        if left is None or right is None or \
+                left.value_type != ValueType.NUMBER or right.value_type != ValueType.NUMBER:
+            return node
+
+        a, b = float(left.value), float(right.value)
+        if node.op == OpType.EQUALS:
+            result = a == b
+        elif node.op == OpType.NOTEQUALS:
+            result = a != b
+        elif node.op == OpType.LT:
+            result = a < b
+        elif node.op == OpType.LTEQ:
+            result = a <= b
+        elif node.op == OpType.GT:
+            result = a > b
+        elif node.op == OpType.GTEQ:
+            result = a >= b
+        elif node.op == OpType.AND:
+            result = a != 0 and b != 0
+        elif node.op == OpType.OR:
+            result = a != 0 or b != 0
+        else:
+            return node
+        return _number(1.0 if result else 0.0)
+
+
+class ConstantPropagator(Transformer):
+    """
+    Replaces reads of const globals with their value, so the folder can fold expressions using them
+    Only consts declared at top level with a value that folds to a literal are propagated. Names declared again
+    anywhere inside a statement are not replaced in that statement (the code generator resolves them)
+    """
+
+    def __init__(self):
+        self.constants: {str: ValueNode} = {}
+        self._skip_names: {str} = set()
+        self._skip_nodes: {int} = set()
+
+    def transform(self, root: Node) -> Node:
+        node = root
+        if self.constants:
+            self._scan(root)
+            node = super().transform(root)
+        if type(root) is AssignmentNode and not root.modify:
+            # Top level declaration, a const with a literal value is propagated into the following statements
+            value = constant(ConstantFolder().transform(node.right)) if root.is_const else None
+            if value is not None:
+                self.constants[root.left.value] = value
+            else:
+                self.constants.pop(root.left.value, None)
+        return node
+
+    def _scan(self, root: Node) -> None:
+        # Assignment targets and procedure names are not reads, names declared below top level shadow the consts
+        self._skip_names = set()
+        self._skip_nodes = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if type(node) is AssignmentNode:
+                self._skip_nodes.add(id(node.left))
+                if not node.modify and node is not root:
+                    # let, the target is the identifier token
+                    self._skip_names.add(node.left.value)
+            elif type(node) in (ProcSubNode, ProcFuncNode):
+                self._skip_nodes.add(id(node.left))
+                self._skip_names.update(arg.value for arg in node.args)
+            stack.extend(_children(node))
+
+    def _value(self, node: ValueNode) -> Optional[ValueNode]:
+        if node.value_type != ValueType.IDENTIFIER or id(node) in self._skip_nodes \
+                or node.value in self._skip_names:
+            return None
+        return self.constants.get(node.value)
+
+    def transform_ValueNode(self, node: ValueNode) -> Node:
+        return self._value(node) or node
+
+    def transform_UnaryNode(self, node: UnaryNode) -> Node:
+        value = self._value(node)
+        if value is None or value.value_type != ValueType.NUMBER or node.sign not in ('-', '+'):
+            return node
+        return _number(-value.value if node.sign == '-' else value.value) or node
+
+
+class TreeShaker(Transformer):
+    """
+    Removes the definitions of procedures the program never calls
+    The program (all top level statements outside of procedures) calls procedures, which call further procedures.
+    A procedure defined inside another procedure keeps the outer one alive. Any other use of a procedure's name
+    (i.e. as a value) counts as a call
+    """
+
+    def __init__(self):
+        self.removed: [str] = []
+        self._removed: {str} = set()
+
+    def shake(self, statements: [Node]) -> [Node]:
+        """
+        Remove unused procedures
+        :param statements: Top level statements of the program
+        :return: Statements without the definitions of unused procedures (the given ones are not modified)
+        """
+        calls: {Optional[str]: {str}} = {None: set()}
+        owners: {str: {Optional[str]}} = {}
+        stack = [(statement, None) for statement in statements]
+        while stack:
+            node, owner = stack.pop()
+            cls = type(node)
+            if cls is ProcSubNode or cls is ProcFuncNode:
+                name = node.left.value
+                owners.setdefault(name, set()).add(owner)
+                calls.setdefault(name, set())
+                stack.extend((child, name) for child in _children(node) if child is not node.left)
+                continue
+            if cls is CallNode:
+                calls[owner].add(node.type.value)
+            elif isinstance(node, ValueNode):
+                if node.value_type == ValueType.IDENTIFIER:
+                    calls[owner].add(node.value)
+                elif node.value_type == ValueType.ARRAYELEMENT:
+                    calls[owner].add(node.identifier)
+            stack.extend((child, owner) for child in _children(node))
+
+        used: {Optional[str]} = {None}
+        pending = [None]
+        while pending:
+            name = pending.pop()
+            # Callees, and the procedures the definitions of name are nested in
+            for other in list(calls[name]) + list(owners.get(name, ())):
+                if other not in used and (other is None or other in calls):
+                    used.add(other)
+                    pending.append(other)
+
+        self.removed = sorted(name for name in calls if name not in used)
+        self._removed = set(self.removed)
+        if not self._removed:
+            return statements
+        shaken = [self.transform(statement) for statement in statements]
+        return [statement for statement in shaken if statement is not None]
+
+    def _transform_proc(self, node: Union[ProcSubNode, ProcFuncNode]) -> Optional[Node]:
+        return None if node.left.value in self._removed else node
+
+    transform_ProcSubNode = _transform_proc
+    transform_ProcFuncNode = _transform_proc
+
+
+# Builtins without side effects, their result only depends on the argument (array creates a new array each time)
+PURE_BUILTINS = frozenset(['len', 'argtype'])
+BUILTINS = PURE_BUILTINS | {'print', 'array'}
+
+
+class _Substitution(Transformer):
+    # Replaces the given expression nodes (by id), the nodes must not contain each other
+
+    def __init__(self, nodes: {int: Node}):
+        self.nodes = nodes
+
+    def _substitute(self, node: Node) -> Node:
+        return self.nodes.get(id(node), node)
+
+    transform_TermNode = _substitute
+    transform_ExpressionNode = _substitute
+    transform_CallNode = _substitute
+    transform_ValueNode = _substitute
+
+
+class LoopInvariantMotion(Transformer):
+    """
+    Computes expressions whose value does not change inside a loop once in front of it
+    An expression is invariant if it only reads variables the loop never assigns or declares, elements of arrays
+    the loop never stores to, literals and the pure builtins len and argtype. Each invariant expression is assigned
+    to a compiler temporary in the loop's preheader (run once in front of the loop head) and the loop reads the
+    temporary instead. Expressions the loop evaluates in every pass before any output or exit (the condition of a
+    for loop, the statements of a repeat loop in front of the first print, exit or return, and its condition if
+    there is none) are always moved, others only if their evaluation cannot fail (no division, modulo, builtin call
+    or array element). Loops that call procedures are kept, the procedures may assign globals
+    """
+
+    def __init__(self):
+        # Number of temporaries, their names are no identifiers of the language
+        self.temporaries = 0
+        # Names assigned in the loop being transformed
+        self._assigned_names: {str} = set()
+
+    def transform_LoopNode(self, node: LoopNode) -> Node:
+        assigned = self._assigned(node)
+        if assigned is None:
+            return node
+        self._assigned_names = assigned
+        candidates: [Node] = []
+        if node.condition_pos == ConditionPos.TOP:
+            self._expressions(node.left[1], True, candidates)
+            regions = [(node.right, False)]
+        else:
+            # Moved expressions may fail in front of the loop, that must not skip output or an exit of the loop
+            stops = [i for i, statement in enumerate(node.right) if self._stops(statement)]
+            first_stop = stops[0] if stops else len(node.right)
+            regions = [(node.right[:first_stop], True), (node.right[first_stop:], False)]
+            if stops and type(node.right[first_stop]) is CallNode:
+                # The arguments are evaluated before the call prints
+                for arg in node.right[first_stop].args:
+                    self._expressions(arg, True, candidates)
+                regions[1] = (node.right[first_stop + 1:], False)
+            if node.left:
+                self._expressions(node.left, not stops, candidates)
+        for statements, always in regions:
+            for statement in statements:
+                self._statement(statement, always, candidates)
+
+        temporaries: {tuple: ValueNode} = {}
+        nodes: {int: Node} = {}
+        preheader = []
+        for expression in candidates:
+            key = _key(expression)
+            temporary = temporaries.get(key)
+            if temporary is None:
+                name = '.inv{n}'.format(n=self.temporaries)
+                self.temporaries += 1
+                temporary = temporaries[key] = ValueNode(ValueType.IDENTIFIER)
+                temporary.value = name
+                assignment = AssignmentNode()
+                assignment.left = Token(TokenType.IDENTIFIER, 0, name)
+                assignment.right = expression
+                preheader.append(assignment)
+            nodes[id(expression)] = temporary
+        if not nodes:
+            return node
+        node = _Substitution(nodes).transform(node)
+        return replace(node, preheader=preheader + node.preheader)
+
+    @staticmethod
+    def _assigned(node: LoopNode) -> {str}:
+        # Names the loop assigns or declares (arrays with stored elements), None if the loop calls procedures
+        assigned = set()
+        stack = _children(node)
+        while stack:
+            child = stack.pop()
+            cls = type(child)
+            if cls is AssignmentNode:
+                target = child.left
+                # let declares the identifier token, modifications assign a value or array element
+                if type(target) is ValueNode and target.value_type == ValueType.ARRAYELEMENT:
+                    assigned.add(target.identifier)
+                else:
+                    assigned.add(target.value)
+            elif cls is CallNode:
+                if child.type.value.lower() not in BUILTINS:
+                    return None
+            elif cls in (ProcSubNode, ProcFuncNode, ExternApiNode, ImportNode):
+                return None
+            stack.extend(_children(child))
+        return assigned
+
+    @staticmethod
+    def _stops(statement: Node) -> bool:
+        # Statement exits the loop or has an effect (calls a builtin that is not pure, i.e. print)
+        stack = [statement]
+        while stack:
+            node = stack.pop()
+            cls = type(node)
+            if cls is ExitNode or cls is ProcSubReturnNode or \
+                    (cls is CallNode and node.type.value.lower() not in PURE_BUILTINS):
+                return True
+            stack.extend(_children(node))
+        return False
+
+    def _statement(self, statement: Node, always: bool, candidates: [Node]):
+        # Expressions of a statement, always: the statement runs in every pass of the loop
+        cls = type(statement)
+        if cls is AssignmentNode:
+            self._expressions(statement.right, always, candidates)
+        elif cls is CallNode:
+            for arg in statement.args:
+                self._expressions(arg, always, candidates)
+        elif cls is ProcSubReturnNode:
+            if statement.ret_arg is not None:
+                self._expressions(statement.ret_arg, always, candidates)
+        elif cls is IfNode:
+            self._expressions(statement.left, always, candidates)
+            branches = [statement.right, statement.elsenode or []]
+            for elifnode in statement.elseifnodes or ():
+                self._expressions(elifnode.left, False, candidates)
+                branches.append(elifnode.right)
+            for branch in branches:
+                for child in branch:
+                    self._statement(child, False, candidates)
+        elif cls is LoopNode:
+            # Loops inside were handled first, their preheader runs in every pass of this loop
+            for child in statement.preheader:
+                self._statement(child, always, candidates)
+            if statement.condition_pos == ConditionPos.TOP:
+                self._statement(statement.left[0], always, candidates)
+                self._expressions(statement.left[1], always, candidates)
+            elif statement.left:
+                self._expressions(statement.left, False, candidates)
+            for child in statement.right:
+                self._statement(child, False, candidates)
+
+    def _expressions(self, node: Node, always: bool, candidates: [Node]):
+        # Largest invariant subexpressions worth a temporary, array indexes are not replaced (the code generator
+        # emits them depending on their type)
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            cls = type(node)
+            if cls is TermNode or cls is ExpressionNode or cls is CallNode or \
+                    (cls is ValueNode and node.value_type == ValueType.ARRAYELEMENT):
+                if self._invariant(node, self._assigned_names) and (always or self._safe(node)):
+                    candidates.append(node)
+                elif cls is CallNode:
+                    stack.extend(reversed(node.args))
+                elif cls is not ValueNode:
+                    stack.extend((node.right, node.left))
+
+    def _invariant(self, node: Node, assigned: {str}) -> bool:
+        cls = type(node)
+        if cls is TermNode or cls is ExpressionNode:
+            return self._invariant(node.left, assigned) and self._invariant(node.right, assigned)
+        if cls is CallNode:
+            return node.type.value.lower() in PURE_BUILTINS and len(node.args) == 1 and \
+                self._invariant(node.args[0], assigned)
+        if cls is ValueNode or cls is UnaryNode:
+            if node.value_type in (ValueType.NUMBER, ValueType.STRING):
+                return True
+            if node.value_type == ValueType.IDENTIFIER:
+                return node.value not in assigned
+            if node.value_type == ValueType.ARRAYELEMENT:
+                return node.identifier not in assigned and self._invariant(node.index, assigned)
+        return False
+
+    @staticmethod
+    def _safe(node: Node) -> bool:
+        # Evaluation cannot fail on the VM
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            cls = type(node)
+            if cls is CallNode or (cls is TermNode and node.op in (OpType.DIV, OpType.MOD)) or \
+                    (cls is ValueNode and node.value_type == ValueType.ARRAYELEMENT):
+                return False
+            stack.extend(_children(node))
+        return True
+
+
+def _key(node: Node) -> tuple:
+    # Structural key of an expression, equal expressions share a temporary
+    if type(node) is CallNode:
+        return CallNode, node.type.value.lower(), tuple(_key(arg) for arg in node.args)
+    return (type(node),) + tuple(_key(value) if _is_node(value) else value
+                                 for value in (getattr(node, name, None) for name in slot_names(type(node)))
+                                 if type(value) is not list)
+
+
+# Passes per optimization level, in order
+PASSES = [
+    (1, ConstantPropagator),
+    (1, ConstantFolder),
+    (2, LoopInvariantMotion),
+]
+
+
+class Optimizer:
+    """
+    Runs the passes of an optimization level over the statements of a program, in program order
+    Passes are created once per program and may keep state between statements. Whole program passes (tree shaking)
+    run in optimize_program only
+    """
+
+    def __init__(self, level: int = DEFAULT_OPT_LEVEL, tree_shaking: bool = True):
+        self.level: int = level
+        self.passes: [Transformer] = [cls() for pass_level, cls in PASSES if pass_level <= level]
+        self.tree_shaker: Optional[TreeShaker] = TreeShaker() if tree_shaking and level >= 1 else None
+
+    def optimize_program(self, statements: [Node]) -> [Node]:
+        """
+        Run the whole program passes over all top level statements
+        :param statements: Statements
+        :return: Statements for code generation, still to be optimized one by one
+        """
+        if self.tree_shaker is not None:
+            statements = self.tree_shaker.shake(statements)
+        return statements
+
+    def optimize(self, statement: Node) -> Node:
+        """
+        Run all passes over the next statement of the program
+        :param statement: Statement
+        :return: Optimized statement (the given statement is not modified)
+        """
+        for p in self.passes:
+            statement = p.transform(statement)
+        return statement
@@ -1,12 +1,18 @@
 import abc
 import enum
 import os
-import re
-from typing import Union
+import time
+from typing import Optional, Union, TYPE_CHECKING
 
-import yaml
+from esc.config import load_config
+from esc.index import FileIndex, file_index
+from esc.scanner import TokenType, Token, TokenStream, SCANNERS, ScanWrongTokenException
+from esc import sourcemap
+from esc.sourcemap import SourceFile, SourceMap
 
-from esc.scanner import Scanner, TokenType, Token
+if TYPE_CHECKING:
+    # Imported on demand only, the CLI does not need them for every run (see Parser._parse_modules)
+    from esc.cache import ModuleCache
 
 
 class ValueType(enum.Enum):
@@ -41,10 +47,13 @@ class ConditionPos(enum.Enum):
 
 
 class Node(abc.ABC):
-    pass
+    # AST nodes are slotted (no per instance __dict__), every subclass lists the attributes it adds
+    __slots__ = ()
 
 
 class Binary(Node):
+    __slots__ = ('left', 'right')
+
     def __init__(self):
         super().__init__()
         self.left = None
@@ -52,22 +61,28 @@ class Binary(Node):
 
 
 class Unary(Node):
+    __slots__ = ('value',)
+
     def __init__(self):
         super().__init__()
         self.value = None
 
 
 class StatementNode(Binary):
-    pass
+    __slots__ = ()
 
 
 class ExpressionNode(Binary):
+    __slots__ = ('op',)
+
     def __init__(self):
         super().__init__()
         self.op = OpType.NONE
 
 
 class AssignmentNode(Binary):
+    __slots__ = ('modify', 'is_const')
+
     def __init__(self, modify: bool = False):
         super().__init__()
         self.modify = modify
@@ -75,6 +90,8 @@ class AssignmentNode(Binary):
 
 
 class IfNode(Binary):
+    __slots__ = ('elsenode', 'elseifnodes')
+
     def __init__(self):
         super().__init__()
         self.elsenode = None
@@ -82,6 +99,8 @@ class IfNode(Binary):
 
 
 class CallNode(Unary):
+    __slots__ = ('type', 'args')
+
     def __init__(self):
         super().__init__()
         self.type = ''
@@ -89,41 +108,57 @@ class CallNode(Unary):
 
 
 class ExitNode(Unary):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class ArrayNode(Unary):
+    __slots__ = ('values',)
+
     def __init__(self):
         super().__init__()
         self.values = []
 
 
 class ProcSubNode(Binary):
+    __slots__ = ('args',)
+
     def __init__(self):
         super().__init__()
         self.args = []
 
 
 class ProcFuncNode(Binary):
+    __slots__ = ('args',)
+
     def __init__(self):
         super().__init__()
         self.args = []
 
 
 class ProcSubReturnNode(Unary):
+    __slots__ = ('ret_arg',)
+
     def __init__(self):
         super().__init__()
         self.ret_arg = None
 
 
 class LoopNode(Binary):
+    __slots__ = ('condition_pos', 'preheader')
+
     def __init__(self):
         super().__init__()
         self.condition_pos = ConditionPos.TOP
+        # Statements run once in front of the loop head (see esc.optimizer.LoopInvariantMotion)
+        self.preheader = []
 
 
 class ExternApiNode(Unary):
+    __slots__ = ('node_type', 'identifier')
+
     def __init__(self, node_type: str = '', node_identifier: str = ''):
         super().__init__()
         self.node_type: str = node_type
@@ -131,18 +166,24 @@ class ExternApiNode(Unary):
 
 
 class ImportNode(Unary):
+    __slots__ = ('file',)
+
     def __init__(self, file: str = ''):
         super().__init__()
         self.file = file
 
 
 class TermNode(Binary):
+    __slots__ = ('op',)
+
     def __init__(self):
         super().__init__()
         self.op = OpType.NONE
 
 
 class ValueNode(Unary):
+    __slots__ = ('value_type', 'identifier', 'index')
+
     def __init__(self, value_type: ValueType):
         super().__init__()
         self.value_type = value_type
@@ -151,6 +192,8 @@ class ValueNode(Unary):
 
 
 class UnaryNode(ValueNode):
+    __slots__ = ('sign',)
+
     def __init__(self, value_type: ValueType):
         super().__init__(value_type=value_type)
         self.sign = '+'
@@ -160,20 +203,157 @@ class ParseSyntaxException(Exception):
     pass
 
 
+class ImportCycleException(ParseSyntaxException):
+    pass
+
+
+class Module:
+    def __init__(self, name: str, source: SourceFile):
+        # Parsed file, name is the file path (empty for the parsed input string)
+        self.name: str = name
+        self.source: SourceFile = source
+        self.source_map: SourceMap = SourceMap()
+        self.statements: [StatementNode] = []
+        self.import_names: [str] = []
+        self.imports: [Module] = []
+        # Costs: scanning and parsing time in seconds (0 if taken from the module cache)
+        self.parse_time: float = 0.0
+        self.cached: bool = False
+
+
+class ImportGraph:
+    """
+    Import graph of a parsed script, every module is a node and every import an edge
+    """
+
+    def __init__(self, root: Module):
+        self.root: Module = root
+
+    def order(self) -> [Module]:
+        """
+        Modules in topological order, every module after its imports and the script itself last
+        Later imports of a module go first (the order in which imported files used to be pasted into the script)
+        :return: Modules, each one once
+        """
+        order = []
+        done = set()
+        path = []
+
+        def visit(module: Module):
+            if module in done:
+                return
+            if module in path:
+                cycle = path[path.index(module):] + [module]
+                raise ImportCycleException('PARSER ERROR,Import cycle {c}'.format(
+                    c=' -> '.join(m.name for m in cycle)))
+            path.append(module)
+            for imported in reversed(module.imports):
+                visit(imported)
+            path.pop()
+            done.add(module)
+            order.append(module)
+
+        visit(self.root)
+        return order
+
+    def dependencies(self, module: Module = None) -> [Module]:
+        """
+        All modules a module pulls in (directly or indirectly), in topological order
+        :param module: Module, defaults to the script
+        :return: Modules
+        """
+        module = module if module is not None else self.root
+        return [m for m in ImportGraph(module).order() if m is not module]
+
+    def report(self) -> [dict]:
+        """
+        Cost of every module in topological order
+        :return: One dict per module with name, imports, chars, lines, statements, parse_time and cached
+        """
+        return [{'name': m.name,
+                 'imports': [i.name for i in m.imports],
+                 'chars': len(m.source.text),
+                 'lines': m.source.text.count('\n'),
+                 'statements': len(m.statements),
+                 'parse_time': m.parse_time,
+                 'cached': m.cached} for m in self.order()]
+
+
 class Parser:
-    def __init__(self, stdlib_dir: str = ''):
-        self._scanner = Scanner()
+    # Binary operators of expressions: token type -> (precedence, node class, op), all levels are right associative
+    # 'not' (op NONE) joins two comparisons and is not chained
+    BINARY_OPERATORS = {
+        TokenType.LOG_OR: (1, ExpressionNode, OpType.OR),
+        TokenType.LOG_AND: (2, ExpressionNode, OpType.AND),
+        TokenType.LOG_NOT: (3, ExpressionNode, OpType.NONE),
+        TokenType.EQUALS: (4, ExpressionNode, OpType.EQUALS),
+        TokenType.REL_NOTEQ: (4, ExpressionNode, OpType.NOTEQUALS),
+        TokenType.REL_GT: (4, ExpressionNode, OpType.GT),
+        TokenType.REL_GTEQ: (4, ExpressionNode, OpType.GTEQ),
+        TokenType.REL_LT: (4, ExpressionNode, OpType.LT),
+        TokenType.REL_LTEQ: (4, ExpressionNode, OpType.LTEQ),
+        TokenType.PLUS: (5, TermNode, OpType.ADD),
+        TokenType.MINUS: (5, TermNode, OpType.SUB),
+        TokenType.MODULO: (6, TermNode, OpType.MOD),
+        TokenType.MULTIPLY: (7, TermNode, OpType.MUL),
+        TokenType.DIVIDE: (7, TermNode, OpType.DIV),
+    }
+
+    # Minimal source size of the modules of one import level to parse them in worker processes
+    PARALLEL_MIN_CHARS = 64 * 1024
+
+    def __init__(self, stdlib_dir: str = '', scanner: str = 'table', index: FileIndex = None,
+                 cache: 'ModuleCache' = None, jobs: Optional[int] = None):
+        # scanner selects the tokenizer engine, see esc.scanner.SCANNERS
+        # index resolves imported file names (defaults to the process wide index of the configured index_file)
+        # cache holds parsed imported modules (optional)
+        # jobs is the number of processes parsing imported modules (None: all cores, 1: serial)
+        self._index = index
+        self._cache = cache
+        self._scanner_name = scanner
+        self.jobs = jobs if jobs is not None else (os.cpu_count() or 1)
+        # Modules (or their load errors) parsed ahead of _load_imports, by file path
+        self._prepared: {str: Union[Module, Exception]} = {}
+        self._scanner_cls = SCANNERS[scanner]
+        self._scanner = self._scanner_cls()
+        self._tokens: TokenStream = TokenStream(self._scanner)
+        # Maps offsets of the scanned (cleaned) string back to the source file
+        self._source_map: SourceMap = SourceMap()
         self._cur_token = None
         self._prev_token = None
         self._statements: [StatementNode] = []
         self._loops = 0
         self._cur_proc_is_func: bool = False
         self.lib_dir = stdlib_dir
+        # Loaded modules by file path and the import graph of the last parsed script
+        self.modules: {str: Module} = {}
+        self.graph: Optional[ImportGraph] = None
 
-    def _next_token(self, peek: bool = False):
+    def _next_token(self):
         if self._cur_token is not None:
             self._prev_token = self._cur_token
-        return self._scanner.next_token(peek)
+        try:
+            return self._tokens.advance()
+        except ScanWrongTokenException as e:
+            raise self._located(e, self._scanner.char_offset) from None
+
+    def _peek_token(self, k: int = 1):
+        # k-th token after the current token (buffered, never scanned twice)
+        try:
+            return self._tokens.peek(k - 1)
+        except ScanWrongTokenException as e:
+            raise self._located(e, self._scanner.char_offset) from None
+
+    def _located(self, e: Exception, char_offset: int) -> Exception:
+        # Same exception type, message extended by file:line:column of the source file
+        location = self._source_map.locate(char_offset)
+        located = type(e)('{m},{loc}'.format(m=e, loc=location))
+        located.location = location
+        return located
+
+    def _scan(self, clean_str: str):
+        self._scanner.scan_str(clean_str)
+        self._tokens = TokenStream(self._scanner)
 
     @staticmethod
     def _clean_string(s: str):
@@ -182,55 +362,142 @@ class Parser:
             lines[ln] = ''.join(lines[ln])
         return '\n'.join(lines) + '\n'
 
-    def parse(self, input_str: str) -> [StatementNode]:
-        # Parse given input string
+    def parse(self, input_str: str, file_name: str = '') -> [StatementNode]:
+        # Parse given input string, file_name is only used for error locations
+        # Every imported file is parsed once into its own module (see _parse_module), the statements of the imported
+        # modules are merged in front of the statements of the importing file, each module only once
+        self.modules = {}
+        module = Module(file_name, SourceFile(file_name, input_str))
+        start = time.perf_counter()
+        self._parse_module(module)
+        module.parse_time = time.perf_counter() - start
+        if self.jobs > 1:
+            self._prepare_imports(module)
+        try:
+            self._load_imports(module)
+        finally:
+            self._prepared = {}
+        self.graph = ImportGraph(module)
+        statements = []
+        for m in self.graph.order():
+            statements.extend(m.statements)
+        return statements
+
+    def _parse_module(self, module: Module) -> None:
         # We perform some string cleaning and whitespace removing before actually passing the raw string to the scanner
-        clean_str: str = self._clean_string(input_str)
+        # (see _clean_string), the source map keeps the offsets into the module's file
+        clean_str, self._source_map = sourcemap.clean(module.source.text, SourceMap.of(module.source))
+        module.source_map = self._source_map
 
-        self._scanner.scan_str(clean_str)
-        self._cur_token: Token = self._next_token()
+        self._scanner = self._scanner_cls()
+        self._cur_token = None
+        self._prev_token = None
         self._statements: [StatementNode] = []
+        self._scan(clean_str)
+        self._cur_token: Token = self._next_token()
 
         # Import statements
-        imports = []
         while self._cur_token not in [None, TokenType.EOF] and self._cur_token.ttype == TokenType.IMPORT:
-            imports.append(self._parse_import())
-
-        # Remove import statements from clean_str
-        clean_str = re.sub(r'import +\"[^\"]+\"', ' ', clean_str, flags=re.MULTILINE)
-
-        if imports:
-            with open('config.yml') as file:
-                C_CONFIG = yaml.load(file, Loader=yaml.FullLoader)
-            for i_file in imports:
-                base_file = os.path.splitext(os.path.basename(i_file.file))[0]
-                # Walk through all dirs (and config.additional_dirs) if file found there
-                found_file = False
-                dirs = [self.lib_dir]
-                dirs.extend(C_CONFIG['script_dirs'])
-                for d in dirs:
-                    for (dirpath, dirnames, filenames) in os.walk(d):
-                        for filename in filenames:
-                            c_filename = os.path.splitext(filename)[0]
-                            if not found_file and c_filename == base_file:
-                                found_file = True
-                                with open(os.sep.join([dirpath, filename]), 'r') as f:
-                                    clean_str = self._clean_string(f.read()) + clean_str
-                                break
-                    if found_file:
-                        break
-                if not found_file:
-                    raise FileNotFoundError('File {f} not found'.format(f=base_file))
-
-            return self.parse(clean_str)
+            module.import_names.append(self._parse_import().file)
+
+        if self._cur_token is not None:
+            module.statements = self._parse_statements()
+            if self._cur_token is not None and self._cur_token.ttype == TokenType.IMPORT:
+                self._fail('Imports must precede all statements')
+
+    def _load_imports(self, module: Module) -> None:
+        # Load imported modules after the module's own tokens are consumed, each file is parsed only once
+        for name in module.import_names:
+            file_path = self._find_module(name)
+            if file_path not in self.modules:
+                self._load_module(file_path)
+            module.imports.append(self.modules[file_path])
+
+    def _load_module(self, file_path: str) -> None:
+        if file_path in self._prepared:
+            # Parsed ahead, errors are raised at the same point as in a serial parse
+            prepared = self._prepared[file_path]
+            if isinstance(prepared, Exception):
+                raise prepared
+            self.modules[file_path] = prepared
+            self._load_imports(prepared)
+            return
+        with open(file_path, 'r') as f:
+            module = Module(file_path, SourceFile(file_path, f.read()))
+        self.modules[file_path] = module
+        # Unchanged files are taken from the module cache without scanning and parsing
+        module.cached = self._cache is not None and self._cache.load(module)
+        if not module.cached:
+            start = time.perf_counter()
+            self._parse_module(module)
+            module.parse_time = time.perf_counter() - start
+            if self._cache is not None:
+                self._cache.store(module)
+        self._load_imports(module)
+
+    def _prepare_imports(self, root: Module) -> None:
+        # Parse all modules reachable from root level by level, the modules of a level are independent of each other
+        # and are parsed in worker processes (see _parse_modules). _load_imports links them afterwards in the serial
+        # order, so the merged statements and the raised errors are the same as in a serial parse
+        level = [root]
+        while level:
+            loaded = []
+            for module in level:
+                for name in module.import_names:
+                    try:
+                        file_path = self._find_module(name)
+                        if file_path in self._prepared:
+                            continue
+                        with open(file_path, 'r') as f:
+                            imported = Module(file_path, SourceFile(file_path, f.read()))
+                    except OSError:
+                        # Raised again by _load_imports
+                        continue
+                    self._prepared[file_path] = imported
+                    imported.cached = self._cache is not None and self._cache.load(imported)
+                    loaded.append(imported)
+            self._parse_modules([m for m in loaded if not m.cached])
+            level = [m for m in loaded if self._prepared[m.name] is m]
+
+    def _parse_modules(self, modules: [Module]) -> None:
+        # Parse independent modules, in worker processes if worth it, errors are kept in _prepared
+        if len(modules) > 1 and sum(len(m.source.text) for m in modules) >= self.PARALLEL_MIN_CHARS:
+            import concurrent.futures
+            from esc.cache import load_module
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.jobs, len(modules))) as pool:
+                results = pool.map(_parse_module_worker, [(m.name, m.source.text, self._scanner_name) for m in modules])
+                for module, (data, parse_time) in zip(modules, results):
+                    if isinstance(data, Exception):
+                        self._prepared[module.name] = data
+                    else:
+                        load_module(module, data)
+                        module.parse_time = parse_time
         else:
-            self._scanner = Scanner()
-            self._cur_token = None
-            self._prev_token = None
-            self._statements: [StatementNode] = []
-            self._scanner.scan_str(clean_str)
-            self._cur_token: Token = self._next_token()
-            return self._parse_statements()
+            for module in modules:
+                start = time.perf_counter()
+                try:
+                    self._parse_module(module)
+                except Exception as e:
+                    self._prepared[module.name] = e
+                module.parse_time = time.perf_counter() - start
+        if self._cache is not None:
+            for module in modules:
+                if self._prepared[module.name] is module:
+                    self._cache.store(module)
+
+    def _find_module(self, name: str) -> str:
+        # Path of the imported file name (without extension) in the stdlib dir or the configured script dirs
+        config = load_config()
+        if self._index is None:
+            self._index = file_index(config.get('index_file') or '')
+        base_file = os.path.splitext(os.path.basename(name))[0]
+        # Search the stdlib dir first, then all script dirs
+        dirs = [self.lib_dir]
+        dirs.extend(config['script_dirs'] or [])
+        file_path = self._index.find(dirs, base_file, stem=True)
+        if file_path is not None:
+            return file_path
+        raise FileNotFoundError('File {f} not found'.format(f=base_file))
 
     def _accept(self, ttype: TokenType):
         if self._cur_token is not None:
@@ -246,7 +513,11 @@ class Parser:
             char_offset = self._cur_token.meta_cn
         except AttributeError:
             char_offset = self._scanner.char_offset
-        raise ParseSyntaxException('PARSER ERROR,{msg},{cn}'.format(msg=msg, cn=char_offset))
+        # cn is the character offset into the source file, followed by file:line:column
+        location = self._source_map.locate(char_offset)
+        e = ParseSyntaxException('PARSER ERROR,{msg},{cn},{loc}'.format(msg=msg, cn=location.offset, loc=location))
+        e.location = location
+        raise e
 
     def _cur_token_type(self):
         if self._cur_token is not None:
@@ -279,7 +550,8 @@ class Parser:
             elif t == TokenType.LOOP_BREAK:
                 statements.append(self._parse_exit())
             elif t == TokenType.IDENTIFIER:
-                if self._next_token(peek=True).ttype == TokenType.LPARENT:
+                next_token = self._peek_token()
+                if next_token is not None and next_token.ttype == TokenType.LPARENT:
                     statements.append(self._parse_call())
                 else:
                     statements.append(self._parse_lmodify())
@@ -576,114 +848,37 @@ class Parser:
         self._accept(TokenType.STRING)
         return node
 
-    def _parse_expression(self) -> ExpressionNode:
-        node = ExpressionNode()
-        node_tmp = self._parse_andexpr()
-
-        t = self._cur_token_type()
-        while t == TokenType.LOG_OR:
-            self._accept(TokenType.LOG_OR)
-            node.op = OpType.OR
-            node.left = node_tmp
-            node.right = self._parse_expression()
-            return node
-        return node_tmp
-
-    def _parse_andexpr(self) -> ExpressionNode:
-        node = ExpressionNode()
-        node_tmp: ExpressionNode = self._parse_notexpr()
-
-        t = self._cur_token_type()
-        while t == TokenType.LOG_AND:
-            self._accept(TokenType.LOG_AND)
-            node.op = OpType.AND
-            node.left = node_tmp
-            node.right = self._parse_andexpr()
-            return node
-        return node_tmp
-
-    def _parse_notexpr(self):
-        node = ExpressionNode()
-        node_tmp = self._parse_compareexpr()
-
-        t = self._cur_token_type()
-        while t == TokenType.LOG_NOT:
-            self._accept(TokenType.LOG_NOT)
-            node.left = node_tmp
-            node.right = self._parse_compareexpr()
-            return node
-        return node_tmp
-
-    def _parse_compareexpr(self) -> Union[ExpressionNode, TermNode]:
-        node = ExpressionNode()
-        node_tmp = self._parse_addexpr()
+    def _parse_expression(self) -> Union[ExpressionNode, TermNode, ValueNode]:
+        # Precedence climbing over all binary operator levels (see Parser.BINARY_OPERATORS), runs in loops so the
+        # stack depth does not grow with the number of terms
+        operands = [self._parse_negateexpr()]
+        operators = []
 
         t = self._cur_token_type()
-        while t in [TokenType.EQUALS, TokenType.REL_NOTEQ, TokenType.REL_GT, TokenType.REL_GTEQ, TokenType.REL_LT, TokenType.REL_LTEQ]:
-            self._accept(t)
-
-            if t == TokenType.EQUALS:
-                node.op = OpType.EQUALS
-            elif t == TokenType.REL_NOTEQ:
-                node.op = OpType.NOTEQUALS
-            elif t == TokenType.REL_GT:
-                node.op = OpType.GT
-            elif t == TokenType.REL_GTEQ:
-                node.op = OpType.GTEQ
-            elif t == TokenType.REL_LT:
-                node.op = OpType.LT
-            elif t == TokenType.REL_LTEQ:
-                node.op = OpType.LTEQ
-
-            node.left = node_tmp
-            node.right = self._parse_compareexpr()
-            return node
-        return node_tmp
-
-    def _parse_addexpr(self) -> Union[TermNode, ExpressionNode, ValueNode]:
-        node = TermNode()
-        node_tmp = self._parse_modexpr()
-
-        t = self._cur_token_type()
-        while t == TokenType.PLUS or t == TokenType.MINUS:
-            self._accept(t)
-            if t == TokenType.PLUS:
-                node.op = OpType.ADD
-            else:
-                node.op = OpType.SUB
-            node.left = node_tmp
-            node.right = self._parse_addexpr()
-            return node
-        return node_tmp
-
-    def _parse_modexpr(self) -> Union[TermNode, ExpressionNode, ValueNode]:
-        node = TermNode()
-        node_tmp = self._parse_multexpr()
-
-        t = self._cur_token_type()
-        while t == TokenType.MODULO:
+        while t in self.BINARY_OPERATORS:
+            operator = self.BINARY_OPERATORS[t]
+            while operators and operators[-1][0] > operator[0]:
+                self._reduce_expression(operands, operators)
+            if operator[2] == OpType.NONE and operators and operators[-1][2] == OpType.NONE:
+                # 'not' takes only a single right operand
+                break
             self._accept(t)
-            node.op = OpType.MOD
-            node.left = node_tmp
-            node.right = self._parse_modexpr()
-            return node
-        return node_tmp
+            operators.append(operator)
+            operands.append(self._parse_negateexpr())
+            t = self._cur_token_type()
 
-    def _parse_multexpr(self) -> Union[TermNode, ExpressionNode, ValueNode]:
-        node = TermNode()
-        node_tmp = self._parse_negateexpr()
+        while operators:
+            self._reduce_expression(operands, operators)
+        return operands[0]
 
-        t = self._cur_token_type()
-        while t == TokenType.MULTIPLY or t == TokenType.DIVIDE:
-            self._accept(t)
-            if t == TokenType.MULTIPLY:
-                node.op = OpType.MUL
-            else:
-                node.op = OpType.DIV
-            node.left = node_tmp
-            node.right = self._parse_multexpr()
-            return node
-        return node_tmp
+    @staticmethod
+    def _reduce_expression(operands: list, operators: list) -> None:
+        _, node_cls, op = operators.pop()
+        node = node_cls()
+        node.op = op
+        node.right = operands.pop()
+        node.left = operands.pop()
+        operands.append(node)
 
     def _parse_negateexpr(self):
         node = ExpressionNode()
@@ -747,9 +942,22 @@ class Parser:
                     self._accept(TokenType.RSQBRACKET)
                 elif self._cur_token.ttype == TokenType.LPARENT:
                     # Subroutine / function call as rvalue
-                    return self._parse_call(ident=Token(TokenType.IDENTIFIER, value=node.value, cn=self._scanner.char_offset))
+                    return self._parse_call(ident=Token(TokenType.IDENTIFIER, value=node.value, cn=self._cur_token.meta_cn))
             except AttributeError:
                 pass
             return node
         else:
             return None
+
+
+def _parse_module_worker(args: (str, str, str)) -> (Union[bytes, Exception], float):
+    # Parse a single file (in a worker process), returns the serialized module (or the error) and the parse time
+    from esc.cache import dump_module
+    file_path, text, scanner = args
+    module = Module(file_path, SourceFile(file_path, text))
+    start = time.perf_counter()
+    try:
+        Parser(scanner=scanner)._parse_module(module)
+    except Exception as e:
+        return e, 0.0
+    return dump_module(module), time.perf_counter() - start
@@ -0,0 +1,255 @@
+from typing import Optional
+
+from esc.ir import Code, Instruction, Label, Pass
+from esc.opcodes import OP, BRANCHES
+
+# Operations that make the following POPG / PUSHG (POPL / PUSHL) an array element access
+ARRAY_INDEX = frozenset([OP.PUSHA, OP.PUSHAS])
+# Replacements after which the positions of the labels are taken again (see Peephole.follow)
+MAX_EDITS = 256
+# Load and store operation of global and local slots
+LOAD_STORE = {OP.POPG: OP.PUSHG, OP.POPL: OP.PUSHL}
+
+
+class Rule:
+    """
+    Peephole rule over a window of size consecutive elements (instructions and labels) of the code
+    apply returns the replacement of the window or None if the rule does not match. Labels of the window have to be
+    part of the replacement, so instructions behind a jump target are never merged with the ones in front of it
+    """
+    name = ''
+    size = 1
+
+    def apply(self, window: Code, peephole: 'Peephole') -> Optional[list]:
+        raise NotImplementedError
+
+
+class LoadStore(Rule):
+    """
+    POPG x, PUSHG x: storing a slot's value back into the slot does nothing (same for locals)
+    """
+    name = 'load-store'
+    size = 2
+
+    def apply(self, window, peephole):
+        load, store = window
+        if load.op in LOAD_STORE and LOAD_STORE[load.op] is store.op and load.arg1 == store.arg1 and \
+                (peephole.prev is None or peephole.prev.op not in ARRAY_INDEX):
+            return []
+        return None
+
+
+class StoreLoadStore(Rule):
+    """
+    PUSHG x, POPG x, PUSHG x: the second store writes the value just stored (same for locals)
+    """
+    name = 'store-load-store'
+    size = 3
+
+    def apply(self, window, peephole):
+        store, load, again = window
+        if load.op in LOAD_STORE and LOAD_STORE[load.op] is store.op is again.op and \
+                store.arg1 == load.arg1 == again.arg1 and \
+                (peephole.prev is None or peephole.prev.op not in ARRAY_INDEX):
+            return [store]
+        return None
+
+
+class JumpThreading(Rule):
+    """
+    JMP / JZ (or a fused compare and jump) to a JMP jumps to the final target directly
+    """
+    name = 'jump-threading'
+
+    def apply(self, window, peephole):
+        jump = window[0]
+        if jump.op is not OP.JMP and jump.op not in BRANCHES:
+            return None
+        label = jump.target
+        seen = {label}
+        target = peephole.follow(label)
+        while target is not None and target.op is OP.JMP:
+            if target.target in seen:
+                # Endless loop
+                return None
+            label = target.target
+            seen.add(label)
+            target = peephole.follow(label)
+        if label is jump.target:
+            return None
+        return [Instruction(jump.op, target=label)]
+
+
+class InvertedBranch(Rule):
+    """
+    JZ L1, JMP L2, L1: becomes NOT, JZ L2, L1
+    """
+    name = 'jz-over-jmp'
+    size = 3
+
+    def apply(self, window, peephole):
+        jz, jmp, after = window
+        if jz.op is OP.JZ and type(after) is Label and jz.target is after and jmp.op is OP.JMP:
+            return [Instruction(OP.NOT), Instruction(OP.JZ, target=jmp.target), after]
+        return None
+
+
+class NegLiteral(Rule):
+    """
+    PUSH c, NEG: becomes PUSH -c
+    """
+    name = 'neg-literal'
+    size = 2
+
+    def apply(self, window, peephole):
+        push, neg = window
+        if push.op is OP.PUSH and push.target is None and neg.op is OP.NEG:
+            return [Instruction(OP.PUSH, -push.arg1)]
+        return None
+
+
+class JumpToNext(Rule):
+    """
+    JMP L, L: the jump goes where the code continues anyway
+    """
+    name = 'jump-to-next'
+
+    def apply(self, window, peephole):
+        jump = window[0]
+        if jump.op is OP.JMP and jump.target is not None and peephole.is_next(jump.target):
+            return []
+        return None
+
+
+class Unreachable(Rule):
+    """
+    JMP / JFS, op: an operation behind an unconditional jump or return without a label in front is never executed
+    """
+    name = 'unreachable'
+    size = 2
+
+    def apply(self, window, peephole):
+        jump, op = window
+        if jump.op in (OP.JMP, OP.JFS) and type(op) is not Label:
+            return [jump]
+        return None
+
+
+# Default rules by optimization level, in the order they are tried at each position. Jumps to the next operation
+# and unreachable operations are left behind by inlined procedures (see esc.inliner)
+RULES = [
+    (1, LoadStore),
+    (1, StoreLoadStore),
+    (1, JumpThreading),
+    (1, InvertedBranch),
+    (1, NegLiteral),
+    (2, JumpToNext),
+    (2, Unreachable),
+]
+
+
+class Peephole(Pass):
+    """
+    Peephole optimizer over the intermediate code of a program
+    Rules are applied until none matches anymore. Jumps keep their target labels, so addresses are resolved when the
+    optimized code is encoded
+    """
+    name = 'peephole'
+
+    def __init__(self, rules: [Rule] = None, level: int = 1):
+        self.rules: [Rule] = [cls() for rule_level, cls in RULES if rule_level <= level] if rules is None \
+            else list(rules)
+        # Number of replacements per rule name
+        self.hits: {str: int} = {rule.name: 0 for rule in self.rules}
+        # Instruction in front of the current window (labels skipped)
+        self.prev: Optional[Instruction] = None
+        self._code: Code = []
+        self._position = 0
+        # Positions of the labels, and the replacements (position, size, size change) since they were taken
+        self._positions: Optional[{Label: int}] = None
+        self._edits: [(int, int, int)] = []
+
+    def run(self, code: Code) -> Code:
+        code = self._code = list(code)
+        self._positions = None
+        self._edits = []
+        window = max((rule.size for rule in self.rules), default=1)
+        changed = True
+        while changed:
+            changed = False
+            i = 0
+            while i < len(code):
+                self._position = i
+                self.prev = self._previous(i)
+                for rule in self.rules:
+                    if i + rule.size > len(code):
+                        continue
+                    new = rule.apply(code[i:i + rule.size], self)
+                    if new is not None and self._replace(i, rule.size, new):
+                        self.hits[rule.name] += 1
+                        changed = True
+                        # Earlier windows may match the replacement
+                        i = max(i - window + 1, 0)
+                        break
+                else:
+                    i += 1
+        return code
+
+    def follow(self, label: Label) -> Optional[Instruction]:
+        """
+        Instruction a jump to label continues with
+        :param label: Label
+        :return: Instruction or None (label not placed or at the end of the code)
+        """
+        i = self._find(label)
+        if i is None:
+            return None
+        while i < len(self._code) and type(self._code[i]) is Label:
+            i += 1
+        return self._code[i] if i < len(self._code) else None
+
+    def _find(self, label: Label) -> Optional[int]:
+        # Position of a label. Positions are taken once and moved by the replacements made since then, they are
+        # taken again if a label was part of a replaced window or too many replacements were made
+        code = self._code
+        if self._positions is not None and len(self._edits) <= MAX_EDITS:
+            i = self._positions.get(label)
+            if i is None:
+                return None
+            for start, size, shift in self._edits:
+                if i >= start + size:
+                    i += shift
+                elif i >= start:
+                    break
+            else:
+                if i < len(code) and code[i] is label:
+                    return i
+        self._positions = {element: i for i, element in enumerate(code) if type(element) is Label}
+        self._edits = []
+        return self._positions.get(label)
+
+    def is_next(self, label: Label) -> bool:
+        """
+        Whether label is placed directly behind the instruction at the current position (only labels between)
+        """
+        i = self._position + 1
+        while i < len(self._code) and type(self._code[i]) is Label:
+            if self._code[i] is label:
+                return True
+            i += 1
+        return False
+
+    def _previous(self, i: int) -> Optional[Instruction]:
+        i -= 1
+        while i >= 0 and type(self._code[i]) is Label:
+            i -= 1
+        return self._code[i] if i >= 0 else None
+
+    def _replace(self, i: int, size: int, new: Code) -> bool:
+        kept = set(map(id, new))
+        for element in self._code[i:i + size]:
+            if type(element) is Label and id(element) not in kept:
+                return False
+        self._code[i:i + size] = new
+        self._edits.append((i, size, len(new) - size))
+        return True
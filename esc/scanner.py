@@ -1,5 +1,8 @@
+import codecs
+import collections
 import enum
-from typing import Optional
+import re
+from typing import Iterator, Optional
 
 
 class TokenType(enum.Enum):
@@ -67,6 +70,8 @@ class TokenType(enum.Enum):
 
 
 class Token(object):
+    __slots__ = ('ttype', 'value', 'meta_cn')
+
     def __init__(self, ttype: TokenType, cn: int, value=None):
         self.ttype = ttype
         self.value = value
@@ -83,6 +88,10 @@ class ScanWrongTokenException(Exception):
     pass
 
 
+class ScanUnterminatedStringException(ScanWrongTokenException):
+    pass
+
+
 class Scanner:
     """
     Tokenizer
@@ -105,6 +114,15 @@ class Scanner:
         self._char_offset = 0
         self._cur_char = self._str_stream[self._char_offset]
 
+    def scan_stream(self, source, chunk_size: int = 0) -> None:
+        """
+        Tokenize given file object or buffer
+        The character by character scanner reads the whole source at once (see TableScanner for chunked input)
+        :param source: Text or binary file object, mmap, memoryview, bytes or bytearray (binary input is UTF-8)
+        :param chunk_size: Unused
+        """
+        self.scan_str(''.join(_iter_chunks(source, TableScanner.CHUNK_SIZE)))
+
     def next_token(self, peek: bool = False) -> Optional[Token]:
         """
         Get next available token
@@ -202,6 +220,16 @@ class Scanner:
 
             raise ScanWrongTokenException('Wrong character {c} at {o}'.format(c=self._cur_char, o=self._char_offset))
 
+    def tokens(self) -> Iterator[Token]:
+        """
+        Iterate over all remaining tokens of the stream
+        :return: Token iterator
+        """
+        token = self.next_token()
+        while token is not None:
+            yield token
+            token = self.next_token()
+
     def _advance(self, peek: bool = False) -> None:
         if peek:
             return
@@ -269,7 +297,7 @@ class Scanner:
             self._opening_str = False
             return tmp_str
         else:
-            raise ScanWrongTokenException()
+            raise ScanUnterminatedStringException()
 
     def _scan_identifier_or_keyword(self) -> Token:
         off = 0
@@ -345,3 +373,676 @@ class Scanner:
     @property
     def char_offset(self):
         return self._char_offset
+
+
+class TableScanner(Scanner):
+    """
+    Table driven tokenizer
+    Produces the same token stream as Scanner, but matches whole tokens (including leading whitespace and comments)
+    with a single compiled master expression and looks keywords up in a dict.
+    Anything the master expression cannot decide (EOF, errors, non-ASCII runs) goes through a character class
+    dispatch table instead
+    """
+
+    _KEYWORDS = {
+        'if': TokenType.BLOCK_IF,
+        'or': TokenType.LOG_OR,
+        'to': TokenType.LOOP_TO,
+        'let': TokenType.LET,
+        'and': TokenType.LOG_AND,
+        'mod': TokenType.MODULO,
+        'sub': TokenType.PROC_SUB,
+        'for': TokenType.LOOP_FOR,
+        'then': TokenType.BLOCK_THEN,
+        'else': TokenType.BLOCK_ELSE,
+        'exit': TokenType.LOOP_BREAK,
+        'func': TokenType.PROC_FUNC,
+        'next': TokenType.LOOP_NEXT,
+        'step': TokenType.LOOP_STEP,
+        'endif': TokenType.BLOCK_ENDIF,
+        'until': TokenType.LOOP_UNTIL,
+        'const': TokenType.CONST,
+        'repeat': TokenType.LOOP_REPEAT,
+        'elseif': TokenType.BLOCK_ELSEIF,
+        'endsub': TokenType.PROC_ENDSUB,
+        'return': TokenType.PROC_RETURN,
+        'extern': TokenType.API_EXTERN,
+        'import': TokenType.IMPORT,
+        'forever': TokenType.LOOP_FOREVER,
+        'endfunc': TokenType.PROC_ENDFUNC,
+    }
+
+    _SINGLE_CHAR_TOKENS = {
+        '(': TokenType.LPARENT,
+        ')': TokenType.RPARENT,
+        '+': TokenType.PLUS,
+        '-': TokenType.MINUS,
+        '/': TokenType.DIVIDE,
+        '*': TokenType.MULTIPLY,
+        '%': TokenType.MODULO,
+        '=': TokenType.EQUALS,
+        '!': TokenType.BANG,
+        '[': TokenType.LSQBRACKET,
+        ']': TokenType.RSQBRACKET,
+        ',': TokenType.COMMA,
+    }
+
+    # Character classes
+    _C_ERROR = 0
+    _C_SPACE = 1
+    _C_COMMENT = 2
+    _C_SINGLE = 3
+    _C_LT = 4
+    _C_GT = 5
+    _C_NUMBER = 6
+    _C_STRING = 7
+    _C_IDENTIFIER = 8
+
+    _OPERATORS = dict(_SINGLE_CHAR_TOKENS, **{
+        '<': TokenType.REL_LT,
+        '<=': TokenType.REL_LTEQ,
+        '<>': TokenType.REL_NOTEQ,
+        '>': TokenType.REL_GT,
+        '>=': TokenType.REL_GTEQ,
+    })
+
+    # \s and \w use the same unicode predicates as str.isspace() and str.isalnum()
+    # Fast path: skip whitespace and comments, then match one complete token
+    _RE_TOKEN = re.compile(r'''
+        (?:\s|\#[^\n]*(?:\n|\Z))*
+        (?:
+            (<=|<>|>=|[()+\-/*%=!\[\],<>])    # 1: operators
+          | ([^\W\d]\w*)                       # 2: identifiers and keywords
+          | ([\d.](?:[^\W_]|\.)*)              # 3: numbers
+          | "([^"]*)"                           # 4: strings
+        )''', re.VERBOSE)
+    _RE_SPACE = re.compile(r'\s+')
+    _RE_IDENTIFIER = re.compile(r'\w+')
+    _RE_NUMBER = re.compile(r'(?:[^\W_]|\.)+')
+
+    # Default chunk size (in bytes / characters) for scan_stream
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self):
+        super().__init__()
+        self._classes: dict = {chr(c): self._classify(chr(c)) for c in range(128)}
+        # Streaming input: _str_stream only holds a window of the source, starting at source offset _base
+        self._chunks: Optional[Iterator[str]] = None
+        self._base: int = 0
+
+    def _classify(self, c: str) -> int:
+        # Same order of checks as Scanner.next_token
+        if c.isspace():
+            return self._C_SPACE
+        if c == '#':
+            return self._C_COMMENT
+        if c in self._SINGLE_CHAR_TOKENS:
+            return self._C_SINGLE
+        if c == '<':
+            return self._C_LT
+        if c == '>':
+            return self._C_GT
+        if c.isdigit() or c == '.':
+            return self._C_NUMBER
+        if c == '\"':
+            return self._C_STRING
+        if c.isalpha() or c == '_':
+            return self._C_IDENTIFIER
+        return self._C_ERROR
+
+    def scan_str(self, input_str: str, offset: int = 0) -> None:
+        """
+        Tokenize given input stream of type str
+        :param input_str: Stream
+        :param offset: Source offset of the first character (for fragments of a larger source)
+        """
+        self._str_stream = input_str
+        self._str_len = len(input_str)
+        self._char_offset = 0
+        self._chunks = None
+        self._base = offset
+
+    def scan_stream(self, source, chunk_size: int = CHUNK_SIZE) -> None:
+        """
+        Tokenize given input stream incrementally, chunk by chunk
+        Only the unconsumed rest of the current chunk is kept in memory, token offsets are source offsets
+        :param source: Text or binary file object, mmap, memoryview, bytes or bytearray (binary input is UTF-8)
+        :param chunk_size: Number of bytes / characters to read at once
+        """
+        self.scan_str('')
+        self._chunks = _iter_chunks(source, chunk_size)
+        self._refill()
+
+    def _refill(self) -> bool:
+        # Drop the consumed part of the window and append the next non-empty chunk
+        for chunk in self._chunks:
+            if chunk:
+                self._base += self._char_offset
+                self._str_stream = self._str_stream[self._char_offset:] + chunk
+                self._str_len = len(self._str_stream)
+                self._char_offset = 0
+                return True
+        self._chunks = None
+        return False
+
+    def next_token(self, peek: bool = False) -> Optional[Token]:
+        """
+        Get next available token
+        Unlike Scanner, peeking never consumes any input
+        :return: Token instance
+        """
+        m = self._RE_TOKEN.match(self._str_stream, self._char_offset)
+        # Streaming: a token touching the end of the window may continue in the next chunk
+        while self._chunks is not None and (m is None or m.end() == self._str_len) and self._refill():
+            m = self._RE_TOKEN.match(self._str_stream, self._char_offset)
+        if m is None:
+            # EOF, errors and unterminated strings
+            return self._next_token_by_class(peek)
+
+        group = m.lastindex
+        end = m.end()
+        cn = end if end < self._str_len else self._str_len - 1
+        if group == 2:
+            word = m.group(2)
+            ttype = self._KEYWORDS.get(word)
+            if ttype is not None:
+                token = Token(ttype, cn)
+            elif word.isascii():
+                token = Token(TokenType.IDENTIFIER, cn, word)
+            else:
+                return self._next_token_by_class(peek, token_start=m.start(2))
+        elif group == 1:
+            token = Token(self._OPERATORS[m.group(1)], cn)
+        elif group == 3:
+            run = m.group(3)
+            if not run.isascii():
+                return self._next_token_by_class(peek, token_start=m.start(3))
+            start = m.start(3)
+            token = Token(TokenType.NUMBER, start, self._number_value(run, self._base + start))
+        else:
+            token = Token(TokenType.STRING, m.start(4) - 1, m.group(4))
+
+        if self._base:
+            token.meta_cn += self._base
+        if not peek:
+            self._char_offset = end
+        return token
+
+    def tokens(self) -> Iterator[Token]:
+        """
+        Iterate over all remaining tokens of the stream
+        Same tokens as repeated next_token() calls, without the per call overhead
+        :return: Token iterator
+        """
+        s = self._str_stream
+        slen = self._str_len
+        base = self._base
+        match = self._RE_TOKEN.match
+        keywords = self._KEYWORDS
+        operators = self._OPERATORS
+        number_value = self._number_value
+        identifier = TokenType.IDENTIFIER
+
+        streaming = self._chunks is not None
+
+        m = match(s, self._char_offset)
+        while True:
+            if streaming and (m is None or m.end() == slen):
+                # The token may continue in the next chunk
+                if self._refill():
+                    s = self._str_stream
+                    slen = self._str_len
+                    base = self._base
+                    m = match(s, self._char_offset)
+                    continue
+                streaming = False
+            if m is None:
+                break
+            group = m.lastindex
+            end = m.end()
+            cn = end if end < slen else slen - 1
+            if group == 2:
+                word = m.group(2)
+                ttype = keywords.get(word)
+                if ttype is not None:
+                    token = Token(ttype, cn)
+                elif word.isascii():
+                    token = Token(identifier, cn, word)
+                else:
+                    break
+            elif group == 1:
+                token = Token(operators[m.group(1)], cn)
+            elif group == 3:
+                run = m.group(3)
+                if not run.isascii():
+                    break
+                start = m.start(3)
+                token = Token(TokenType.NUMBER, start, number_value(run, base + start))
+            else:
+                token = Token(TokenType.STRING, m.start(4) - 1, m.group(4))
+            if base:
+                token.meta_cn += base
+            self._char_offset = end
+            yield token
+            m = match(s, end)
+
+        # Remaining tokens (if any) after the fast path gave up
+        yield from super().tokens()
+
+    def _next_token_by_class(self, peek: bool = False, token_start: int = 0) -> Optional[Token]:
+        # Character class dispatch, exact for any input (also non-ASCII identifiers and error positions)
+        if self._chunks is not None:
+            # Streaming: identifier and number runs never span a line break, so the complete line is sufficient
+            ahead = token_start - self._char_offset
+            while self._str_stream.find('\n', self._char_offset + ahead) < 0 and self._refill():
+                pass
+        token = self._scan_by_class(peek)
+        if token is not None and self._base:
+            token.meta_cn += self._base
+        return token
+
+    def _scan_by_class(self, peek: bool = False) -> Optional[Token]:
+        pos = self._char_offset
+        s = self._str_stream
+        slen = self._str_len
+        end_offset = slen - 1
+
+        while pos < slen:
+            c = s[pos]
+            cls = self._classes.get(c)
+            if cls is None:
+                cls = self._classes.setdefault(c, self._classify(c))
+
+            if cls == self._C_SPACE:
+                pos = self._RE_SPACE.match(s, pos).end()
+                continue
+
+            if cls == self._C_COMMENT:
+                pos = s.find('\n', pos)
+                if pos < 0:
+                    break
+                pos += 1
+                continue
+
+            if cls == self._C_SINGLE:
+                end = pos + 1
+                token = Token(self._SINGLE_CHAR_TOKENS[c], cn=min(end, end_offset))
+            elif cls == self._C_IDENTIFIER:
+                word = self._RE_IDENTIFIER.match(s, pos).group()
+                if not word.isascii():
+                    word = self._exact_run(s, pos, lambda ch: ch.isalpha() or ch.isdigit() or ch == '_')
+                end = pos + len(word)
+                ttype = self._KEYWORDS.get(word)
+                if ttype is None:
+                    token = Token(TokenType.IDENTIFIER, cn=min(end, end_offset), value=word)
+                else:
+                    token = Token(ttype, cn=min(end, end_offset))
+            elif cls == self._C_NUMBER:
+                run = self._RE_NUMBER.match(s, pos).group()
+                if not run.isascii():
+                    run = self._exact_run(s, pos, lambda ch: ch.isalpha() or ch.isdigit() or ch in ['.', 'x'])
+                end = pos + len(run)
+                token = Token(TokenType.NUMBER, cn=pos, value=self._number_value(run, self._base + pos))
+            elif cls == self._C_STRING:
+                closing = s.find('\"', pos + 1)
+                if closing < 0:
+                    self._char_offset = end_offset
+                    raise ScanUnterminatedStringException()
+                end = closing + 1
+                token = Token(TokenType.STRING, cn=pos, value=s[pos + 1:closing])
+            elif cls == self._C_LT:
+                nxt = s[pos + 1] if pos + 1 < slen else None
+                if nxt == '=':
+                    end = pos + 2
+                    token = Token(TokenType.REL_LTEQ, cn=min(end, end_offset))
+                elif nxt == '>':
+                    end = pos + 2
+                    token = Token(TokenType.REL_NOTEQ, cn=min(end, end_offset))
+                else:
+                    end = pos + 1
+                    token = Token(TokenType.REL_LT, cn=min(end, end_offset))
+            elif cls == self._C_GT:
+                if pos + 1 < slen and s[pos + 1] == '=':
+                    end = pos + 2
+                    token = Token(TokenType.REL_GTEQ, cn=min(end, end_offset))
+                else:
+                    end = pos + 1
+                    token = Token(TokenType.REL_GT, cn=min(end, end_offset))
+            else:
+                self._char_offset = pos
+                raise ScanWrongTokenException('Wrong character {c} at {o}'.format(c=c, o=self._base + pos))
+
+            if not peek:
+                self._char_offset = end
+            return token
+
+        if not peek:
+            self._char_offset = slen
+
+    @staticmethod
+    def _exact_run(s: str, pos: int, accept) -> str:
+        end = pos
+        slen = len(s)
+        while end < slen and accept(s[end]):
+            end += 1
+        return s[pos:end]
+
+    @staticmethod
+    def _number_value(run: str, pos: int) -> float:
+        # Same rules as Scanner._scan_number, applied to the whole run at once
+        scan_hex = len(run) > 1 and run[0] == '0' and run[1].lower() == 'x'
+        digits = run[2:] if scan_hex else run
+        if not digits:
+            raise ScanWrongTokenException('Illegal number at {o}'.format(o=pos + len(run)))
+
+        scan_float = False
+        for i, c in enumerate(digits):
+            if c == '.':
+                # Leading dot without digit (.3)
+                if scan_float:
+                    raise ScanWrongTokenException()
+                scan_float = True
+                if i + 1 >= len(digits):
+                    raise ScanWrongTokenException('Illegal number at {o}'.format(o=pos + len(run)))
+            elif not (c.isdigit() or (scan_hex and c.upper() in ['A', 'B', 'C', 'D', 'E', 'F'])):
+                raise ScanWrongTokenException('Illegal number at {o}'.format(o=pos + len(run) - len(digits) + i))
+
+        if scan_hex:
+            return float(int('0x' + digits, 16))
+        return float(digits)
+
+    @property
+    def char_offset(self):
+        return self._base + min(self._char_offset, max(self._str_len - 1, 0))
+
+
+def _iter_chunks(source, chunk_size: int) -> Iterator[str]:
+    # Decoded text chunks of a file object or buffer, multi byte characters may span chunks
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    if hasattr(source, 'read'):
+        chunk = source.read(chunk_size)
+        while chunk:
+            yield chunk if isinstance(chunk, str) else decoder.decode(chunk)
+            chunk = source.read(chunk_size)
+    else:
+        view = memoryview(source)
+        for off in range(0, len(view), chunk_size):
+            yield decoder.decode(view[off:off + chunk_size])
+    yield decoder.decode(b'', final=True)
+
+
+class TokenStream:
+    """
+    Buffered token stream on top of a scanner
+    Every token is scanned exactly once, lookahead of k tokens is served from the buffer
+    """
+
+    def __init__(self, scanner: Scanner):
+        self._tokens: Iterator[Token] = scanner.tokens()
+        self._buffer: collections.deque = collections.deque()
+        self._exhausted: bool = False
+
+    def _fill(self, n: int) -> bool:
+        while len(self._buffer) < n:
+            if self._exhausted:
+                return False
+            token = next(self._tokens, None)
+            if token is None:
+                self._exhausted = True
+                return False
+            self._buffer.append(token)
+        return True
+
+    def peek(self, k: int = 0) -> Optional[Token]:
+        """
+        Look at an upcoming token without consuming it
+        :param k: Offset into the stream, 0 is the token the next advance() returns
+        :return: Token instance or None at EOF
+        """
+        if self._fill(k + 1):
+            return self._buffer[k]
+        return None
+
+    def advance(self) -> Optional[Token]:
+        """
+        Consume the next token
+        :return: Token instance or None at EOF
+        """
+        if self._fill(1):
+            return self._buffer.popleft()
+        return None
+
+
+class _Line:
+    # Source line with the tokens starting on it, token offsets are relative to the line start.
+    # A string spanning several lines makes a group: the first line holds all tokens, the others are continuations
+    __slots__ = ('text', 'tokens', 'rels', 'cont', 'error')
+
+    def __init__(self, text: str, cont: bool = False):
+        self.text: str = text
+        self.tokens: [Token] = []
+        self.rels: [int] = []
+        self.cont: bool = cont
+        self.error: Optional[Exception] = None
+
+
+class _LineBlock:
+    __slots__ = ('lines', 'length')
+
+    def __init__(self, lines: [_Line]):
+        self.lines: [_Line] = lines
+        self.length: int = sum(len(line.text) for line in lines)
+
+
+class IncrementalScanner:
+    """
+    Incremental tokenizer for editor integrations
+    Keeps the tokens of every source line (in blocks of lines) and re-tokenizes only the lines touched by an edit.
+    Token offsets are line relative and resolved while iterating, so an edit never walks the following tokens.
+    tokens() yields the same token stream as TableScanner on the complete source
+    """
+
+    BLOCK_LINES = 64
+
+    def __init__(self):
+        self._scanner = TableScanner()
+        self._blocks: [_LineBlock] = []
+        self._length: int = 0
+
+    @staticmethod
+    def _split_lines(text: str) -> [str]:
+        # Lines keep their line break, only the last line may lack it
+        lines = [ln + '\n' for ln in text.split('\n')]
+        lines[-1] = lines[-1][:-1]
+        if not lines[-1]:
+            lines.pop()
+        return lines
+
+    def _make_blocks(self, lines: [_Line]) -> [_LineBlock]:
+        return [_LineBlock(lines[i:i + self.BLOCK_LINES]) for i in range(0, len(lines), self.BLOCK_LINES)]
+
+    def scan_str(self, input_str: str) -> None:
+        """
+        Tokenize given input stream of type str
+        :param input_str: Stream
+        """
+        self._blocks = self._make_blocks(self._scan_lines(self._split_lines(input_str), lambda: None))
+        self._length = len(input_str)
+
+    @property
+    def text(self) -> str:
+        return ''.join(line.text for block in self._blocks for line in block.lines)
+
+    def __len__(self):
+        return self._length
+
+    def _scan_group(self, texts: [str]) -> [_Line]:
+        lines = [_Line(text, cont=True) for text in texts]
+        first = lines[0]
+        first.cont = False
+        self._scanner.scan_str(''.join(texts))
+        try:
+            for token in self._scanner.tokens():
+                first.rels.append(token.meta_cn)
+                first.tokens.append(token)
+        except (ScanWrongTokenException, ValueError) as e:
+            first.error = e
+        return lines
+
+    def _scan_lines(self, texts: [str], following) -> [_Line]:
+        # Tokenize texts line by line, a string left open pulls in further lines (from texts, then from following)
+        out = []
+        i = 0
+        while i < len(texts):
+            group = [texts[i]]
+            i += 1
+            lines = self._scan_group(group)
+            while isinstance(lines[0].error, ScanUnterminatedStringException):
+                # Extend the group up to the next line holding a quote (or EOF) and scan it again
+                extended = False
+                while True:
+                    if i < len(texts):
+                        text = texts[i]
+                        i += 1
+                    else:
+                        text = following()
+                        if text is None:
+                            break
+                    group.append(text)
+                    extended = True
+                    if '\"' in text:
+                        break
+                if not extended:
+                    break
+                lines = self._scan_group(group)
+            out.extend(lines)
+        return out
+
+    def _locate(self, offset: int) -> (int, int, int):
+        # Block index, line index and line start of the line holding offset.
+        # The end of the source belongs to the last line, unless that line ends with a line break
+        start = 0
+        for bi, block in enumerate(self._blocks):
+            if offset < start + block.length:
+                for li, line in enumerate(block.lines):
+                    if offset < start + len(line.text):
+                        return bi, li, start
+                    start += len(line.text)
+            start += block.length
+        if self._blocks:
+            bi = len(self._blocks) - 1
+            last = self._blocks[bi].lines[-1]
+            if not last.text.endswith('\n'):
+                return bi, len(self._blocks[bi].lines) - 1, start - len(last.text)
+        return len(self._blocks), 0, start
+
+    def edit(self, offset: int, removed: int, inserted: str) -> None:
+        """
+        Apply an edit and re-tokenize the affected lines
+        :param offset: Source offset of the edit
+        :param removed: Number of characters removed at offset
+        :param inserted: Text inserted at offset
+        """
+        if offset < 0 or removed < 0 or offset + removed > self._length:
+            raise ValueError('Edit range {o}+{r} outside of source ({n} chars)'.format(
+                o=offset, r=removed, n=self._length))
+        blocks = self._blocks
+
+        # First affected line
+        bs, ls, start = self._locate(offset)
+        if bs == len(blocks) and blocks:
+            # Appending after the final line break may still close a string left open on the last line
+            bs -= 1
+            ls = len(blocks[bs].lines) - 1
+            start -= len(blocks[bs].lines[ls].text)
+        # A line continuing a string belongs to the group of an earlier line
+        while blocks and blocks[bs].lines[ls].cont:
+            if ls == 0:
+                bs -= 1
+                ls = len(blocks[bs].lines)
+            ls -= 1
+            start -= len(blocks[bs].lines[ls].text)
+
+        # Last affected line (exclusive)
+        be, le, _ = self._locate(offset + removed)
+        if be < len(blocks):
+            le += 1
+        elif blocks:
+            be = len(blocks) - 1
+            le = len(blocks[be].lines)
+        else:
+            be = bs
+
+        # Flat window over the touched blocks, following blocks are pulled in on demand
+        flat: [_Line] = [line for block in blocks[bs:be + 1] for line in block.lines]
+        le += sum(len(block.lines) for block in blocks[bs:be])
+
+        def pull() -> bool:
+            nonlocal be
+            if be + 1 >= len(blocks):
+                return False
+            be += 1
+            flat.extend(blocks[be].lines)
+            return True
+
+        def following() -> Optional[str]:
+            nonlocal le
+            if le == len(flat) and not pull():
+                return None
+            le += 1
+            return flat[le - 1].text
+
+        old_text = ''.join(line.text for line in flat[ls:le])
+        local = offset - start
+        lines = self._scan_lines(self._split_lines(old_text[:local] + inserted + old_text[local + removed:]),
+                                 following)
+
+        # Continuation lines of a string group that was just re-tokenized
+        while (le < len(flat) or pull()) and flat[le].cont:
+            lines.extend(self._scan_lines([following()], following))
+
+        flat[ls:le] = lines
+        if len(flat) < self.BLOCK_LINES // 2:
+            pull()
+        blocks[bs:be + 1] = self._make_blocks(flat)
+        self._length += len(inserted) - removed
+
+    def tokens(self) -> Iterator[Token]:
+        """
+        Iterate over all tokens of the current source
+        :return: Token iterator
+        """
+        start = 0
+        for block in self._blocks:
+            for line in block.lines:
+                for token, rel in zip(line.tokens, line.rels):
+                    token.meta_cn = start + rel
+                    yield token
+                if line.error is not None:
+                    # Scan the failing group again at its source offset for the exact exception
+                    text = line.text
+                    for cont in self._continuation(block, line):
+                        text += cont
+                    self._scanner.scan_str(text, offset=start)
+                    for _ in self._scanner.tokens():
+                        pass
+                start += len(line.text)
+
+    def _continuation(self, block: _LineBlock, line: _Line) -> Iterator[str]:
+        bi = self._blocks.index(block)
+        li = block.lines.index(line) + 1
+        while bi < len(self._blocks):
+            lines = self._blocks[bi].lines
+            while li < len(lines):
+                if not lines[li].cont:
+                    return
+                yield lines[li].text
+                li += 1
+            bi += 1
+            li = 0
+
+
+SCANNERS = {
+    'classic': Scanner,
+    'table': TableScanner,
+}
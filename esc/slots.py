@@ -0,0 +1,195 @@
+from typing import Optional
+
+from esc.ir import Code, ControlFlowGraph, Instruction, Label, Pass
+from esc.opcodes import OP
+
+# Operations that make the following POPL / PUSHL an array element access
+ARRAY_INDEX = frozenset([OP.PUSHA, OP.PUSHAS])
+
+# Local slots by (frame, slot), the frame is the procedure name or None for the code outside of procedures
+Variable = (Optional[str], int)
+
+
+def frame_owners(code: Code, procedures: {str: (Label, Label)}) -> Optional[list]:
+    """
+    Frame of each element of the code
+    A procedure's frame reaches from its first to its last label, without the procedures defined inside of it
+    :param code: Intermediate code
+    :param procedures: First and last label of each procedure by name
+    :return: Procedure name (None outside of procedures) by position, None if a procedure is not part of the code
+    """
+    positions = {element: i for i, element in enumerate(code) if type(element) is Label}
+    spans = []
+    for name, (head, end) in procedures.items():
+        if head not in positions or end not in positions:
+            return None
+        spans.append((positions[head], positions[end], name))
+    owners = [None] * len(code)
+    # Nested procedures start behind the procedure they are defined in and overwrite its part
+    for start, stop, name in sorted(spans, key=lambda span: span[0]):
+        owners[start:stop] = [name] * (stop - start)
+    return owners
+
+
+def local_access(ins: Instruction, prev: Optional[Instruction]) -> (Optional[int], Optional[int]):
+    """
+    Local slot an instruction reads and the one it writes
+    Element stores (PUSHL behind PUSHA / PUSHAS) change the array in the slot, so they read the slot
+    :param ins: Instruction
+    :param prev: Instruction in front of ins (in the same block)
+    :return: (used slot, defined slot), either may be None
+    """
+    if ins.op is OP.POPL:
+        return int(ins.arg1), None
+    if ins.op is OP.PUSHL:
+        if prev is not None and prev.op in ARRAY_INDEX:
+            return int(ins.arg1), None
+        return None, int(ins.arg1)
+    if ins.op is OP.INCL:
+        return int(ins.arg1), int(ins.arg1)
+    return None, None
+
+
+def frame_sizes(code: Code, procedures: {str: (Label, Label)}) -> {Optional[str]: int}:
+    """
+    Number of local slots of each frame
+    :param code: Intermediate code
+    :param procedures: First and last label of each procedure by name
+    :return: Slots by procedure name, the code outside of procedures under None
+    """
+    sizes = {None: 0}
+    sizes.update((name, 0) for name in procedures)
+    owners = frame_owners(code, procedures)
+    if owners is None:
+        return {}
+    for ins, owner in zip(code, owners):
+        if ins.op in (OP.POPL, OP.PUSHL, OP.INCL):
+            sizes[owner] = max(sizes[owner], int(ins.arg1) + 1)
+    return sizes
+
+
+class SlotAllocator(Pass):
+    """
+    Assigns local slots by liveness, locals that are never live at the same time share a slot
+    Liveness is computed on the control flow graph of the whole program. Procedure calls continue behind the call
+    (the callee has its own frame), so the locals of each frame are analyzed on their own. Slots are assigned greedy
+    in the order of the original slots, a local copied from another one (POPL a, PUSHL b) gets the same slot if
+    possible, which turns the copy into a no-op for the peephole optimizer
+    """
+    name = 'slots'
+
+    def __init__(self, procedures: {str: (Label, Label)}):
+        # First and last label of each procedure by name, filled by the code generator
+        self.procedures = procedures
+        # Slots before and after the allocation by frame
+        self.frames: {Optional[str]: (int, int)} = {}
+
+    def run(self, code: Code) -> Code:
+        self.frames = {}
+        owners = frame_owners(code, self.procedures)
+        if owners is None:
+            return code
+        owner_of = {id(element): owner for element, owner in zip(code, owners)}
+        cfg = ControlFlowGraph(code)
+        interference, moves = self._interference(cfg, owner_of)
+        slots = self._assign(interference, moves)
+        if all(var[1] == slot for var, slot in slots.items()):
+            return code
+
+        before = frame_sizes(code, self.procedures)
+        new = []
+        for element in code:
+            if element.op in (OP.POPL, OP.PUSHL, OP.INCL):
+                slot = slots.get((owner_of[id(element)], int(element.arg1)))
+                if slot is not None and slot != element.arg1:
+                    element = Instruction(element.op, slot)
+            new.append(element)
+        after = frame_sizes(new, self.procedures)
+        self.frames = {frame: (size, after[frame]) for frame, size in before.items()}
+        return new
+
+    @staticmethod
+    def _accesses(block, owner_of, moves) -> [(Instruction, Variable, Variable)]:
+        # Local slots read and written by the instructions of a block, copies of a local into another one are
+        # added to moves
+        out = []
+        prev = before = None
+        for ins in block.instructions:
+            use, define = local_access(ins, prev)
+            if use is not None or define is not None:
+                owner = owner_of[id(ins)]
+                use = None if use is None else (owner, use)
+                define = None if define is None else (owner, define)
+                out.append((ins, use, define))
+                if ins.op is OP.PUSHL and define is not None and prev is not None and prev.op is OP.POPL and \
+                        (before is None or before.op not in ARRAY_INDEX):
+                    source = (owner, int(prev.arg1))
+                    moves.setdefault(define, []).append(source)
+                    moves.setdefault(source, []).append(define)
+            prev, before = ins, prev
+        return out
+
+    def _interference(self, cfg: ControlFlowGraph, owner_of) -> ({Variable: {Variable}}, {Variable: [Variable]}):
+        moves: {Variable: [Variable]} = {}
+        accesses = [self._accesses(block, owner_of, moves) for block in cfg.blocks]
+        successors = []
+        uses, defs = [], []
+        for block, block_accesses in zip(cfg.blocks, accesses):
+            last = block.instructions[-1] if block.instructions else None
+            callee = cfg.block_of.get(last.target) if last is not None and last.op is OP.JMPFUN else None
+            successors.append([b.index for b in block.successors if b is not callee])
+            use, define = set(), set()
+            for ins, u, d in block_accesses:
+                if u is not None and u not in define:
+                    use.add(u)
+                if d is not None:
+                    define.add(d)
+            uses.append(use)
+            defs.append(define)
+
+        # Backward data flow until no live set changes
+        live_in = [set() for _ in cfg.blocks]
+        live_out = [set() for _ in cfg.blocks]
+        changed = True
+        while changed:
+            changed = False
+            for i in range(len(cfg.blocks) - 1, -1, -1):
+                out = set()
+                for s in successors[i]:
+                    out |= live_in[s]
+                new_in = uses[i] | (out - defs[i])
+                live_out[i] = out
+                if new_in != live_in[i]:
+                    live_in[i] = new_in
+                    changed = True
+
+        interference: {Variable: {Variable}} = {}
+        for i, block_accesses in enumerate(accesses):
+            live = set(live_out[i])
+            for ins, use, define in reversed(block_accesses):
+                if define is not None:
+                    neighbours = interference.setdefault(define, set())
+                    for var in live:
+                        if var != define and var[0] == define[0]:
+                            neighbours.add(var)
+                            interference.setdefault(var, set()).add(define)
+                    live.discard(define)
+                if use is not None:
+                    interference.setdefault(use, set())
+                    live.add(use)
+        return interference, moves
+
+    @staticmethod
+    def _assign(interference: {Variable: {Variable}}, moves: {Variable: [Variable]}) -> {Variable: int}:
+        slots: {Variable: int} = {}
+        for var in sorted(interference, key=lambda v: (v[0] or '', v[1])):
+            taken = {slots[other] for other in interference[var] if other in slots}
+            preferred = [slots[other] for other in moves.get(var, ()) if other in slots and slots[other] not in taken]
+            if preferred:
+                slots[var] = preferred[0]
+            else:
+                slot = 0
+                while slot in taken:
+                    slot += 1
+                slots[var] = slot
+        return slots
@@ -0,0 +1,147 @@
+import bisect
+import re
+from typing import Optional
+
+
+class SourceFile:
+    """
+    Source file with a line start table
+    Offsets convert to (line, column) by bisection, the table is built once on first use
+    """
+
+    def __init__(self, name: str, text: str):
+        self.name: str = name
+        self.text: str = text
+        self._line_starts: Optional[list] = None
+
+    def position(self, offset: int) -> (int, int):
+        """
+        Line and column (both starting at 1) of a character offset
+        :param offset: Character offset into the file
+        :return: (line, column)
+        """
+        if self._line_starts is None:
+            self._line_starts = [0] + [m.end() for m in re.finditer('\n', self.text)]
+        line = bisect.bisect_right(self._line_starts, offset) - 1
+        return line + 1, offset - self._line_starts[line] + 1
+
+
+class SourceLocation:
+    def __init__(self, file: str, offset: int, line: int, column: int):
+        self.file = file
+        self.offset = offset
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        return '{f}:{l}:{c}'.format(f=self.file, l=self.line, c=self.column)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class SourceMap:
+    """
+    Maps offsets of a derived string (e.g. the cleaned program text) back to offsets of source files
+    The derived string is made of segments, each one a linear piece of a source file
+    """
+
+    def __init__(self):
+        self._starts: [int] = []
+        self._targets: [(SourceFile, int)] = []
+
+    @classmethod
+    def of(cls, source: SourceFile) -> 'SourceMap':
+        smap = cls()
+        smap.add(0, source, 0)
+        return smap
+
+    @classmethod
+    def of_offsets(cls, source: SourceFile, offsets: [(int, int)]) -> 'SourceMap':
+        """
+        Map of a string derived from a single source file, see offsets()
+        """
+        smap = cls()
+        smap._starts = [start for start, _ in offsets]
+        smap._targets = [(source, source_offset) for _, source_offset in offsets]
+        return smap
+
+    def offsets(self) -> [(int, int)]:
+        """
+        Segments as (start, source offset), for maps of a single source file
+        """
+        return [(start, source_offset) for start, (_, source_offset) in zip(self._starts, self._targets)]
+
+    def add(self, start: int, source: SourceFile, source_offset: int) -> None:
+        """
+        Map the derived string from start on (up to the next segment) to source, starting at source_offset
+        Segments must be added in ascending order of start
+        """
+        if self._starts:
+            prev_start = self._starts[-1]
+            prev_source, prev_offset = self._targets[-1]
+            if prev_source is source and prev_offset + start - prev_start == source_offset:
+                # Continues the previous segment
+                return
+            if prev_start == start:
+                self._targets[-1] = (source, source_offset)
+                return
+        self._starts.append(start)
+        self._targets.append((source, source_offset))
+
+    def copy(self, other: 'SourceMap', other_start: int, length: int, start: int) -> None:
+        """
+        Map the derived string at start the same way as other maps [other_start, other_start + length)
+        """
+        if not other._starts or length <= 0:
+            return
+        i = max(bisect.bisect_right(other._starts, other_start) - 1, 0)
+        other_end = other_start + length
+        while i < len(other._starts) and other._starts[i] < other_end:
+            seg_start = max(other._starts[i], other_start)
+            source, source_offset = other._targets[i]
+            self.add(start + seg_start - other_start, source, source_offset + seg_start - other._starts[i])
+            i += 1
+
+    def source_offset(self, offset: int) -> (Optional[SourceFile], int):
+        i = bisect.bisect_right(self._starts, offset) - 1
+        if i < 0:
+            return None, offset
+        source, source_offset = self._targets[i]
+        return source, source_offset + offset - self._starts[i]
+
+    def locate(self, offset: int) -> SourceLocation:
+        """
+        Source file, offset, line and column of an offset into the derived string
+        :param offset: Offset into the derived string
+        :return: SourceLocation
+        """
+        source, source_offset = self.source_offset(offset)
+        if source is None:
+            return SourceLocation('', offset, 0, 0)
+        line, column = source.position(source_offset)
+        return SourceLocation(source.name, source_offset, line, column)
+
+
+def clean(text: str, smap: SourceMap) -> (str, SourceMap):
+    """
+    Strip leading whitespace of every line and drop empty lines (see Parser._clean_string), keeping the offset map
+    :return: Cleaned string and its map
+    """
+    out = []
+    out_map = SourceMap()
+    out_len = 0
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.lstrip()
+        if stripped:
+            content = stripped.splitlines()[0]
+            # The joining line break stands for the line's own line break
+            out_map.copy(smap, offset + len(line) - len(stripped), len(content) + 1, out_len)
+            out.append(content)
+            out_len += len(content) + 1
+        offset += len(line)
+    if not out:
+        out_map.copy(smap, 0, 1, 0)
+    return '\n'.join(out) + '\n', out_map
+
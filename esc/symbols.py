@@ -0,0 +1,142 @@
+import sys
+from abc import ABC
+from typing import Optional
+
+
+class Symbol(ABC):
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return '[SYMBOL {name}]'.format(name=self.name)
+
+
+class VariableSymbol(Symbol):
+    __slots__ = ('value', 'is_const')
+
+    def __init__(self, name: str, value, const: bool = False):
+        super().__init__(name)
+        self.value = value
+        self.is_const = const
+
+
+class ProcedureSymbol(Symbol):
+    __slots__ = ('args', 'addr', 'is_const')
+
+    def __init__(self, name: str, args: int, addr: int):
+        super().__init__(name)
+        self.args = args
+        self.addr = addr
+        self.is_const = True
+
+
+class Scope:
+    """
+    Symbols declared in one block, chained to the enclosing block of the same frame
+    Slots continue the numbering of the enclosing block, so a symbol keeps its slot in all nested blocks
+    """
+    __slots__ = ('parent', 'frame', 'symbols', 'next_slot')
+
+    def __init__(self, parent: Optional['Scope'] = None):
+        self.parent: Optional[Scope] = parent
+        self.frame: Scope = parent.frame if parent is not None else self
+        self.symbols: {str: (Symbol, int)} = {}
+        self.next_slot: int = parent.next_slot if parent is not None else 0
+
+
+class SymbolTable:
+    """
+    Scoped symbol table with dict lookups
+    Global symbols live in the global scope. Each procedure body and each top level block opens a new frame (a scope
+    without parent) whose slots start at 0, nested blocks are chained to their enclosing scope.
+    Besides the scopes, every local name maps to the stack of its open declarations (innermost last), so a lookup
+    does not walk the scope chain
+    """
+
+    def __init__(self):
+        self.globals: Scope = Scope()
+        self.current: Scope = self.globals
+        self.external: {str} = set()
+        self._locals: {str: [(Symbol, int, Scope)]} = {}
+
+    def open_scope(self) -> None:
+        # Blocks at top level get their own frame, globals are found by the fallback in resolve
+        self.current = Scope(None if self.current is self.globals else self.current)
+
+    def close_scope(self) -> None:
+        self._drop(self.current)
+        self.current = self.current.parent or self.globals
+
+    def open_frame(self) -> Scope:
+        """
+        Enter a new frame (procedure body)
+        :return: Scope to restore with close_frame
+        """
+        prev = self.current
+        self.current = Scope()
+        return prev
+
+    def close_frame(self, prev: Scope) -> None:
+        self._drop(self.current)
+        self.current = prev
+
+    def _drop(self, scope: Scope) -> None:
+        # Scopes close in reverse order of opening, the declarations of scope are on top of their stacks
+        if scope is self.globals:
+            return
+        for name in scope.symbols:
+            stack = self._locals[name]
+            stack.pop()
+            if not stack:
+                del self._locals[name]
+
+    def declare(self, symbol: Symbol, scope: Scope = None, store: bool = True) -> Optional[int]:
+        """
+        Declare a symbol, a symbol of the same name in the same scope is replaced and keeps its slot
+        :param symbol: Symbol
+        :param scope: Scope, defaults to the current scope
+        :param store: Allocate a slot, symbols without slot are never stored (i.e. inlined consts)
+        :return: Slot or None
+        """
+        scope = scope or self.current
+        name = symbol.name = sys.intern(symbol.name)
+        entry = scope.symbols.get(name)
+        if not store:
+            slot = None
+        elif entry is not None and entry[1] is not None:
+            slot = entry[1]
+        else:
+            slot = scope.next_slot
+            scope.next_slot += 1
+        scope.symbols[name] = (symbol, slot)
+        if scope is not self.globals:
+            stack = self._locals.setdefault(name, [])
+            if entry is not None:
+                stack[-1] = (symbol, slot, scope)
+            else:
+                stack.append((symbol, slot, scope))
+        return slot
+
+    def resolve(self, name: str, global_only: bool = False) -> Optional[tuple]:
+        """
+        Innermost declaration of a name in the current frame, then in the global scope
+        :param name: Symbol name
+        :param global_only: Search the global scope only
+        :return: (symbol, slot, scope) or None
+        """
+        if not global_only:
+            stack = self._locals.get(name)
+            if stack is not None:
+                frame = self.current.frame
+                for i in range(len(stack) - 1, -1, -1):
+                    if stack[i][2].frame is frame:
+                        return stack[i]
+        entry = self.globals.symbols.get(name)
+        if entry is not None:
+            return entry[0], entry[1], self.globals
+        return None
+
+    def exists(self, name: str, global_only: bool = False) -> bool:
+        return name in self.external or self.resolve(name, global_only=global_only) is not None
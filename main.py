@@ -1,61 +1,82 @@
 import os
-import subprocess
-from esc.codegen import CodeGenerator
-from esc.parser import Parser
-import argparse
-import yaml
 import sys
+from esc.config import load_config
+from esc.index import file_index
+from esc import C_VERSION
 
-with open('config.yml') as file:
-    C_CONFIG = yaml.load(file, Loader=yaml.FullLoader)
+# Only light modules are imported at startup, the parser, code generator, module cache and subprocess are imported
+# when a run needs them (most editor calls are parse only runs, see benchmarks/bench_startup.py)
 
-C_VERSION = '0.1a'
 
-if C_CONFIG['debug'] is True:
-    print("Debug mode enabled")
-    sys.tracebacklimit = 1
-else:
-    sys.tracebacklimit = 0
+def build_arg_parser():
+    import argparse
+    parser = argparse.ArgumentParser(description='evoscript CLI {v}'.format(v=C_VERSION))
+    parser.add_argument('-p', '--parse', action='store_true')
+    parser.add_argument('-i', '--input', type=str)
+    parser.add_argument('-o', '--output', type=str)
+    parser.add_argument('-e', '--execute', action='store_true')
+    parser.add_argument('-l', '--stdlib', type=str)
+    parser.add_argument('-v', '--vm', type=str)
+    parser.add_argument('-s', '--scanner', type=str, choices=['table', 'classic'], default='table')
+    parser.add_argument('-cs', '--cachestats', action='store_true')
+    parser.add_argument('-m', '--modules', action='store_true')
+    parser.add_argument('-j', '--jobs', type=int)
+    parser.add_argument('-cc', '--clearcache', action='store_true')
+    parser.add_argument('-O', '--optimize', type=int)
+    parser.add_argument('-u', '--unused', action='store_true')
+    parser.add_argument('-ps', '--peepholestats', action='store_true')
+    parser.add_argument('-fs', '--framesizes', action='store_true')
+    parser.add_argument('-in', '--inlined', action='store_true')
+    # Compiler specific limits for pre-executional boundary checking (optional)
+    parser.add_argument('-vmos', '--vmoutsize', type=int)
+    parser.add_argument('-vmsi', '--vmsuperinstructions', action='store_true')
+    return parser
 
-parser = argparse.ArgumentParser(description='evoscript CLI {v}'.format(v=C_VERSION))
-parser.add_argument('-p', '--parse', action='store_true')
-parser.add_argument('-i', '--input', type=str)
-parser.add_argument('-o', '--output', type=str)
-parser.add_argument('-e', '--execute', action='store_true')
-parser.add_argument('-l', '--stdlib', type=str)
-parser.add_argument('-v', '--vm', type=str)
-# Compiler specific limits for pre-executional boundary checking (optional)
-parser.add_argument('-vmos', '--vmoutsize', type=int)
 
-args = parser.parse_args()
+def main():
+    C_CONFIG = load_config()
 
-file_dir = None
-file_handle = None
+    if C_CONFIG['debug'] is True:
+        print("Debug mode enabled")
+        sys.tracebacklimit = 1
+    else:
+        sys.tracebacklimit = 0
 
-if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+
+    file_dir = None
+    file_handle = None
+    file_path = ''
+
+    if C_CONFIG.get('cache_dir'):
+        from esc.cache import ModuleCache
+        module_cache = ModuleCache(C_CONFIG['cache_dir'])
+    else:
+        module_cache = None
+
+    if args.clearcache:
+        if module_cache is not None:
+            print("** REMOVED {n} cached modules".format(n=module_cache.clear()))
+        if not args.input:
+            sys.exit(0)
 
     if args.input and len(args.input):
         if os.path.isabs(args.input):
             # Open file directly if exists
+            file_path = args.input
             with open(args.input, 'r') as f:
                 file_handle = f.read()
         else:
             if C_CONFIG['script_dirs'] is None or not len(C_CONFIG['script_dirs']):
                 raise FileNotFoundError('No script directories given')
             base_file = os.path.basename(args.input)
-            # Walk through all dirs (and config.additional_dirs) if file found there
-            found_file = False
-            for a_dir in C_CONFIG['script_dirs']:
-                for (dirpath, dirnames, filenames) in os.walk(a_dir):
-                    for filename in filenames:
-                        if filename == base_file:
-                            found_file = True
-                            file_dir = dirpath
-                            with open(os.sep.join([dirpath, filename]), 'r') as f:
-                                file_handle = f.read()
-                            break
-            if not found_file:
+            # Look up the file in all dirs (and config.additional_dirs), the index is shared with the parser
+            file_path = file_index(C_CONFIG.get('index_file') or '').find(C_CONFIG['script_dirs'], base_file)
+            if file_path is None:
                 raise FileNotFoundError('File {f} not found'.format(f=base_file))
+            file_dir = os.path.dirname(file_path)
+            with open(file_path, 'r') as f:
+                file_handle = f.read()
     else:
         print("** No file option given, exit")
         sys.exit(-1)
@@ -65,14 +86,49 @@ if __name__ == '__main__':
     else:
         lib_dir = C_CONFIG['stdlib_dir']
 
-    p = Parser(stdlib_dir=lib_dir)
-    statements = p.parse(file_handle)
+    from esc.parser import Parser
+    p = Parser(stdlib_dir=lib_dir, scanner=args.scanner, index=file_index(C_CONFIG.get('index_file') or ''),
+               cache=module_cache, jobs=args.jobs)
+    statements = p.parse(file_handle, file_name=file_path)
+
+    if args.modules:
+        # Imported modules (imports first, the script last) and their costs
+        for m in p.graph.report():
+            print("** MODULE {n}: {c} chars, {l} lines, {s} statements, {t:.3f} s{cached}, imports [{i}]".format(
+                n=m['name'], c=m['chars'], l=m['lines'], s=m['statements'], t=m['parse_time'],
+                cached=' (cached)' if m['cached'] else '', i=', '.join(m['imports'])))
+
+    if args.cachestats and module_cache is not None:
+        print("** CACHE {s}".format(s=', '.join('{k} {v}'.format(k=k, v=v) for k, v in module_cache.stats().items())))
 
     if not args.parse:
         # Default
-        c = CodeGenerator()
-        for statement in statements:
-            c.generate(statement)
+        from esc.codegen import CodeGenerator
+        options = {'superinstructions': args.vmsuperinstructions}
+        if args.optimize is not None:
+            options['opt_level'] = args.optimize
+        c = CodeGenerator(**options)
+        c.generate_program(statements)
+
+        if args.unused:
+            # Procedures removed by tree shaking
+            removed, saved = c.removed_procedures()
+            for name, size in removed.items():
+                print("** REMOVED procedure {n}: {b} bytes".format(n=name, b=size))
+            print("** REMOVED {n} unused procedures, saved {b} bytes".format(n=len(removed), b=saved))
+
+        if args.peepholestats and c.peephole is not None:
+            print("** PEEPHOLE {h}".format(h=', '.join('{k} {v}'.format(k=k, v=v) for k, v in c.peephole.hits.items())))
+
+        if args.framesizes:
+            # Local slots of each procedure, the VM sizes the frame of a call with them
+            for name, size in c.frames.items():
+                print("** FRAME {n}: {s} slots".format(n='<program>' if name is None else name, s=size))
+
+        if args.inlined and c.inliner is not None:
+            # Procedures replaced by copies of their code at their calls
+            for name, calls in c.inliner.inlined.items():
+                print("** INLINED procedure {n}: {c} calls".format(n=name, c=calls))
 
         # print(c.bytes_out)
         print(c.format())
@@ -103,6 +159,11 @@ if __name__ == '__main__':
             else:
                 vm_dir = C_CONFIG['vm_exe']
             if os.path.exists(vm_dir):
+                import subprocess
                 # CALL vm.exe with bytes_out -b option
                 subprocess.Popen([vm_dir, "-b"] + fbytes)
                 os.system('taskkill /f /im es_vm.exe')
+
+
+if __name__ == '__main__':
+    main()
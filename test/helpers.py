@@ -0,0 +1,30 @@
+import contextlib
+import io
+
+from esc.codegen import CodeGenerator
+from esc.parser import Parser
+
+
+def compile_program(src: str, **options) -> CodeGenerator:
+    """
+    Generate the code of a whole program (see CodeGenerator.generate_program), compiler output is suppressed
+    :param src: Script source
+    :param options: Options of the code generator
+    """
+    c = CodeGenerator(**options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        c.generate_program(Parser().parse(src))
+    return c
+
+
+def compile_statements(src: str, **options) -> CodeGenerator:
+    """
+    Generate the code of the statements one by one, without the whole program passes
+    :param src: Script source
+    :param options: Options of the code generator
+    """
+    c = CodeGenerator(**options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for statement in Parser().parse(src):
+            c.generate(statement)
+    return c
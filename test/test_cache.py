@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from esc.cache import ModuleCache
+from esc.codegen import CodeGenerator
+from esc.parser import Parser
+
+STDLIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stdlib')
+
+
+class TestModuleCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = ModuleCache(os.path.join(self._tmp.name, 'cache'))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    @staticmethod
+    def _compile(statements):
+        c = CodeGenerator()
+        for statement in statements:
+            c.generate(statement)
+        return c.bytes_out
+
+    def test_warm_parse(self):
+        src = 'import "stdlib"\nprint("" + abs(-3) + PI)\n'
+        expected = self._compile(Parser(stdlib_dir=STDLIB_DIR).parse(src))
+        cold = Parser(stdlib_dir=STDLIB_DIR, cache=self.cache).parse(src)
+        self.assertEqual({'hits': 0, 'misses': 3, 'stores': 3, 'entries': 3},
+                         {k: v for k, v in self.cache.stats().items() if k != 'bytes'})
+        with mock.patch.object(Parser, '_parse_module', side_effect=Parser._parse_module, autospec=True) as parse:
+            warm = Parser(stdlib_dir=STDLIB_DIR, cache=self.cache).parse(src)
+            # Only the input itself is parsed
+            self.assertEqual(1, parse.call_count)
+        self.assertEqual(3, self.cache.hits)
+        self.assertEqual(expected, self._compile(cold))
+        self.assertEqual(expected, self._compile(warm))
+
+    def test_key(self):
+        key = self.cache.key('let a = 1\n')
+        self.assertNotEqual(key, self.cache.key('let a = 2\n'))
+        with mock.patch('esc.cache.C_VERSION', 'other'):
+            self.assertNotEqual(key, self.cache.key('let a = 1\n'))
+
+    def test_clear(self):
+        Parser(stdlib_dir=STDLIB_DIR, cache=self.cache).parse('import "math"\nprint("" + PI)\n')
+        self.assertEqual(1, self.cache.clear())
+        self.assertEqual(0, self.cache.stats()['entries'])
+        self.assertEqual(0, self.cache.clear())
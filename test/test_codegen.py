@@ -1,10 +1,15 @@
+import contextlib
+import io
 import os
+import struct
 import subprocess
 import unittest
 
 from esc.codegen import CodeGenerator, OP
 from esc.parser import Parser
 
+from .helpers import compile_program
+
 
 class TestCodegen(unittest.TestCase):
 
@@ -668,3 +673,202 @@ class TestCodegen(unittest.TestCase):
         out, err = sub.communicate()
         lines = [s.decode("utf-8") for s in out.splitlines()[0:]]
         self.assertTrue(lines[0] == 'len of t: 32.000000')
+
+
+class TestEmitter(unittest.TestCase):
+
+    def test_encoding(self):
+        c = CodeGenerator()
+        c._emit_operation(OP.PUSH, arg1=1.5)
+        c._emit_operation(OP.ADD)
+        c._emit_operation(OP.PUSHS, arg1=2, arg2='ab')
+        c._emit_operation(OP.JFS)
+        self.assertEqual(bytes([OP.PUSH.value]) + struct.pack('>d', 1.5) +
+                         bytes([OP.ADD.value]) +
+                         bytes([OP.PUSHS.value]) + struct.pack('>d', 2) + b'ab' +
+                         bytes([OP.JFS.value]) + bytes(8), bytes(c.bytes_out))
+
+    def test_tiny_values(self):
+        # Operands with leading zero bytes were shortened (or rejected) by the hex string encoding
+        c = CodeGenerator()
+        for value in [1e-310, 2.5e-308, -1e-310]:
+            c._emit_operation(OP.PUSH, arg1=value)
+            self.assertEqual(value, c._format_arg(len(c.bytes_out) - 9))
+
+    def test_growth(self):
+        c = CodeGenerator()
+        n = CodeGenerator.CODE_BUFFER_SIZE
+        for i in range(n):
+            c._emit_operation(OP.PUSH, arg1=i)
+        self.assertEqual(9 * n, len(c.bytes_out))
+        self.assertEqual(n - 1, c._format_arg(9 * (n - 1)))
+
+    def test_backpatch(self):
+        c = CodeGenerator()
+        c._emit_operation(OP.JMP, arg1=0xFFFFFFFF)
+        c._emit_operation(OP.NOP)
+        c._backpatch(0, 10)
+        self.assertEqual(10, c._format_arg(0))
+        self.assertEqual(10, len(c.bytes_out))
+
+    def test_argument_too_large(self):
+        with self.assertRaises(Exception):
+            CodeGenerator()._emit_operation(OP.PUSH, arg1=0x100000000)
+
+
+class TestSuperinstructions(unittest.TestCase):
+
+    @staticmethod
+    def ops(src: str, superinstructions: bool = True) -> [(OP, object)]:
+        c = CodeGenerator(opt_level=0, superinstructions=superinstructions)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for statement in Parser().parse(src):
+                c.generate(statement)
+        return [(op, arg) for _, op, arg in c.instructions()]
+
+    def test_for_loop(self):
+        src = 'let i = 0\nfor i = 0 to 10\nprint("x")\nnext\n'
+        ops = self.ops(src)
+        # Loop head at 36: compare and jump behind the loop (92), the step is an increment
+        self.assertEqual([(OP.PUSH, 0.0), (OP.PUSHG, 0.0), (OP.PUSH, 0.0), (OP.PUSHG, 0.0), (OP.POPG, 0.0),
+                          (OP.PUSH, 10.0), (OP.JGT, 92.0), (OP.PUSHS, 'x'), (OP.PRINT, None), (OP.INCG, 0.0),
+                          (OP.JMP, 36.0)], ops)
+        self.assertNotIn(OP.JGT, [op for op, _ in self.ops(src, superinstructions=False)])
+
+    def test_branches(self):
+        for cmp, op in [('=', OP.JNOTEQ), ('<>', OP.JEQ), ('<', OP.JGTEQ), ('>', OP.JLTEQ), ('<=', OP.JGT),
+                        ('>=', OP.JLT)]:
+            ops = self.ops('let a = 1\nif(a {c} 2) then\nprint("x")\nendif\n'.format(c=cmp))
+            self.assertEqual(op, ops[4][0])
+        # repeat .. until jumps back while the condition is false
+        ops = self.ops('let a = 1\nrepeat\na = a * 2\nuntil a > 100\n')
+        self.assertEqual((OP.JLTEQ, 18.0), ops[-1])
+        # Other conditions keep JZ
+        self.assertIn(OP.JZ, [op for op, _ in self.ops('let a = 1\nif(a and 1) then\nprint("x")\nendif\n')])
+
+    def test_increment(self):
+        self.assertEqual((OP.INCG, 0.0), self.ops('let a = 1\na = 1 + a\n')[-1])
+        self.assertEqual((OP.INCL, 1.0), self.ops('func f(a)\nlet b = 1\nb = b + 1\nreturn b\nendfunc\n')[-4])
+        # Other steps and strings (concatenated) are added
+        self.assertEqual(OP.ADD, self.ops('let a = 1\na = a + 2\n')[-2][0])
+        self.assertEqual(OP.CONCAT, self.ops('let a = "1"\na = a + 1\n')[-2][0])
+        with self.assertRaises(Exception):
+            self.ops('let a = 1 const\na = a + 1\n')
+
+    def test_compare_global(self):
+        ops = self.ops('let a = 1\nlet b = 2\nlet c = a < b\n')
+        self.assertEqual([(OP.POPG, 0.0), (OP.LTG, 1.0), (OP.PUSHG, 2.0)], ops[4:])
+        # Locals are loaded
+        ops = self.ops('func f(a)\nreturn 1 = a\nendfunc\n')
+        self.assertIn((OP.POPL, 0.0), ops)
+        self.assertIn((OP.EQ, None), ops)
+
+
+# Operand stack effect of the operations in the procedures of TestTailCalls
+STACK_EFFECTS = {OP.PUSH: 1, OP.PUSHS: 1, OP.POPL: 1, OP.POPG: 1, OP.PUSHL: -1, OP.PUSHG: -1, OP.PUSHA: 0,
+                 OP.PUSHAS: -1, OP.ADD: -1, OP.SUB: -1, OP.MUL: -1, OP.CONCAT: -1, OP.EQ: -1, OP.GT: -1,
+                 OP.PRINT: -1, OP.JZ: -1, OP.JMP: 0, OP.JFS: 0}
+
+
+class TestTailCalls(unittest.TestCase):
+
+    def assertConstantDepth(self, c: CodeGenerator, entry: int, args: int):
+        # Follow all paths through the procedure at entry, the operand stack holds the arguments at the entry. A
+        # tail call has to jump back with the arguments of the next round and nothing else on the stack, and no
+        # call may push a return address
+        ops = {address: (op, arg) for address, op, arg in c.instructions()}
+        addresses = sorted(ops)
+        heights = {entry: args}
+        pending = [entry]
+        jumps = 0
+        while pending:
+            address = pending.pop()
+            op, arg = ops[address]
+            self.assertIsNot(OP.JMPFUN, op)
+            height = heights[address] + STACK_EFFECTS[op]
+            self.assertGreaterEqual(height, 0)
+            successors = []
+            if op in (OP.JMP, OP.JZ):
+                successors.append(int(arg))
+            if op not in (OP.JMP, OP.JFS):
+                successors.append(addresses[addresses.index(address) + 1])
+            for successor in successors:
+                if successor == entry:
+                    self.assertEqual(args, height)
+                    jumps += 1
+                elif successor not in heights:
+                    heights[successor] = height
+                    pending.append(successor)
+                else:
+                    self.assertEqual(heights[successor], height)
+        self.assertGreater(jumps, 0)
+
+    def test_func(self):
+        src = '''
+            func count(n, acc)
+                if(n = 0) then
+                    return acc
+                endif
+                return count(n - 1, acc + n)
+            endfunc
+            print("" + count(100, 0))
+            '''
+        self.assertConstantDepth(compile_program(src), 9, 2)
+        # Calls push their return address without tail call elimination
+        ops = [op for _, op, _ in compile_program(src, tail_calls=False).instructions()]
+        self.assertEqual(2, ops.count(OP.JMPFUN))
+        self.assertEqual(1, [op for _, op, _ in compile_program(src).instructions()].count(OP.JMPFUN))
+
+    def test_branches(self):
+        src = '''
+            func gcd(a, b)
+                if(b = 0) then
+                    return a
+                elseif(a > b) then
+                    return gcd(a - b, b)
+                else
+                    return gcd(a, b - a)
+                endif
+            endfunc
+            print("" + gcd(48, 18))
+            '''
+        self.assertConstantDepth(compile_program(src), 9, 2)
+
+    def test_sub(self):
+        src = '''
+            sub down(n)
+                if(n > 0) then
+                    print("" + n)
+                    down(n - 1)
+                    return
+                endif
+                down(n)
+            endsub
+            down(10)
+            '''
+        self.assertConstantDepth(compile_program(src), 9, 1)
+
+    def test_not_tail(self):
+        # The result is used, calls of other procedures and calls inside of loops
+        src = '''
+            func fact(n)
+                if(n <= 1) then
+                    return 1
+                endif
+                return n * fact(n - 1)
+            endfunc
+            func twice(n)
+                return fact(n)
+            endfunc
+            sub loop(n)
+                repeat
+                    loop(n - 1)
+                until(1)
+            endsub
+            func last(n)
+                last(n)
+            endfunc
+            loop(twice(3) + last(1))
+            '''
+        self.assertEqual(compile_program(src, tail_calls=False).bytes_out, compile_program(src).bytes_out)
+        self.assertFalse(compile_program(src, opt_level=0).tail_calls)
@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from esc import config
+
+
+class TestConfig(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'config.yml')
+        with open(self.path, 'w') as f:
+            f.write("debug: False\nscript_dirs: ['a', 'b']\n")
+
+    def tearDown(self):
+        config._CONFIGS.clear()
+        self._tmp.cleanup()
+
+    def test_cached(self):
+        self.assertEqual(['a', 'b'], config.load_config(self.path)['script_dirs'])
+        config._CONFIGS.clear()
+        # The cached config is read without YAML
+        with mock.patch.dict(sys.modules, {'yaml': None}):
+            self.assertEqual(['a', 'b'], config.load_config(self.path)['script_dirs'])
+
+    def test_changed_file(self):
+        config.load_config(self.path)
+        config._CONFIGS.clear()
+        with open(self.path, 'w') as f:
+            f.write("debug: True\nscript_dirs: []\n")
+        self.assertEqual([], config.load_config(self.path)['script_dirs'])
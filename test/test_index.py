@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from esc.index import FileIndex
+
+
+class TestFileIndex(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+        os.mkdir(os.path.join(self.root, 'lib'))
+        for path in ['main.es', os.path.join('lib', 'math.es')]:
+            with open(os.path.join(self.root, path), 'w') as f:
+                f.write('let a = 1\n')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_find(self):
+        index = FileIndex()
+        self.assertEqual(os.sep.join([self.root, 'main.es']), index.find([self.root], 'main.es'))
+        self.assertEqual(os.sep.join([self.root, 'lib', 'math.es']), index.find([self.root], 'math', stem=True))
+        self.assertIsNone(index.find([self.root], 'math'))
+        self.assertIsNone(index.find(['', os.path.join(self.root, 'missing')], 'main.es'))
+
+    def test_stale_directory(self):
+        index = FileIndex()
+        self.assertIsNone(index.find([self.root], 'types', stem=True))
+        with open(os.path.join(self.root, 'lib', 'types.es'), 'w') as f:
+            f.write('let b = 1\n')
+        # Force a different mtime on file systems with coarse timestamps
+        os.utime(os.path.join(self.root, 'lib'), ns=(0, 0))
+        self.assertEqual(os.sep.join([self.root, 'lib', 'types.es']), index.find([self.root], 'types', stem=True))
+
+    def test_persisted(self):
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        index_file = os.path.join(index_dir.name, 'index.json')
+        FileIndex(index_file).find([self.root], 'main.es')
+        self.assertTrue(os.path.exists(index_file))
+        with mock.patch('esc.index.os.walk', side_effect=AssertionError('walked')):
+            self.assertEqual(os.sep.join([self.root, 'lib', 'math.es']),
+                             FileIndex(index_file).find([self.root], 'math', stem=True))
+        os.utime(os.path.join(self.root, 'lib'), ns=(0, 0))
+        with mock.patch('esc.index.os.walk', side_effect=AssertionError('walked')):
+            with self.assertRaises(AssertionError):
+                FileIndex(index_file).find([self.root], 'math', stem=True)
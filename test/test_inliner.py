@@ -0,0 +1,110 @@
+import unittest
+
+from esc.codegen import CodeGenerator, OP
+from esc.inliner import Inliner
+from esc.ir import Instruction as I, Label
+
+from .helpers import compile_program
+
+
+def ops(c: CodeGenerator) -> [OP]:
+    return [op for _, op, _ in c.instructions()]
+
+
+class TestInliner(unittest.TestCase):
+
+    def test_single_call(self):
+        src = '''
+            sub greet(name)
+                print("hello " + name)
+                print("bye " + name)
+            endsub
+            greet("you")
+            '''
+        c = compile_program(src, opt_level=2)
+        self.assertEqual({'greet': 1}, c.inliner.inlined)
+        self.assertEqual({}, c.procedures)
+        self.assertNotIn(OP.JMPFUN, ops(c))
+        self.assertNotIn(OP.JFS, ops(c))
+        # The argument is bound to a local of the calling frame
+        self.assertEqual({None: 1}, c.frames)
+        self.assertLess(len(c.bytes_out), len(compile_program(src).bytes_out))
+
+    def test_small(self):
+        src = '''
+            func sq(n)
+                return n * n
+            endfunc
+            print("" + sq(2))
+            print("" + sq(3))
+            print("" + sq(4))
+            '''
+        c = compile_program(src, opt_level=2)
+        self.assertEqual({'sq': 3}, c.inliner.inlined)
+        self.assertNotIn(OP.JMPFUN, ops(c))
+        # Each copy gets its own local, the slot allocator lets them share one
+        self.assertEqual({None: 1}, c.frames)
+        self.assertEqual({None: 3}, compile_program(src, opt_level=2, slot_reuse=False).frames)
+
+    def test_kept(self):
+        src = '''
+            func fact(n)
+                if(n < 2) then
+                    return 1
+                endif
+                return n * fact(n - 1)
+            endfunc
+            sub outer(a)
+                sub inner(b)
+                    print("" + b)
+                endsub
+                inner(a)
+                inner(a + 1)
+            endsub
+            print("" + fact(5))
+            outer(1)
+            '''
+        c = compile_program(src, opt_level=2)
+        # Recursive procedures and procedures with nested procedures are kept, inner is inlined into outer
+        self.assertEqual({'inner': 2}, c.inliner.inlined)
+        self.assertEqual(['fact', 'outer'], sorted(c.procedures))
+        self.assertIsNone(compile_program(src).inliner)
+        self.assertIsNone(compile_program(src, opt_level=2, inline=False).inliner)
+
+    def test_limits(self):
+        head, entry, end = Label(), Label(), Label()
+        calls = []
+        for _ in range(3):
+            ret = Label()
+            calls += [I(OP.PUSH, target=ret), I(OP.JMPFUN, target=entry), ret]
+        code = [head, I(OP.JMP, target=end), entry, I(OP.PUSHL, 0), I(OP.POPL, 0), I(OP.PUSHS, 20, 'x' * 20), I(OP.PRINT), I(OP.JFS),
+                end] + calls
+        # Too large to be inlined at three calls
+        self.assertIs(code, Inliner({'p': (head, end)}, small=0).run(code))
+        # Within the size limit, but the copies grow the program beyond the budget
+        self.assertIs(code, Inliner({'p': (head, end)}, budget=0).run(code))
+        procedures = {'p': (head, end)}
+        inliner = Inliner(procedures, budget=1)
+        new = inliner.run(code)
+        self.assertEqual({'p': 3}, inliner.inlined)
+        self.assertEqual({}, procedures)
+        self.assertEqual([OP.PUSHL, OP.POPL, OP.PUSHS, OP.PRINT] * 3, [ins.op for ins in new if type(ins) is not Label])
+        self.assertEqual([0, 0, 1, 1, 2, 2], [ins.arg1 for ins in new if ins.op in (OP.PUSHL, OP.POPL)])
+
+    def test_returns(self):
+        # Returns inside of the body jump behind the inlined call
+        src = '''
+            func sign(n)
+                if(n < 0) then
+                    return "-"
+                endif
+                return "+"
+            endfunc
+            print("sign " + sign(-1))
+            '''
+        c = compile_program(src, opt_level=2)
+        self.assertEqual({'sign': 1}, c.inliner.inlined)
+        self.assertNotIn(OP.JFS, ops(c))
+        # The first return jumps over the second one, the jump of the second one to the next operation is removed
+        self.assertEqual(1, ops(c).count(OP.JMP))
+        self.assertEqual(2, ops(compile_program(src, opt_level=2, peephole=False)).count(OP.JMP))
@@ -0,0 +1,107 @@
+import contextlib
+import io
+import unittest
+
+from esc.codegen import CodeGenerator, OP
+from esc.ir import ControlFlowGraph, Instruction as I, Label, Pass, PassManager, instruction_count
+from esc.parser import Parser
+
+
+class DropPrint(Pass):
+    name = 'drop-print'
+
+    def run(self, code):
+        return [element for element in code if element.op is not OP.PRINT]
+
+
+class TestControlFlowGraph(unittest.TestCase):
+
+    def test_blocks(self):
+        start, end = Label('start'), Label('end')
+        code = [I(OP.PUSH, 1), start, I(OP.POPG, 0), I(OP.JZ, target=end), I(OP.PRINT), I(OP.JMP, target=start),
+                end, I(OP.PUSH, 2)]
+        cfg = ControlFlowGraph(code)
+        self.assertEqual([1, 2, 2, 1], [len(block.instructions) for block in cfg.blocks])
+        entry, loop, body, after = cfg.blocks
+        self.assertEqual([start], loop.labels)
+        self.assertIs(after, cfg.block_of[end])
+        self.assertEqual([loop], entry.successors)
+        # JZ jumps to end or continues with the body, JMP only jumps back
+        self.assertEqual([after, body], loop.successors)
+        self.assertEqual([loop], body.successors)
+        self.assertEqual([entry, body], loop.predecessors)
+        self.assertEqual(code, cfg.code())
+
+    def test_return(self):
+        entry, end = Label(), Label()
+        code = [I(OP.JMP, target=end), entry, I(OP.PRINT), I(OP.JFS), end, I(OP.JMPFUN, target=entry), I(OP.PRINT)]
+        cfg = ControlFlowGraph(code)
+        guard, proc, call, after = cfg.blocks
+        self.assertEqual([call], guard.successors)
+        self.assertEqual([], proc.successors)
+        self.assertEqual([proc, after], call.successors)
+
+
+class TestPassManager(unittest.TestCase):
+
+    def test_stats(self):
+        code = [I(OP.PUSHS, 1, 'a'), I(OP.PRINT), Label(), I(OP.PRINT)]
+        passes = PassManager([DropPrint()])
+        new = passes.run(code)
+        self.assertEqual({'drop-print': (3, 1)}, passes.stats)
+        self.assertEqual(1, instruction_count(new))
+        # The given code is kept
+        self.assertEqual(3, instruction_count(code))
+
+    def test_codegen(self):
+        c = CodeGenerator(peephole=False)
+        c.passes.add(DropPrint())
+        with contextlib.redirect_stdout(io.StringIO()):
+            c.generate_program(Parser().parse('print("a")\nlet a = 1\n'))
+        self.assertEqual([(OP.PUSHS, 'a'), (OP.PUSH, 1.0), (OP.PUSHG, 0.0)],
+                         [(op, arg) for _, op, arg in c.instructions()])
+        self.assertEqual((4, 3), c.passes.stats['drop-print'])
+
+
+class TestEncode(unittest.TestCase):
+
+    def test_labels(self):
+        c = CodeGenerator()
+        end = Label()
+        c.code = [I(OP.JZ, target=end), I(OP.PRINT), I(OP.PUSHS, 2, 'ab'), end, I(OP.PUSH, 1)]
+        c.encode()
+        self.assertEqual([(0, OP.JZ, 21.0), (9, OP.PRINT, None), (10, OP.PUSHS, 'ab'), (21, OP.PUSH, 1.0)],
+                         c.instructions())
+        # Encoded again after the code changed
+        c.code.insert(0, I(OP.PRINT))
+        c.optimize_code()
+        self.assertEqual((1, OP.JZ, 22.0), c.instructions()[1])
+
+    def test_program(self):
+        # Byte code of the intermediate code without passes equals the one of the unoptimized program
+        src = '''
+            func f(n)
+                if(n < 2) then
+                    return n
+                endif
+                return f(n - 1) + f(n - 2)
+            endfunc
+            repeat
+                print("" + f(5))
+            until(1)
+            '''
+        c = CodeGenerator(opt_level=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            c.generate_program(Parser().parse(src))
+        addresses = [address for address, _, _ in c.instructions()]
+        encoded = CodeGenerator(opt_level=0)
+        for address, op, arg in c.instructions():
+            if op in (OP.JMP, OP.JZ, OP.JMPFUN):
+                self.assertIn(arg, addresses)
+            if op is OP.PUSHS:
+                encoded._emit_operation(op, len(arg.encode('utf-8')), arg)
+            else:
+                encoded._emit_operation(op, arg)
+        self.assertEqual(encoded.bytes_out, c.bytes_out)
+        # The guard jump of f skips the procedure
+        self.assertEqual((OP.JMP, float(c.procedures['f'])), c.instructions()[0][1:])
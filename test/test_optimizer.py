@@ -0,0 +1,380 @@
+import contextlib
+import io
+import unittest
+
+from esc.codegen import CodeGenerator, OP
+from esc.optimizer import LoopInvariantMotion
+from esc.parser import Parser, CallNode, LoopNode, OpType
+
+from .helpers import compile_program, compile_statements
+
+
+
+
+
+class TestConstantFolding(unittest.TestCase):
+
+    def assertFolded(self, src: str, saved: int, expected: [(OP, object)] = None):
+        # saved: number of instructions removed by folding
+        plain = compile_statements(src, opt_level=0).instructions()
+        folded = compile_statements(src, opt_level=1).instructions()
+        self.assertEqual(len(plain) - saved, len(folded))
+        if expected is not None:
+            self.assertEqual(expected, [(op, arg) for _, op, arg in folded])
+
+    def test_arithmetic(self):
+        self.assertFolded('let a = 1 + 2 * 3', 4, [(OP.PUSH, 7.0), (OP.PUSHG, 0.0)])
+        self.assertFolded('let a = (10 - 4) / 4', 4, [(OP.PUSH, 1.5), (OP.PUSHG, 0.0)])
+        self.assertFolded('let a = 7 mod 3', 2, [(OP.PUSH, 1.0), (OP.PUSHG, 0.0)])
+        # Right associative like the generated code: 10 - (2 - 3)
+        self.assertFolded('let a = 10 - 2 - 3', 4, [(OP.PUSH, 11.0), (OP.PUSHG, 0.0)])
+
+    def test_comparison_and_logic(self):
+        self.assertFolded('let a = 1 < 2', 2, [(OP.PUSH, 1.0), (OP.PUSHG, 0.0)])
+        self.assertFolded('let a = 2 <> 2 or 3 >= 4', 6, [(OP.PUSH, 0.0), (OP.PUSHG, 0.0)])
+        self.assertFolded('let a = 1 = 1 and 2', 4, [(OP.PUSH, 1.0), (OP.PUSHG, 0.0)])
+
+    def test_strings(self):
+        self.assertFolded('print("a" + "b" + "c")', 4, [(OP.PUSHS, 'abc'), (OP.PRINT, None)])
+        # Numbers are formatted by the VM
+        self.assertFolded('print("a" + 1)', 0)
+
+    def test_partial(self):
+        self.assertFolded('let x = 2\nlet a = x * (2 + 3)', 2)
+        self.assertFolded('let x = 2\nlet a = x * 2 + 3', 0)
+
+    def test_statements(self):
+        src = '''
+            let x = 1
+            let a = [1, 1 + 1, 2 * 2]
+            if(x = 1 + 1) then
+                print("x" + "y")
+            endif
+            func f(v)
+                return v * (4 / 2)
+            endfunc
+            for x = 0 to 2 * 5
+                print("" + f(x + 0))
+            next
+            '''
+        self.assertFolded(src, 12)
+
+    def test_not_folded(self):
+        self.assertFolded('let a = -7 mod 2', 0)
+        self.assertFolded('let a = 7.5 mod 2', 0)
+        self.assertFolded('let a = 65536 * 65536', 0)
+        self.assertFolded('let a = "a" = "a"', 0)
+
+    def test_tree_unchanged(self):
+        statements = Parser().parse('let a = [1 + 2]\nprint("a" + "b")\n')
+        c = CodeGenerator(opt_level=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for statement in statements:
+                c.generate(statement)
+        c = CodeGenerator(opt_level=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for statement in statements:
+                c.generate(statement)
+        self.assertEqual(compile_statements('let a = [1 + 2]\nprint("a" + "b")\n', opt_level=0).bytes_out, c.bytes_out)
+
+
+class TestConstantPropagation(unittest.TestCase):
+
+    @staticmethod
+    def ops(src: str, opt_level: int = 1) -> [(OP, object)]:
+        return [(op, arg) for _, op, arg in compile_statements(src, opt_level=opt_level).instructions()]
+
+    def test_folded(self):
+        self.assertEqual([(OP.PUSH, 2 * 3.5), (OP.PUSHG, 0.0)], self.ops('let PI = 3.5 const\nlet a = 2 * PI'))
+        self.assertEqual([(OP.PUSHS, 'ab'), (OP.PRINT, None)], self.ops('let A = "a" const\nprint(A + "b")'))
+        self.assertEqual([(OP.PUSH, -3.5), (OP.PUSHG, 0.0)], self.ops('let PI = 3.5 const\nlet a = -PI'))
+        # Consts of consts
+        self.assertEqual([(OP.PUSH, 6.0), (OP.PUSHG, 0.0)],
+                         self.ops('let A = 2 const\nlet B = A + 1 const\nlet a = A * B'))
+
+    def test_slot_dropped(self):
+        src = 'let A = 1 const\nlet b = 2\nlet c = b + A\n'
+        self.assertEqual([(OP.PUSH, 2.0), (OP.PUSHG, 0.0), (OP.POPG, 0.0), (OP.PUSH, 1.0), (OP.ADD, None),
+                          (OP.PUSHG, 1.0)], self.ops(src))
+        # Unoptimized, A is stored in global 0 and b and c follow
+        self.assertEqual([(OP.PUSH, 1.0), (OP.PUSHG, 0.0), (OP.PUSH, 2.0), (OP.PUSHG, 1.0), (OP.POPG, 1.0),
+                          (OP.POPG, 0.0), (OP.ADD, None), (OP.PUSHG, 2.0)], self.ops(src, opt_level=0))
+
+    def test_not_propagated(self):
+        # Not a literal, stored as before
+        self.assertEqual(self.ops('let a = 1\nlet B = a const\nprint("" + B)', opt_level=0),
+                         self.ops('let a = 1\nlet B = a const\nprint("" + B)'))
+        # Local declarations shadow the const
+        src = '''
+            let A = 1 const
+            func f(A)
+                return A * 2
+            endfunc
+            print("" + f(3) + A)
+            '''
+        ops = self.ops(src)
+        self.assertIn((OP.POPL, 0.0), ops)
+        self.assertIn((OP.PUSH, 1.0), ops)
+        self.assertNotIn((OP.POPG, 0.0), ops)
+
+    def test_element(self):
+        # The element read of a const without slot loads it from a global the value is stored into first
+        self.assertEqual([(OP.PUSHS, 'c'), (OP.PUSHS, 'hello'), (OP.PUSHG, 0.0), (OP.PUSHA, 1.0), (OP.POPG, 0.0),
+                          (OP.CONCAT, 0.0), (OP.PRINT, None), (OP.PUSHS, 'hello'), (OP.PUSHG, 0.0), (OP.PUSHA, 2.0),
+                          (OP.POPG, 0.0), (OP.PUSHG, 1.0), (OP.POPG, 1.0), (OP.PUSHS, 'hello'), (OP.CONCAT, 0.0),
+                          (OP.PRINT, None)],
+                         self.ops('let S = "hello" const\nprint("c" + S[1])\nlet x = S[2]\nprint(x + S)'))
+
+    def test_modify(self):
+        with self.assertRaises(Exception):
+            compile_statements('let A = 1 const\nA = 2\n', opt_level=1)
+        with self.assertRaises(Exception):
+            compile_statements('let A = 1 const\nA[0] = 2\n', opt_level=1)
+
+
+class TestTreeShaking(unittest.TestCase):
+
+    def test_unused_removed(self):
+        src = '''
+            func helper(n)
+                return n * 2
+            endfunc
+            func used(n)
+                return helper(n) + 1
+            endfunc
+            func unused(n)
+                return helper(n)
+            endfunc
+            sub recursive()
+                recursive()
+                print("again")
+            endsub
+            print("" + used(1))
+            '''
+        c = compile_program(src)
+        self.assertEqual({'used', 'helper'}, set(c.procedures))
+        removed, saved = c.removed_procedures()
+        self.assertEqual(['recursive', 'unused'], sorted(removed))
+        self.assertEqual(sum(removed.values()), saved)
+        self.assertEqual(len(compile_program(src, opt_level=0).bytes_out) - saved, len(c.bytes_out))
+
+    def test_superinstructions(self):
+        # Measured on the same fused code as the program itself
+        src = '''
+            func unused(n)
+                return n * 2
+            endfunc
+            let i = 0
+            repeat
+                i = i + 1
+            until(i = 3)
+            '''
+        c = compile_program(src, superinstructions=True)
+        full = compile_program(src, superinstructions=True, tree_shaking=False)
+        removed, saved = c.removed_procedures()
+        self.assertEqual({'unused': full.procedures['unused']}, removed)
+        self.assertEqual(len(full.bytes_out) - len(c.bytes_out), saved)
+        self.assertEqual(saved, removed['unused'])
+
+    def test_inlined(self):
+        # Removed procedures are measured without inlining, dead2 is only called by dead1
+        src = '''
+            func dead2(n)
+                return n * 2
+            endfunc
+            func dead1(n)
+                return dead2(n) + 1
+            endfunc
+            func used(n)
+                return n + 1
+            endfunc
+            print("" + used(1))
+            '''
+        c = compile_program(src, opt_level=2)
+        self.assertEqual({'used': 1}, c.inliner.inlined)
+        full = compile_program(src, opt_level=2, tree_shaking=False, inline=False)
+        shaken = compile_program(src, opt_level=2, inline=False)
+        removed, saved = c.removed_procedures()
+        self.assertEqual({'dead1': full.procedures['dead1'], 'dead2': full.procedures['dead2']}, removed)
+        self.assertEqual(sum(removed.values()), saved)
+        self.assertEqual(len(full.bytes_out) - len(shaken.bytes_out), saved)
+
+    def test_nested(self):
+        src = '''
+            sub outer()
+                sub inner()
+                    print("inner")
+                endsub
+            endsub
+            sub other()
+                print("other")
+            endsub
+            inner()
+            '''
+        c = compile_program(src)
+        # inner is only defined when outer is generated
+        self.assertEqual({'outer', 'inner'}, set(c.procedures))
+        self.assertEqual(['other'], list(c.removed_procedures()[0]))
+
+    def test_kept(self):
+        # Used as value, and levels without tree shaking
+        src = 'func f()\nreturn 1\nendfunc\nlet a = f\n'
+        self.assertEqual({'f'}, set(compile_program(src).procedures))
+        src = 'func f()\nreturn 1\nendfunc\n'
+        self.assertEqual({'f'}, set(compile_program(src, opt_level=0).procedures))
+        self.assertEqual(({}, 0), compile_program(src, opt_level=0).removed_procedures())
+        self.assertEqual({'f'}, set(compile_program(src, tree_shaking=False).procedures))
+
+    def test_tree_unchanged(self):
+        statements = Parser().parse('func f()\nreturn 1\nendfunc\nprint("a")\n')
+        c = CodeGenerator()
+        with contextlib.redirect_stdout(io.StringIO()):
+            c.generate_program(statements)
+        self.assertEqual(2, len(statements))
+        self.assertEqual({}, c.procedures)
+
+
+class TestLoopInvariantMotion(unittest.TestCase):
+
+    @staticmethod
+    def hoisted(src: str) -> [str]:
+        # Names of the temporaries of the first loop and the right sides they are assigned
+        loop = next(statement for statement in Parser().parse(src) if type(statement) is LoopNode)
+        new = LoopInvariantMotion().transform(loop)
+        return [(type(assignment.right).__name__, assignment.left.value) for assignment in new.preheader]
+
+    @staticmethod
+    def loop_ops(src: str, opt_level: int = 2) -> ([OP], [OP]):
+        # Operations in front of the loop head and inside of the loop (the last backward jump)
+        instructions = compile_statements(src, opt_level=opt_level).instructions()
+        address, _, head = [i for i in instructions if i[1] in (OP.JMP, OP.JZ) and i[2] < i[0]][-1]
+        return [op for a, op, _ in instructions if a < head], [op for a, op, _ in instructions if head <= a <= address]
+
+    def test_until(self):
+        src = '''
+            let a = [1, 2, 3]
+            let n = 2
+            let s = 0
+            let i = 0
+            repeat
+                s = s + a[i] * (n + 1)
+                i = i + 1
+            until(i = len(a))
+            print("" + s)
+            '''
+        self.assertEqual([('CallNode', '.inv0'), ('TermNode', '.inv1')], self.hoisted(src))
+        before, loop = self.loop_ops(src)
+        self.assertIn(OP.LEN, before)
+        self.assertNotIn(OP.LEN, loop)
+        # POPG a, LEN and POPG n, PUSH 1, ADD are loads of the temporaries now
+        unoptimized = self.loop_ops(src, opt_level=1)[1]
+        self.assertIn(OP.LEN, unoptimized)
+        self.assertEqual(len(unoptimized) - 3, len(loop))
+
+    def test_for(self):
+        src = '''
+            let a = [1, 2, 3]
+            let i = 0
+            for i = 0 to len(a) - 1
+                print("" + a[i])
+            next
+            '''
+        self.assertEqual([('TermNode', '.inv0')], self.hoisted(src))
+        before, loop = self.loop_ops(src)
+        self.assertIn(OP.LEN, before)
+        self.assertNotIn(OP.SUB, loop)
+
+    def test_shared(self):
+        src = '''
+            let n = 2
+            let i = 0
+            repeat
+                i = i + n * 3
+            until(i > n * 3)
+            '''
+        self.assertEqual([('TermNode', '.inv0')], self.hoisted(src))
+
+    def test_not_hoisted(self):
+        # Assigned, declared in the loop, arrays with stored elements and loops calling procedures
+        sources = ['''
+            let n = 2
+            let i = 0
+            repeat
+                i = i + n * 3
+                n = n + 1
+            until(i > 10)
+            ''', '''
+            let n = 2
+            let i = 0
+            repeat
+                let n = i
+                i = i + n * 3
+            until(i > 10)
+            ''', '''
+            let a = [1, 2]
+            let i = 0
+            repeat
+                a[i] = i
+                i = i + 1
+            until(i = len(a))
+            ''', '''
+            let n = 2
+            let i = 0
+            sub f()
+                n = n + 1
+            endsub
+            repeat
+                f()
+                i = i + n * 3
+            until(i > 10)
+            ''']
+        for src in sources:
+            self.assertEqual([], self.hoisted(src), src)
+
+    def test_conditional(self):
+        # Expressions that may not be evaluated are only moved if their evaluation cannot fail
+        src = '''
+            let a = [1, 2]
+            let n = 2
+            let i = 0
+            repeat
+                i = i + 1
+                if(i > 5) then
+                    exit
+                endif
+                print("" + (n * 2) + (10 / n))
+            until(i = len(a))
+            '''
+        self.assertEqual([('TermNode', '.inv0')], self.hoisted(src))
+
+    def test_output(self):
+        # Expressions behind a print stay in the loop if they may fail, the failure has to come after the output
+        src = '''
+            let a = [1, 2]
+            let k = 9
+            let d = 0
+            let n = 2
+            let s = 0
+            let i = 0
+            repeat
+                print("iter " + i)
+                s = s + a[k] + 10 / d + n * 2
+                i = i + 1
+            until(i = len(a))
+            '''
+        self.assertEqual([('TermNode', '.inv0')], self.hoisted(src))
+        loop = next(statement for statement in Parser().parse(src) if type(statement) is LoopNode)
+        new = LoopInvariantMotion().transform(loop)
+        self.assertEqual(OpType.MUL, new.preheader[0].right.op)
+        self.assertEqual(CallNode, type(new.left.right))
+        # The arguments of the first print are evaluated in front of it
+        self.assertEqual([('TermNode', '.inv0'), ('TermNode', '.inv1')],
+                         self.hoisted(src.replace('"iter " + i', '"" + a[k]')))
+
+    def test_tree_unchanged(self):
+        statements = Parser().parse('let n = 1\nlet i = 0\nrepeat\ni = i + n * 2\nuntil(i > 9)\n')
+        loop = statements[2]
+        right = loop.right[0].right
+        self.assertEqual(1, len(LoopInvariantMotion().transform(loop).preheader))
+        self.assertEqual([], loop.preheader)
+        self.assertIs(right, loop.right[0].right)
@@ -1,6 +1,11 @@
+import os
+import tempfile
 import unittest
-from esc.parser import Parser, ProcSubNode
-from esc.scanner import TokenType
+from esc.parser import Parser, ProcSubNode, CallNode, AssignmentNode, ParseSyntaxException, ImportCycleException, \
+    TermNode, OpType, Node
+from esc.scanner import Token, TokenType, ScanWrongTokenException
+from esc import sourcemap
+from esc.sourcemap import SourceFile, SourceMap
 
 
 class TestParser(unittest.TestCase):
@@ -43,3 +48,213 @@ class TestParser(unittest.TestCase):
         self.assertTrue(len(statements[0].args) == 0)
         self.assertTrue(statements[0].left.ttype == TokenType.IDENTIFIER)
         self.assertTrue(statements[0].left)
+
+    def test_call_or_assignment_lookahead(self):
+        for scanner in ['table', 'classic']:
+            p = Parser(scanner=scanner)
+            statements = p.parse('''
+                                    let a = [1, 2]
+                                    my_sub(a)
+                                    a[0] = my_func(1)
+                                    a = 3
+                                    '''
+                                 )
+            self.assertIsInstance(statements[1], CallNode)
+            self.assertIsInstance(statements[2], AssignmentNode)
+            self.assertIsInstance(statements[2].right, CallNode)
+            self.assertIsInstance(statements[3], AssignmentNode)
+            self.assertTrue(statements[3].modify)
+
+
+class TestSourceMap(unittest.TestCase):
+
+    def test_clean_equals_clean_string(self):
+        for s in ['', '\n\n', 'let a = 1', '  let a = 1\r\n\t\n  let b = 2  \n', ' a\x0cb\n\n  c']:
+            clean_str, clean_map = sourcemap.clean(s, SourceMap.of(SourceFile('t', s)))
+            self.assertEqual(Parser._clean_string(s), clean_str)
+
+    def test_position(self):
+        source = SourceFile('t', 'ab\ncd\n\nef')
+        self.assertEqual((1, 1), source.position(0))
+        self.assertEqual((1, 3), source.position(2))
+        self.assertEqual((2, 2), source.position(4))
+        self.assertEqual((4, 1), source.position(7))
+
+    def test_parse_error_location(self):
+        src = '# comment\n\n   let a = 1\n   let b = (2 +\n\tlet c = 3\n'
+        with self.assertRaises(ParseSyntaxException) as cm:
+            Parser().parse(src, file_name='t.es')
+        self.assertEqual('t.es', cm.exception.location.file)
+        self.assertEqual(5, cm.exception.location.line)
+        self.assertEqual(src.index('let c') + len('let'), cm.exception.location.offset)
+        self.assertTrue(str(cm.exception).endswith(',t.es:5:5'))
+
+    def test_scan_error_location(self):
+        for scanner in ['table', 'classic']:
+            with self.assertRaises(ScanWrongTokenException) as cm:
+                Parser(scanner=scanner).parse('let a = 1\n    let b = 2 ; 3\n', file_name='t.es')
+            self.assertEqual((2, 15), (cm.exception.location.line, cm.exception.location.column))
+
+    def test_import_error_location(self):
+        with tempfile.TemporaryDirectory() as lib_dir:
+            lib_file = os.path.join(lib_dir, 'lib.es')
+            with open(lib_file, 'w') as f:
+                f.write('sub lib_sub\n    print("lib")\nendsub\n\n  let 5 = 1\n')
+            with self.assertRaises(ParseSyntaxException) as cm:
+                Parser(stdlib_dir=lib_dir).parse('import "lib"\nlib_sub()\n', file_name='main.es')
+            self.assertEqual(lib_file, cm.exception.location.file)
+            self.assertEqual((5, 7), (cm.exception.location.line, cm.exception.location.column))
+            with open(lib_file, 'w') as f:
+                f.write('sub lib_sub\n    print("lib")\nendsub\n')
+            with self.assertRaises(ParseSyntaxException) as cm:
+                Parser(stdlib_dir=lib_dir).parse('import "lib"\n\n  lib_sub(\n', file_name='main.es')
+            self.assertEqual('main.es', cm.exception.location.file)
+            self.assertEqual(3, cm.exception.location.line)
+
+
+class TestImports(unittest.TestCase):
+
+    def _write(self, lib_dir, name, text):
+        with open(os.path.join(lib_dir, name + '.es'), 'w') as f:
+            f.write(text)
+
+    def test_nested_imports_merged(self):
+        with tempfile.TemporaryDirectory() as lib_dir:
+            self._write(lib_dir, 'a', 'import "c"\nlet a = 1\n')
+            self._write(lib_dir, 'b', 'let b = 2\n')
+            self._write(lib_dir, 'c', 'let c = 3\n')
+            p = Parser(stdlib_dir=lib_dir)
+            statements = p.parse('import "a"\nimport "b"\nlet m = 4\n')
+            # Later imports first, nested imports in front of their importer
+            self.assertEqual(['b', 'c', 'a', 'm'], [s.left.value for s in statements])
+            self.assertEqual(3, len(p.modules))
+            self.assertEqual([p.modules[os.sep.join([lib_dir, 'c.es'])]],
+                             p.modules[os.sep.join([lib_dir, 'a.es'])].imports)
+
+    def test_import_after_statement(self):
+        with tempfile.TemporaryDirectory() as lib_dir:
+            self._write(lib_dir, 'a', 'let a = 1\n')
+            with self.assertRaises(ParseSyntaxException):
+                Parser(stdlib_dir=lib_dir).parse('let m = 4\nimport "a"\n')
+
+    def test_diamond_imported_once(self):
+        with tempfile.TemporaryDirectory() as lib_dir:
+            self._write(lib_dir, 'a', 'import "c"\nlet a = 1\n')
+            self._write(lib_dir, 'b', 'import "c"\nlet b = 2\n')
+            self._write(lib_dir, 'c', 'let c = 3\n')
+            p = Parser(stdlib_dir=lib_dir)
+            statements = p.parse('import "a"\nimport "b"\nlet m = 4\n', file_name='main.es')
+            self.assertEqual(['c', 'b', 'a', 'm'], [s.left.value for s in statements])
+            report = p.graph.report()
+            self.assertEqual([os.sep.join([lib_dir, n + '.es']) for n in 'cba'] + ['main.es'],
+                             [r['name'] for r in report])
+            self.assertEqual([1, 1, 1, 1], [r['statements'] for r in report])
+            self.assertEqual(3, len(p.graph.dependencies()))
+            self.assertEqual(['c'], [os.path.basename(m.name)[0] for m in p.graph.dependencies(p.graph.order()[1])])
+
+    def test_import_cycle(self):
+        with tempfile.TemporaryDirectory() as lib_dir:
+            self._write(lib_dir, 'a', 'import "b"\nlet a = 1\n')
+            self._write(lib_dir, 'b', 'import "a"\nlet b = 2\n')
+            with self.assertRaises(ImportCycleException) as cm:
+                Parser(stdlib_dir=lib_dir).parse('import "a"\nlet m = 4\n')
+            self.assertIn('a.es -> ', str(cm.exception))
+
+
+class TestExpressions(unittest.TestCase):
+
+    @staticmethod
+    def _expression(src: str):
+        return Parser().parse('let x = {e}\n'.format(e=src))[0].right
+
+    def test_precedence(self):
+        # a or b and c < d + e mod f * g
+        node = self._expression('a or b and c < d + e mod f * g')
+        self.assertEqual(OpType.OR, node.op)
+        self.assertEqual('a', node.left.value)
+        node = node.right
+        self.assertEqual(OpType.AND, node.op)
+        node = node.right
+        self.assertEqual(OpType.LT, node.op)
+        node = node.right
+        self.assertIsInstance(node, TermNode)
+        self.assertEqual(OpType.ADD, node.op)
+        node = node.right
+        self.assertEqual(OpType.MOD, node.op)
+        self.assertEqual('e', node.left.value)
+        self.assertEqual(OpType.MUL, node.right.op)
+
+    def test_right_nesting(self):
+        # Operators of the same level nest to the right
+        node = self._expression('a - b - c')
+        self.assertEqual(('a', OpType.SUB), (node.left.value, node.op))
+        self.assertEqual(('b', OpType.SUB, 'c'), (node.right.left.value, node.right.op, node.right.right.value))
+
+    def test_long_expression(self):
+        terms = 100000
+        node = self._expression(' + '.join(['a'] * terms))
+        depth = 1
+        while isinstance(node, TermNode):
+            self.assertEqual(OpType.ADD, node.op)
+            self.assertEqual('a', node.left.value)
+            node = node.right
+            depth += 1
+        self.assertEqual(terms, depth)
+
+    def test_slotted_nodes(self):
+        statements = Parser().parse('let a = [1, 2]\nif(a[0] < 2) then\n    print("x" + a[1])\nendif\n')
+        nodes = list(statements)
+        while nodes:
+            node = nodes.pop()
+            self.assertFalse(hasattr(node, '__dict__'), type(node).__name__)
+            for name in ['left', 'right', 'value', 'index', 'args', 'values']:
+                child = getattr(node, name, None)
+                if isinstance(child, list):
+                    nodes.extend(c for c in child if isinstance(c, (Node, Token)))
+                elif isinstance(child, (Node, Token)):
+                    nodes.append(child)
+
+
+class TestParallelImports(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.lib_dir = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, name, text):
+        with open(os.path.join(self.lib_dir, name + '.es'), 'w') as f:
+            f.write(text)
+
+    def _parse(self, src, jobs):
+        p = Parser(stdlib_dir=self.lib_dir, jobs=jobs)
+        # Use worker processes for every level with more than one module
+        p.PARALLEL_MIN_CHARS = 0
+        try:
+            return p.parse(src, file_name='main.es'), p
+        except Exception as e:
+            return e, p
+
+    def test_same_as_serial(self):
+        self._write('a', 'import "c"\nimport "d"\nlet a = 1\n')
+        self._write('b', 'import "d"\nlet b = 2\n')
+        self._write('c', 'func c_func(x)\n    return x * 2 + 1\nendfunc\n')
+        self._write('d', 'let d = [1, 2, 3]\n')
+        src = 'import "a"\nimport "b"\nlet m = c_func(d[0])\n'
+        serial, p_serial = self._parse(src, jobs=1)
+        parallel, p_parallel = self._parse(src, jobs=2)
+        self.assertEqual([r['name'] for r in p_serial.graph.report()], [r['name'] for r in p_parallel.graph.report()])
+        self.assertEqual([type(s) for s in serial], [type(s) for s in parallel])
+        self.assertEqual([s.left.value for s in serial], [s.left.value for s in parallel])
+
+    def test_same_errors_as_serial(self):
+        self._write('a', 'import "c"\nlet a = 1\n')
+        self._write('b', 'let 5 = 2\n')
+        self._write('c', 'let c = (1\n')
+        for src in ['import "a"\nimport "b"\n', 'import "b"\nimport "a"\n', 'import "a"\nimport "x"\nimport "b"\n']:
+            serial, _ = self._parse(src, jobs=1)
+            parallel, _ = self._parse(src, jobs=2)
+            self.assertIsInstance(serial, Exception)
+            self.assertEqual((type(serial), str(serial)), (type(parallel), str(parallel)))
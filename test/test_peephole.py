@@ -0,0 +1,122 @@
+import contextlib
+import io
+import unittest
+
+from esc.codegen import CodeGenerator, OP
+from esc.ir import Instruction as I, Label, PassManager
+from esc.parser import Parser
+from esc.peephole import Peephole, NegLiteral
+
+
+def optimize(code: list, peephole: Peephole = None) -> ([(OP, object)], Peephole):
+    c = CodeGenerator()
+    c.peephole = peephole or Peephole()
+    c.passes = PassManager([c.peephole])
+    c.code = code
+    c.optimize_code()
+    return [(op, arg) for _, op, arg in c.instructions()], c.peephole
+
+
+class TestPeephole(unittest.TestCase):
+
+    def test_load_store(self):
+        ops, p = optimize([I(OP.POPG, 0), I(OP.PUSHG, 0), I(OP.POPL, 1), I(OP.PUSHL, 1), I(OP.POPL, 1),
+                           I(OP.PUSHL, 2)])
+        self.assertEqual([(OP.POPL, 1.0), (OP.PUSHL, 2.0)], ops)
+        self.assertEqual(2, p.hits['load-store'])
+
+    def test_store_load_store(self):
+        ops, p = optimize([I(OP.PUSH, 1), I(OP.PUSHG, 0), I(OP.POPG, 0), I(OP.PUSHG, 0), I(OP.POPG, 0),
+                           I(OP.PRINT)])
+        self.assertEqual([(OP.PUSH, 1.0), (OP.PUSHG, 0.0), (OP.POPG, 0.0), (OP.PRINT, None)], ops)
+        self.assertEqual(1, p.hits['store-load-store'])
+
+    def test_array_access(self):
+        # Element loads and stores are not slot loads and stores
+        ops = [I(OP.PUSHA, 1), I(OP.POPG, 0), I(OP.PUSHG, 0), I(OP.PUSH, 2), I(OP.PUSHA, 0), I(OP.PUSHG, 0),
+               I(OP.POPG, 0), I(OP.PUSHG, 0)]
+        expected = [(OP.PUSHA, 1.0), (OP.POPG, 0.0), (OP.PUSHG, 0.0), (OP.PUSH, 2.0), (OP.PUSHA, 0.0),
+                    (OP.PUSHG, 0.0)]
+        self.assertEqual(expected, optimize(ops)[0])
+
+    def test_jump_targets(self):
+        # A jump target between the operations keeps them
+        label = Label()
+        ops = [I(OP.POPG, 0), label, I(OP.PUSHG, 0), I(OP.JMP, target=label)]
+        self.assertEqual([(OP.POPG, 0.0), (OP.PUSHG, 0.0), (OP.JMP, 9.0)], optimize(ops)[0])
+
+    def test_jump_threading(self):
+        # 0: JMP 18, 9: JZ 18, 18: JMP 27, 27: JMP 36, 36: PRINT
+        l18, l27, l36 = Label(), Label(), Label()
+        ops, p = optimize([I(OP.JMP, target=l18), I(OP.JZ, target=l18), l18, I(OP.JMP, target=l27), l27,
+                           I(OP.JMP, target=l36), l36, I(OP.PRINT)])
+        self.assertEqual([(OP.JMP, 36.0), (OP.JZ, 36.0), (OP.JMP, 36.0), (OP.JMP, 36.0), (OP.PRINT, None)], ops)
+        self.assertEqual(3, p.hits['jump-threading'])
+        # Endless loops stay
+        l0, l9 = Label(), Label()
+        self.assertEqual([(OP.JMP, 0.0)], optimize([l0, I(OP.JMP, target=l0)])[0])
+        self.assertEqual([(OP.JMP, 9.0), (OP.JMP, 0.0)],
+                         optimize([l0, I(OP.JMP, target=l9), l9, I(OP.JMP, target=l0)])[0])
+
+    def test_jz_over_jmp(self):
+        # 0: PUSH 1, 9: JZ 27, 18: JMP 28, 27: PRINT, 28: end
+        l27, l28 = Label(), Label()
+        ops, p = optimize([I(OP.PUSH, 1), I(OP.JZ, target=l27), I(OP.JMP, target=l28), l27, I(OP.PRINT), l28])
+        self.assertEqual([(OP.PUSH, 1.0), (OP.NOT, None), (OP.JZ, 20.0), (OP.PRINT, None)], ops)
+        self.assertEqual(1, p.hits['jz-over-jmp'])
+        # Other jumps to the JMP keep it
+        l18, l27, l28 = Label(), Label(), Label()
+        ops = [I(OP.JMPFUN, target=l18), I(OP.JZ, target=l27), l18, I(OP.JMP, target=l28), l27, I(OP.PRINT), l28]
+        self.assertEqual([(OP.JMPFUN, 18.0), (OP.JZ, 27.0), (OP.JMP, 28.0), (OP.PRINT, None)], optimize(ops)[0])
+
+    def test_neg_literal(self):
+        ops, p = optimize([I(OP.PUSH, 3), I(OP.NEG), I(OP.PUSHG, 0)])
+        self.assertEqual([(OP.PUSH, -3.0), (OP.PUSHG, 0.0)], ops)
+        self.assertEqual(1, p.hits['neg-literal'])
+
+    def test_addresses(self):
+        # Call of a procedure behind the removed operations, the return address and the jumps are moved
+        start, entry, end, ret = Label(), Label(), Label(), Label()
+        ops = [
+            start, I(OP.POPG, 0), I(OP.PUSHG, 0),  # 0, 9: removed
+            I(OP.JMP, target=end),  # 18: procedure guard
+            entry, I(OP.PUSHS, 1, 'p'), I(OP.PRINT), I(OP.JFS), end,  # 27, 37, 38: procedure
+            I(OP.PUSH, target=ret), I(OP.JMPFUN, target=entry), ret,  # 47, 56: call
+            I(OP.JMP, target=start),  # 65: jump to the removed operations
+        ]
+        # The last jump moves to the guard and is threaded to the guard's target
+        expected = [(OP.JMP, 29.0), (OP.PUSHS, 'p'), (OP.PRINT, None), (OP.JFS, 0.0), (OP.PUSH, 47.0),
+                    (OP.JMPFUN, 9.0), (OP.JMP, 29.0)]
+        self.assertEqual(expected, optimize(ops)[0])
+
+    def test_unresolved(self):
+        # Jumps to labels that are never placed keep the placeholder
+        self.assertEqual([(OP.JMP, float(0xFFFFFFFF)), (OP.PUSH, -1.0)],
+                         optimize([I(OP.JMP, 0xFFFFFFFF, target=Label()), I(OP.PUSH, 1), I(OP.NEG)])[0])
+
+    def test_rules(self):
+        ops, p = optimize([I(OP.POPG, 0), I(OP.PUSHG, 0), I(OP.PUSH, 3), I(OP.NEG)], Peephole(rules=[NegLiteral()]))
+        self.assertEqual([(OP.POPG, 0.0), (OP.PUSHG, 0.0), (OP.PUSH, -3.0)], ops)
+        self.assertEqual({'neg-literal': 1}, p.hits)
+
+    def test_level(self):
+        # Jumps to the next operation and operations behind jumps are removed at level 2
+        end, after = Label(), Label()
+        code = [I(OP.JMP, target=end), end, I(OP.PRINT), I(OP.JMP, target=after), I(OP.PUSH, 1), I(OP.PRINT), after,
+                I(OP.PUSH, 2)]
+        self.assertEqual(6, len(optimize(list(code))[0]))
+        ops, p = optimize(code, Peephole(level=2))
+        self.assertEqual([(OP.PRINT, None), (OP.PUSH, 2.0)], ops)
+        self.assertEqual(2, p.hits['jump-to-next'])
+        self.assertEqual(2, p.hits['unreachable'])
+
+    def test_program(self):
+        src = 'let x = 3\nx = x\nif(x = 3) then\nif(x > 1) then\nprint("a")\nendif\nelse\nprint("b")\nendif\n'
+        plain = CodeGenerator(peephole=False)
+        optimized = CodeGenerator()
+        with contextlib.redirect_stdout(io.StringIO()):
+            plain.generate_program(Parser().parse(src))
+            optimized.generate_program(Parser().parse(src))
+        self.assertIsNone(plain.peephole)
+        self.assertEqual(1, optimized.peephole.hits['store-load-store'])
+        self.assertEqual(len(plain.bytes_out) - 9 * 2, len(optimized.bytes_out))
@@ -1,5 +1,7 @@
+import io
 import unittest
-from esc.scanner import Scanner, Token, TokenType, ScanWrongTokenException
+from esc.scanner import Scanner, TableScanner, IncrementalScanner, Token, TokenStream, TokenType, \
+    ScanWrongTokenException
 
 
 class TestScanner(unittest.TestCase):
@@ -59,5 +61,140 @@ class TestScanner(unittest.TestCase):
         self.assertTrue(scanner.next_token().ttype == TokenType.IDENTIFIER)
 
 
+class TestTableScanner(unittest.TestCase):
+
+    @staticmethod
+    def _tokens(scanner, input_str):
+        scanner.scan_str(input_str)
+        tokens = []
+        tok = scanner.next_token()
+        while tok is not None:
+            tokens.append((tok.ttype, tok.value, tok.meta_cn))
+            tok = scanner.next_token()
+        return tokens
+
+    def test_same_stream_as_scanner(self):
+        for input_str in ['1+1', '1 42 .3 0.42 42.69', '0xDEAD 0xAFFE 0x55 0 01\n',
+                          'let if repeat a ifif elseif elseiff',
+                          'let a = [1, 2, "str"] const # comment\nif(a[0] <= 2 and a <> 3) then\nendif\n',
+                          'func f(x)\nreturn x mod 2 >= 1 or !x < -1\nendfunc\nf(4)\n']:
+            self.assertEqual(self._tokens(Scanner(), input_str), self._tokens(TableScanner(), input_str))
+
+    def test_errors(self):
+        scanner = TableScanner()
+        scanner.scan_str('.3.4')
+        self.assertRaises(ScanWrongTokenException, lambda: scanner.next_token())
+        scanner.scan_str('"Hello"fail"')
+        self.assertTrue(scanner.next_token().value == 'Hello')
+        self.assertTrue(scanner.next_token().ttype == TokenType.IDENTIFIER)
+        self.assertRaises(ScanWrongTokenException, lambda: scanner.next_token())
+        scanner.scan_str('a ; b')
+        self.assertTrue(scanner.next_token().ttype == TokenType.IDENTIFIER)
+        self.assertRaises(ScanWrongTokenException, lambda: scanner.next_token())
+
+    def test_stream_input(self):
+        input_str = 'let s = "caf\u00e9 # no comment"\n# comment\nif(s <> 0x1F) then\nprint(s) # 42.5\nendif\n'
+        expected = self._tokens(TableScanner(), input_str)
+        for chunk_size in [1, 2, 3, 5, 64]:
+            for source in [io.StringIO(input_str), io.BytesIO(input_str.encode()), memoryview(input_str.encode())]:
+                scanner = TableScanner()
+                scanner.scan_stream(source, chunk_size=chunk_size)
+                tokens = [(tok.ttype, tok.value, tok.meta_cn) for tok in scanner.tokens()]
+                self.assertEqual(tokens, expected)
+
+    def test_stream_errors(self):
+        scanner = TableScanner()
+        scanner.scan_stream(io.StringIO('let a = 1\nlet b = ;'), chunk_size=4)
+        for _ in range(7):
+            scanner.next_token()
+        self.assertRaisesRegex(ScanWrongTokenException, 'Wrong character ; at 18', lambda: scanner.next_token())
+
+    def test_peek(self):
+        scanner = TableScanner()
+        scanner.scan_str('foo bar(1)')
+        self.assertTrue(scanner.next_token().value == 'foo')
+        self.assertTrue(scanner.next_token(peek=True).value == 'bar')
+        self.assertTrue(scanner.next_token().value == 'bar')
+        self.assertTrue(scanner.next_token(peek=True).ttype == TokenType.LPARENT)
+        self.assertTrue(scanner.next_token().ttype == TokenType.LPARENT)
+
+
+class TestTokenStream(unittest.TestCase):
+
+    def test_peek_advance(self):
+        for scanner in [Scanner(), TableScanner()]:
+            scanner.scan_str('a = b(1)\n')
+            stream = TokenStream(scanner)
+            self.assertTrue(stream.peek().value == 'a')
+            self.assertTrue(stream.peek(2).value == 'b')
+            self.assertTrue(stream.peek(3).ttype == TokenType.LPARENT)
+            self.assertTrue(stream.advance().value == 'a')
+            self.assertTrue(stream.advance().ttype == TokenType.EQUALS)
+            self.assertTrue(stream.peek(3).ttype == TokenType.RPARENT)
+            self.assertIsNone(stream.peek(4))
+            self.assertTrue(stream.advance().value == 'b')
+            self.assertTrue(stream.advance().ttype == TokenType.LPARENT)
+            self.assertTrue(stream.advance().value == 1)
+            self.assertTrue(stream.advance().ttype == TokenType.RPARENT)
+            self.assertIsNone(stream.advance())
+            self.assertIsNone(stream.peek())
+
+    def test_scan_once(self):
+        scanner = TableScanner()
+        scanner.scan_str('a b c')
+        stream = TokenStream(scanner)
+        first = stream.peek(2)
+        stream.advance()
+        self.assertIs(stream.peek(1), first)
+
+
+class TestIncrementalScanner(unittest.TestCase):
+
+    @staticmethod
+    def _tokens(scanner):
+        return [(tok.ttype, tok.value, tok.meta_cn) for tok in scanner.tokens()]
+
+    def _assert_same(self, inc: IncrementalScanner):
+        scanner = TableScanner()
+        scanner.scan_str(inc.text)
+        self.assertEqual(self._tokens(inc), self._tokens(scanner))
+
+    def test_edits(self):
+        inc = IncrementalScanner()
+        inc.scan_str('let a = 1\nlet b = a + 2\nprint("" + b)\n')
+        inc.edit(8, 1, '42')
+        self.assertEqual(inc.text, 'let a = 42\nlet b = a + 2\nprint("" + b)\n')
+        self._assert_same(inc)
+        inc.edit(11, 0, 'let c = [1, 2]\n')
+        self._assert_same(inc)
+        inc.edit(0, 11, '')
+        self._assert_same(inc)
+        inc.edit(len(inc), 0, 'c[0] = b')
+        self._assert_same(inc)
+
+    def test_multiline_string(self):
+        inc = IncrementalScanner()
+        inc.scan_str('let a = 1\nlet b = 2\nlet c = a # "\n')
+        # Open a string spanning the next lines
+        inc.edit(8, 0, '"')
+        self._assert_same(inc)
+        self.assertTrue(self._tokens(inc)[3][1] == '1\nlet b = 2\nlet c = a # ')
+        # And close it again
+        inc.edit(8, 1, '')
+        self._assert_same(inc)
+        self.assertTrue(len(self._tokens(inc)) == 12)
+
+    def test_errors(self):
+        inc = IncrementalScanner()
+        inc.scan_str('let a = 1\nlet b = 2\n')
+        inc.edit(18, 0, ';')
+        tokens = inc.tokens()
+        for _ in range(7):
+            next(tokens)
+        self.assertRaisesRegex(ScanWrongTokenException, 'Wrong character ; at 18', lambda: next(tokens))
+        inc.edit(18, 1, '')
+        self._assert_same(inc)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+from esc.codegen import CodeGenerator, OP
+from esc.ir import Instruction as I, Label
+from esc.slots import SlotAllocator, frame_sizes
+
+from .helpers import compile_program
+
+
+def local_ops(c: CodeGenerator) -> [(OP, float)]:
+    return [(op, arg) for _, op, arg in c.instructions() if op in (OP.POPL, OP.PUSHL, OP.INCL)]
+
+
+class TestSlotAllocation(unittest.TestCase):
+
+    def test_shared(self):
+        src = '''
+            sub f(n)
+                let a = n * 2
+                print("" + a)
+                let b = n * 3
+                print("" + b)
+            endsub
+            f(1)
+            '''
+        self.assertEqual({None: 0, 'f': 3}, compile_program(src, slot_reuse=False).frames)
+        c = compile_program(src)
+        # n and a are dead when b is stored
+        self.assertEqual({None: 0, 'f': 2}, c.frames)
+        self.assertEqual({None: (0, 0), 'f': (3, 2)}, c.slots.frames)
+        self.assertEqual([(OP.PUSHL, 0.0), (OP.POPL, 0.0), (OP.PUSHL, 1.0), (OP.POPL, 1.0), (OP.POPL, 0.0),
+                          (OP.PUSHL, 0.0), (OP.POPL, 0.0)], local_ops(c))
+
+    def test_loop(self):
+        # Locals used in the next iteration stay live over the whole loop
+        src = '''
+            sub g()
+                let i = 0
+                let s = 0
+                repeat
+                    let t = i * 2
+                    s = s + t
+                    i = i + 1
+                until(i = 3)
+                print("" + s)
+            endsub
+            g()
+            '''
+        self.assertEqual(local_ops(compile_program(src, slot_reuse=False)), local_ops(compile_program(src)))
+
+    def test_copy(self):
+        # The copy of a dead local shares its slot, the peephole optimizer removes the copy
+        src = '''
+            func h(n)
+                let a = n + 1
+                let b = a
+                return b
+            endfunc
+            print("" + h(1))
+            '''
+        c = compile_program(src)
+        self.assertEqual({None: 0, 'h': 1}, c.frames)
+        self.assertEqual([(OP.PUSHL, 0.0), (OP.POPL, 0.0), (OP.PUSHL, 0.0), (OP.POPL, 0.0)], local_ops(c))
+
+    def test_array_element(self):
+        # Element stores keep the array alive
+        src = '''
+            let x = 1
+            if(x = 1) then
+                let y = [1, 2]
+                let z = 5
+                y[0] = z
+                print("" + y[0])
+            endif
+            '''
+        c = compile_program(src)
+        self.assertEqual({None: 2}, c.frames)
+        self.assertEqual(local_ops(compile_program(src, slot_reuse=False)), local_ops(c))
+
+    def test_frames(self):
+        # Frames of nested procedures are separate, slots are not shared with the enclosing procedure
+        src = '''
+            sub outer(a, b)
+                sub inner(c)
+                    print("" + c)
+                endsub
+                inner(a + b)
+            endsub
+            outer(1, 2)
+            '''
+        self.assertEqual({None: 0, 'outer': 2, 'inner': 1}, compile_program(src).frames)
+        self.assertEqual({None: 0, 'outer': 2, 'inner': 1}, compile_program(src, opt_level=0).frames)
+        self.assertIsNone(compile_program(src, opt_level=0).slots)
+
+    def test_pass(self):
+        head, end = Label(), Label()
+        code = [head, I(OP.PUSH, 1), I(OP.PUSHL, 0), I(OP.POPL, 0), I(OP.PRINT), I(OP.PUSH, 2), I(OP.PUSHL, 1),
+                I(OP.POPL, 1), I(OP.PRINT), I(OP.JFS), end]
+        slots = SlotAllocator({'p': (head, end)})
+        new = slots.run(code)
+        self.assertEqual([0, 0, 0, 0], [ins.arg1 for ins in new if ins.op in (OP.PUSHL, OP.POPL)])
+        self.assertEqual({None: (0, 0), 'p': (2, 1)}, slots.frames)
+        # The given code is kept
+        self.assertEqual({None: 0, 'p': 2}, frame_sizes(code, {'p': (head, end)}))
+        # Procedures that are not part of the code leave it unchanged
+        self.assertIs(code, SlotAllocator({'q': (Label(), Label())}).run(code))
@@ -0,0 +1,101 @@
+import unittest
+
+from esc.symbols import SymbolTable, VariableSymbol, ProcedureSymbol
+
+from .helpers import compile_statements
+
+
+class TestSymbolTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = SymbolTable()
+
+    def declare(self, name: str) -> int:
+        return self.table.declare(VariableSymbol(name=name, value=0))
+
+    def test_globals(self):
+        self.assertEqual(0, self.declare('a'))
+        self.assertEqual(1, self.declare('b'))
+        symbol, slot, scope = self.table.resolve('b')
+        self.assertEqual(('b', 1), (symbol.name, slot))
+        self.assertIs(self.table.globals, scope)
+        self.assertIsNone(self.table.resolve('c'))
+
+    def test_nested_slots(self):
+        self.declare('g')
+        self.table.open_scope()
+        self.assertEqual(0, self.declare('a'))
+        self.table.open_scope()
+        # Nested blocks continue the slots of the enclosing block
+        self.assertEqual(1, self.declare('b'))
+        self.assertEqual(0, self.table.resolve('a')[1])
+        self.assertIs(self.table.globals, self.table.resolve('g')[2])
+        self.table.close_scope()
+        self.assertIsNone(self.table.resolve('b'))
+        self.table.open_scope()
+        # Sibling blocks reuse the slots
+        self.assertEqual(1, self.declare('c'))
+        self.table.close_scope()
+        self.table.close_scope()
+        self.assertIsNone(self.table.resolve('a'))
+        self.assertIs(self.table.globals, self.table.current)
+
+    def test_shadowing(self):
+        self.declare('a')
+        self.table.open_scope()
+        self.declare('a')
+        self.table.open_scope()
+        self.assertEqual(1, self.declare('a'))
+        self.assertEqual(1, self.table.resolve('a')[1])
+        self.table.close_scope()
+        self.assertEqual(0, self.table.resolve('a')[1])
+        self.assertIsNot(self.table.globals, self.table.resolve('a')[2])
+        self.table.close_scope()
+        self.assertIs(self.table.globals, self.table.resolve('a')[2])
+
+    def test_redeclare(self):
+        self.declare('a')
+        first = self.table.resolve('a')[0]
+        self.assertEqual(0, self.declare('a'))
+        self.assertIsNot(first, self.table.resolve('a')[0])
+        self.assertEqual(1, self.declare('b'))
+
+    def test_frames(self):
+        self.declare('g')
+        self.table.open_scope()
+        self.declare('a')
+        prev = self.table.open_frame()
+        # A procedure body sees globals but not the locals of the enclosing block
+        self.assertIsNone(self.table.resolve('a'))
+        self.assertEqual(0, self.declare('x'))
+        self.assertIsNotNone(self.table.resolve('g'))
+        self.table.declare(ProcedureSymbol(name='a', args=0, addr=0), scope=self.table.globals)
+        self.table.close_frame(prev)
+        self.assertIsNone(self.table.resolve('x'))
+        self.assertIsNot(self.table.globals, self.table.resolve('a')[2])
+        self.assertIs(self.table.globals, self.table.resolve('a', global_only=True)[2])
+
+    def test_interned(self):
+        name = ''.join(['na', 'me'])
+        self.table.declare(VariableSymbol(name=name, value=0))
+        self.assertIs(self.table.resolve('name')[0].name, 'name')
+
+    def test_external(self):
+        self.table.external.add('ext')
+        self.assertTrue(self.table.exists('ext'))
+        self.assertIsNone(self.table.resolve('ext'))
+
+
+class TestScopes(unittest.TestCase):
+
+    def test_block_locals(self):
+        c = compile_statements('let a = 1\nif(a = 1) then\nlet x = 1\nendif\nif(a = 1) then\nlet y = 2\nendif\n')
+        self.assertEqual(1, c.symbols.globals.next_slot)
+        with self.assertRaises(Exception):
+            compile_statements('let a = 1\nif(a = 1) then\nlet x = 1\nendif\nprint("" + x)\n')
+
+    def test_deep_nesting(self):
+        depth = 200
+        src = 'let g = 0\n' + 'if(g = 0) then\nlet l = g\n' * depth + 'g = l\n' + 'endif\n' * depth
+        c = compile_statements(src)
+        self.assertIs(c.symbols.globals, c.symbols.current)